@@ -1,44 +1,64 @@
 from config import load_config_and_styles
 from database.database import init_db
-from ui_components import render_sidebar, render_navigation, render_login_page
-from pages import render_style_sample_page, render_lesson_page
+from database.outbox import start_outbox_worker
+from export import sweep_export_files
+from metrics import start_metrics_server
+from ui_components import render_sidebar, render_navigation, render_login_page, render_profiling_panel
+from pages import render_style_sample_page, render_lesson_page, render_course_page
 import streamlit as st
 import os
-from utils.auth import get_user_from_token
-
-load_config_and_styles()
-
-init_db()
-
-if "user_id" not in st.session_state:
-    st.session_state.user_id = None
-if "lessons" not in st.session_state:
-    st.session_state.lessons = {}
-if "templates" not in st.session_state:
-    st.session_state.templates = {}
-if "generated_sample" not in st.session_state:
-    st.session_state.generated_sample = ">"
-if "generated_lesson" not in st.session_state:
-    st.session_state.generated_lesson = ""
-if "current_lesson" not in st.session_state:
-    st.session_state.current_lesson = None
-if "nav_option" not in st.session_state:
-    st.session_state.nav_option = "Generate Style Sample"
-
-if "user_id" not in st.session_state or st.session_state.user_id is None:
-    user = get_user_from_token()
-    if user:
-        st.session_state.user_id = user.id
-
-if st.session_state.user_id is None:
-    render_login_page()
-    st.stop()  # Stop further execution until user logs in.
-
-# If logged in, render the main app interface.
-render_sidebar()
-render_navigation()
-
-if st.session_state.nav_option == "Generate Style Sample":
-    render_style_sample_page()
-elif st.session_state.nav_option == "Generate Lesson":
-    render_lesson_page()
\ No newline at end of file
+from utils.auth import get_user_id_from_token
+from profiling import rerun, section
+
+
+def main():
+    with section("load_config_and_styles"):
+        load_config_and_styles()
+
+    with section("init_db"):
+        init_db()
+    start_outbox_worker()
+    start_metrics_server()
+    sweep_export_files()
+
+    if "user_id" not in st.session_state:
+        st.session_state.user_id = None
+    if "lessons" not in st.session_state:
+        st.session_state.lessons = {}
+    if "templates" not in st.session_state:
+        st.session_state.templates = {}
+    if "generated_sample" not in st.session_state:
+        st.session_state.generated_sample = ">"
+    if "generated_lesson" not in st.session_state:
+        st.session_state.generated_lesson = ""
+    if "current_lesson" not in st.session_state:
+        st.session_state.current_lesson = None
+    if "nav_option" not in st.session_state:
+        st.session_state.nav_option = "Generate Style Sample"
+
+    if "user_id" not in st.session_state or st.session_state.user_id is None:
+        st.session_state.user_id = get_user_id_from_token()
+
+    if st.session_state.user_id is None:
+        with section("render_login_page"):
+            render_login_page()
+        st.stop()  # Stop further execution until user logs in.
+
+    # If logged in, render the main app interface.
+    with section("render_sidebar"):
+        render_sidebar()
+    render_profiling_panel()
+    with section("render_navigation"):
+        render_navigation()
+
+    with section(f"page:{st.session_state.nav_option}"):
+        if st.session_state.nav_option == "Generate Style Sample":
+            render_style_sample_page()
+        elif st.session_state.nav_option == "Generate Lesson":
+            render_lesson_page()
+        elif st.session_state.nav_option == "Generate Course":
+            render_course_page()
+
+
+with rerun():
+    main()
@@ -0,0 +1,202 @@
+import os
+import time
+import random
+import logging
+import threading
+from collections import Counter
+from dataclasses import dataclass, field
+from concurrent.futures import ThreadPoolExecutor, as_completed
+from dotenv import load_dotenv
+
+from database.database import session_scope
+from database.courses_crud import create_course, get_course
+from database.modules_crud import create_module, list_modules_by_course
+from database.templates_crud import get_template
+from database.lessons_crud import create_lesson_with_s3, list_lesson_prompts_by_module
+from database.s3.s3 import s3_client
+from logic import generate_lesson_html
+
+# ---------------------------
+# Logging setup
+# ---------------------------
+load_dotenv()
+logging.basicConfig(
+    level=logging.INFO,
+    format="%(asctime)s [%(levelname)s] %(message)s"
+)
+logger = logging.getLogger(__name__)
+
+BATCH_WORKERS = int(os.getenv("BATCH_WORKERS", "4"))
+BATCH_RETRIES = int(os.getenv("BATCH_RETRIES", "2"))
+
+# Общий на процесс лимит одновременных генераций пакетных задач: несколько курсов,
+# запущенных в разных фоновых задачах, вместе не превышают BATCH_WORKERS запросов к API
+_generation_slots = threading.BoundedSemaphore(BATCH_WORKERS)
+
+# ---------------------------
+# Course outline
+# ---------------------------
+
+@dataclass
+class ModuleOutline:
+    title: str
+    lessons: list[str] = field(default_factory=list)
+
+
+@dataclass
+class CourseOutline:
+    title: str
+    modules: list[ModuleOutline] = field(default_factory=list)
+    description: str = None
+
+
+def parse_outline(title: str, text: str, description: str = None) -> CourseOutline:
+    """
+    Разбирает план курса:
+        # Название модуля
+        - запрос для урока
+        - запрос для урока
+    Уроки до первого заголовка попадают в модуль с названием курса.
+    """
+    outline = CourseOutline(title=title, description=description)
+    for raw in text.splitlines():
+        line = raw.strip()
+        if not line:
+            continue
+        if line.startswith("#"):
+            outline.modules.append(ModuleOutline(title=line.lstrip("#").strip()))
+            continue
+        prompt = line.lstrip("-*").strip()
+        if not prompt:
+            continue
+        if not outline.modules:
+            outline.modules.append(ModuleOutline(title=title))
+        outline.modules[-1].lessons.append(prompt)
+    return outline
+
+# ---------------------------
+# Batch pipeline
+# ---------------------------
+
+def _prepare_course(outline: CourseOutline, author_id: int, course_id: int = None) -> tuple[int, list[tuple[int, str]], int]:
+    """
+    Создаёт (или переиспользует) курс и модули. Возвращает id курса,
+    список (module_id, prompt) ещё не сгенерированных уроков и число пропущенных.
+    """
+    with session_scope() as db:
+        if course_id is None:
+            course = create_course(db, outline.title, outline.description, author_id=author_id)
+        else:
+            course = get_course(db, course_id)
+            if course is None or course.author_id != author_id:
+                raise ValueError(f"Course id={course_id} not found")
+        course_id = course.id
+
+        # Модуль определяется позицией в плане и названием: одноимённые модули не сливаются
+        existing = {(m.order, m.title): m for m in list_modules_by_course(db, course_id)}
+        pending, skipped = [], 0
+        for order, module_outline in enumerate(outline.modules, start=1):
+            module = existing.get((order, module_outline.title))
+            if module is None:
+                module = create_module(db, course_id, module_outline.title, order=order)
+                done = Counter()
+            else:
+                done = Counter(list_lesson_prompts_by_module(db, module.id))
+            for prompt in module_outline.lessons:
+                # Повторяющийся запрос пропускается столько раз, сколько уроков по нему уже есть
+                if done[prompt] > 0:
+                    done[prompt] -= 1
+                    skipped += 1
+                else:
+                    pending.append((module.id, prompt))
+    return course_id, pending, skipped
+
+
+def _generate_and_store(
+    module_id: int,
+    prompt: str,
+    template_html: str,
+    template_id: int,
+    author_id: int,
+    retries: int
+) -> int:
+    for attempt in range(retries + 1):
+        try:
+            with _generation_slots:
+                html = generate_lesson_html(template_html, prompt)
+                with session_scope() as db:
+                    lesson = create_lesson_with_s3(
+                        db=db,
+                        title=prompt[:20] or "Новый урок",
+                        author_id=author_id,
+                        html_content=html,
+                        creation_prompt=prompt,
+                        template_id=template_id,
+                        module_id=module_id
+                    )
+                    return lesson.id
+        except Exception as e:
+            if attempt == retries:
+                raise
+            delay = random.uniform(0, min(30, 2 ** attempt))
+            logger.warning(f"Lesson '{prompt[:40]}' failed ({e}), retry {attempt + 1}/{retries} in {delay:.1f}s")
+            time.sleep(delay)
+
+
+def run_course_batch(
+    outline: CourseOutline,
+    author_id: int,
+    template_id: int,
+    course_id: int = None,
+    max_workers: int = BATCH_WORKERS,
+    retries: int = BATCH_RETRIES,
+    progress=None
+) -> dict:
+    """
+    Генерирует, сохраняет и привязывает к модулям все уроки курса.
+
+    Уроки генерируются параллельно (не более max_workers одновременно для курса
+    и не более BATCH_WORKERS во всех пакетных задачах процесса), каждый
+    с повторами при ошибке. Повторный запуск с тем же course_id продолжает
+    с места сбоя: уже сохранённые уроки модулей пропускаются.
+    progress(dict) вызывается после каждого урока.
+    """
+    with session_scope() as db:
+        template = get_template(db, template_id)
+        if template is None or template.author_id != author_id:
+            raise ValueError(f"Template id={template_id} not found")
+        template_key = template.s3_key
+    template_html = s3_client.get_object(template_key).decode("utf-8")
+
+    course_id, pending, skipped = _prepare_course(outline, author_id, course_id)
+    state = {
+        "course_id": course_id,
+        "total": len(pending) + skipped,
+        "done": skipped,
+        "skipped": skipped,
+        "failed": [],
+    }
+    if progress:
+        progress(dict(state))
+
+    with ThreadPoolExecutor(max_workers=max_workers, thread_name_prefix="batch") as pool:
+        futures = {
+            pool.submit(_generate_and_store, module_id, prompt, template_html, template_id, author_id, retries): prompt
+            for module_id, prompt in pending
+        }
+        for future in as_completed(futures):
+            prompt = futures[future]
+            try:
+                future.result()
+                state["done"] += 1
+            except Exception as e:
+                logger.error(f"Lesson '{prompt[:40]}' failed permanently: {e}")
+                state["failed"].append({"prompt": prompt, "error": str(e)})
+            if progress:
+                progress(dict(state, failed=list(state["failed"])))
+
+    logger.info(
+        f"Course id={course_id} batch finished: {state['done']}/{state['total']} lessons, "
+        f"{len(state['failed'])} failed"
+    )
+    return state
@@ -0,0 +1,105 @@
+import json
+import time
+import random
+import hashlib
+import threading
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+
+def fake_html(seed: str, size: int) -> str:
+    """Deterministic HTML of about size bytes; different seeds give different content."""
+    rnd = random.Random(hashlib.sha256(seed.encode("utf-8")).hexdigest())
+    words = ["урок", "тема", "пример", "задача", "вывод", "python", "данные", "функция", "модуль", "цикл"]
+    parts = [f"<html><head><style>body{{color:#333;font-family:'Inter',sans-serif}}</style></head>"
+             f"<body><h1>{seed[:60]}</h1>\n"]
+    total = sum(len(p) for p in parts)
+    while total < size:
+        line = "<p>" + " ".join(rnd.choice(words) for _ in range(12)) + "</p>\n"
+        parts.append(line)
+        total += len(line.encode("utf-8"))
+    parts.append("</body></html>\n")
+    return "".join(parts)
+
+
+class FakeGenerationServer:
+    """
+    Stand-in for the generation API: /generate_style/, /generate_content/ and
+    /generate_content_stream/ (SSE) answer after latency ± jitter seconds with
+    HTML of about size bytes.
+    """
+
+    def __init__(self, latency: float = 0.5, jitter: float = 0.1, size: int = 20000, port: int = 0):
+        self.latency = latency
+        self.jitter = jitter
+        self.size = size
+        self._server = ThreadingHTTPServer(("127.0.0.1", port), self._handler())
+        self._server.daemon_threads = True
+        self._thread = None
+
+    @property
+    def url(self) -> str:
+        host, port = self._server.server_address[:2]
+        return f"http://{host}:{port}"
+
+    def _delay(self) -> float:
+        return max(0.0, self.latency + random.uniform(-self.jitter, self.jitter))
+
+    def _handler(self):
+        server = self
+
+        class Handler(BaseHTTPRequestHandler):
+            protocol_version = "HTTP/1.1"
+
+            def _json(self, payload: dict) -> None:
+                body = json.dumps(payload, ensure_ascii=False).encode("utf-8")
+                self.send_response(200)
+                self.send_header("Content-Type", "application/json")
+                self.send_header("Content-Length", str(len(body)))
+                self.end_headers()
+                self.wfile.write(body)
+
+            def do_POST(self):
+                length = int(self.headers.get("Content-Length") or 0)
+                request = json.loads(self.rfile.read(length) or b"{}")
+                seed = request.get("content") or request.get("style") or ""
+
+                if self.path == "/generate_style/":
+                    time.sleep(server._delay())
+                    self._json({"html_code": fake_html(seed, server.size // 2)})
+                elif self.path == "/generate_content/":
+                    time.sleep(server._delay())
+                    self._json({"lesson": fake_html(seed, server.size)})
+                elif self.path == "/generate_content_stream/":
+                    self._stream(fake_html(seed, server.size), server._delay())
+                else:
+                    self.send_error(404)
+
+            def _stream(self, html: str, delay: float, chunks: int = 10) -> None:
+                self.send_response(200)
+                self.send_header("Content-Type", "text/event-stream")
+                self.send_header("Transfer-Encoding", "chunked")
+                self.end_headers()
+                step = max(1, len(html) // chunks)
+                for start in range(0, len(html), step):
+                    time.sleep(delay / chunks)
+                    event = f"data: {json.dumps({'delta': html[start:start + step]}, ensure_ascii=False)}\n\n"
+                    self._chunk(event.encode("utf-8"))
+                self._chunk(b"data: [DONE]\n\n")
+                self._chunk(b"")
+
+            def _chunk(self, data: bytes) -> None:
+                self.wfile.write(f"{len(data):x}\r\n".encode("ascii") + data + b"\r\n")
+
+            def log_message(self, format, *args):
+                pass
+
+        return Handler
+
+    def start(self) -> "FakeGenerationServer":
+        self._thread = threading.Thread(target=self._server.serve_forever, name="fake-api", daemon=True)
+        self._thread.start()
+        return self
+
+    def stop(self) -> None:
+        self._server.shutdown()
+        self._server.server_close()
@@ -0,0 +1,296 @@
+"""
+Нагрузочный бенчмарк без внешних сервисов.
+
+Поднимает фейковый API генерации (задержка и размер ответа настраиваются),
+хранилище объектов (--storage memory/local, либо s3 на moto или
+--s3-endpoint, например MinIO) и SQLite
+(или --database), после чего N имитируемых пользователей параллельно
+проходят сценарий: создание шаблона, генерация урока, сохранение,
+загрузка списка в сайдбаре, поиск, открытие и удаление урока.
+Для каждого шага выводятся p50/p95/p99 и пропускная способность.
+
+Для --storage s3 на moto: pip install -r bench/requirements.txt
+
+Запуск из каталога app:
+    python -m bench.run --users 8 --iterations 20 --latency 0.3 --size 20000
+    python -m bench.run --database postgresql://... --storage s3 --s3-endpoint http://localhost:9000 --json result.json
+"""
+import os
+import sys
+import json
+import math
+import time
+import uuid
+import socket
+import logging
+import argparse
+import tempfile
+import threading
+from contextlib import contextmanager
+from concurrent.futures import ThreadPoolExecutor
+
+# ---------------------------
+# Adjust imports for local vs Docker
+# ---------------------------
+root = os.path.abspath(os.path.join(os.path.dirname(__file__), '..'))
+if root not in sys.path:
+    sys.path.insert(0, root)
+
+from bench.fake_api import FakeGenerationServer
+
+logger = logging.getLogger(__name__)
+
+SCENARIOS = [
+    "create_template", "generate_lesson", "save_lesson", "sidebar_load",
+    "search", "open_lesson", "delete_lesson", "outbox_drain",
+]
+
+# ---------------------------
+# Results
+# ---------------------------
+
+def percentile(sorted_values: list[float], p: float) -> float:
+    """Nearest-rank percentile of an already sorted list."""
+    if not sorted_values:
+        return 0.0
+    rank = max(0, min(len(sorted_values) - 1, math.ceil(p / 100 * len(sorted_values)) - 1))
+    return sorted_values[rank]
+
+
+class Recorder:
+    def __init__(self):
+        self.durations: dict[str, list[float]] = {name: [] for name in SCENARIOS}
+        self.errors: dict[str, int] = {name: 0 for name in SCENARIOS}
+        self._lock = threading.Lock()
+
+    @contextmanager
+    def measure(self, scenario: str):
+        start = time.perf_counter()
+        try:
+            yield
+        except Exception as e:
+            with self._lock:
+                self.errors[scenario] += 1
+            logger.warning(f"{scenario} failed: {e}")
+            raise
+        else:
+            elapsed = time.perf_counter() - start
+            with self._lock:
+                self.durations[scenario].append(elapsed)
+
+    def report(self, wall_seconds: float) -> list[dict]:
+        rows = []
+        for name in SCENARIOS:
+            values = sorted(self.durations[name])
+            if not values and not self.errors[name]:
+                continue
+            rows.append({
+                "scenario": name,
+                "count": len(values),
+                "errors": self.errors[name],
+                "p50_ms": round(percentile(values, 50) * 1000, 1),
+                "p95_ms": round(percentile(values, 95) * 1000, 1),
+                "p99_ms": round(percentile(values, 99) * 1000, 1),
+                "ops_per_s": round(len(values) / wall_seconds, 2) if wall_seconds else 0.0,
+            })
+        return rows
+
+
+def print_report(rows: list[dict], wall_seconds: float) -> None:
+    header = f"{'scenario':<16}{'count':>8}{'errors':>8}{'p50 ms':>10}{'p95 ms':>10}{'p99 ms':>10}{'ops/s':>9}"
+    print(header)
+    print("-" * len(header))
+    for row in rows:
+        print(
+            f"{row['scenario']:<16}{row['count']:>8}{row['errors']:>8}"
+            f"{row['p50_ms']:>10}{row['p95_ms']:>10}{row['p99_ms']:>10}{row['ops_per_s']:>9}"
+        )
+    print(f"\nwall time {wall_seconds:.1f}s")
+
+# ---------------------------
+# Local stand-ins
+# ---------------------------
+
+def _free_port() -> int:
+    with socket.socket() as sock:
+        sock.bind(("127.0.0.1", 0))
+        return sock.getsockname()[1]
+
+
+def _start_moto():
+    try:
+        from moto.server import ThreadedMotoServer
+    except ImportError:
+        raise SystemExit("moto is not installed: pip install 'moto[server]' or pass --s3-endpoint")
+    port = _free_port()
+    server = ThreadedMotoServer(ip_address="127.0.0.1", port=port, verbose=False)
+    server.start()
+    return server, f"http://127.0.0.1:{port}"
+
+
+def _configure_env(args, generation_url: str, s3_endpoint: str, workdir: str) -> None:
+    # Модули приложения читают настройки при импорте, поэтому окружение задаётся до него
+    os.environ.update({
+        "STORAGE_BACKEND": args.storage,
+        "STORAGE_LOCAL_DIR": os.path.join(workdir, "objects"),
+        "DATABASE_URL": args.database,
+        "GENERATION_API_URL": generation_url,
+        "GENERATION_STREAMING": "1" if args.streaming else "0",
+        "GENERATION_CACHE_ENABLED": "1" if args.cache else "0",
+        "S3_ENDPOINT_URL": s3_endpoint or "",
+        "S3_BUCKET": args.s3_bucket,
+        "AWS_ACCESS_KEY_ID": os.environ.get("AWS_ACCESS_KEY_ID") or "bench",
+        "AWS_SECRET_ACCESS_KEY": os.environ.get("AWS_SECRET_ACCESS_KEY") or "bench",
+        "S3_REGION": os.environ.get("S3_REGION") or "us-east-1",
+        "METRICS_PORT": "0",
+        "OUTBOX_INTERVAL": "0",
+        "DB_AUTO_MIGRATE": "1",
+    })
+
+# ---------------------------
+# Simulated user
+# ---------------------------
+
+def _simulate_user(index: int, run_id: str, args, recorder: Recorder) -> None:
+    from database.database import session_scope
+    from database.users_crud import create_user
+    from database.templates_crud import create_template_with_s3
+    from database.lessons_crud import create_lesson_with_s3, get_lesson, list_lesson_summaries, \
+        search_lessons, delete_lesson_with_s3
+    from database.s3.s3 import s3_client
+    from logic import generate_style_html, generate_lesson_html, generate_lesson_stream_html
+
+    with session_scope() as db:
+        user_id = create_user(db, f"bench-{run_id}-{index}", f"bench-{run_id}-{index}", "bench").id
+
+    with recorder.measure("create_template"):
+        template_html = generate_style_html(f"bench style {run_id} {index}", regenerate=not args.cache)
+        with session_scope() as db:
+            template_id = create_template_with_s3(db, f"Bench {index}", user_id, template_html).id
+
+    previous_id = None
+    for i in range(args.iterations):
+        prompt = f"bench lesson {run_id} user {index} #{i}"
+        try:
+            with recorder.measure("generate_lesson"):
+                if args.streaming:
+                    html = generate_lesson_stream_html(template_html, prompt, regenerate=not args.cache)
+                else:
+                    html = generate_lesson_html(template_html, prompt, regenerate=not args.cache)
+
+            with recorder.measure("save_lesson"):
+                with session_scope() as db:
+                    lesson_id = create_lesson_with_s3(
+                        db=db,
+                        title=prompt[:20],
+                        author_id=user_id,
+                        html_content=html,
+                        creation_prompt=prompt,
+                        template_id=template_id
+                    ).id
+
+            with recorder.measure("sidebar_load"):
+                with session_scope() as db:
+                    list_lesson_summaries(db, user_id, limit=20)
+
+            with recorder.measure("search"):
+                with session_scope() as db:
+                    search_lessons(db, user_id, "python", limit=20)
+
+            with recorder.measure("open_lesson"):
+                with session_scope() as db:
+                    key = get_lesson(db, lesson_id).s3_key
+                s3_client.get_object(key)
+
+            # Каждый второй урок удаляется, чтобы список рос, но не бесконечно
+            if previous_id is not None:
+                with recorder.measure("delete_lesson"):
+                    with session_scope() as db:
+                        delete_lesson_with_s3(db, previous_id)
+                previous_id = None
+            else:
+                previous_id = lesson_id
+        except Exception:
+            continue
+
+# ---------------------------
+# Entry point
+# ---------------------------
+
+def main():
+    parser = argparse.ArgumentParser(description="Load test with local stand-ins for S3, DB and the generation API")
+    parser.add_argument("--users", type=int, default=8, help="Concurrent simulated users")
+    parser.add_argument("--iterations", type=int, default=10, help="Lessons generated per user")
+    parser.add_argument("--latency", type=float, default=0.3, help="Fake generation latency, seconds")
+    parser.add_argument("--jitter", type=float, default=0.1, help="Latency jitter, seconds")
+    parser.add_argument("--size", type=int, default=20000, help="Generated lesson size, bytes")
+    parser.add_argument("--streaming", action="store_true", help="Use the streaming generation endpoint")
+    parser.add_argument("--cache", action="store_true", help="Keep the generation result cache enabled")
+    parser.add_argument("--database", default=None, help="SQLAlchemy URL (default: temporary SQLite file)")
+    parser.add_argument("--storage", choices=["memory", "local", "s3"], default="memory",
+                        help="Object storage backend")
+    parser.add_argument("--s3-endpoint", default=None, help="Existing S3 endpoint for --storage s3 (default: in-process moto)")
+    parser.add_argument("--s3-bucket", default="kursor-bench")
+    parser.add_argument("--generation-url", default=None, help="Real generation API instead of the fake one")
+    parser.add_argument("--json", dest="json_path", default=None, help="Also write results to this file")
+    parser.add_argument("--verbose", action="store_true")
+    args = parser.parse_args()
+
+    workdir = tempfile.mkdtemp(prefix="kursor-bench-")
+    if args.database is None:
+        args.database = f"sqlite:///{os.path.join(workdir, 'bench.db')}?timeout=30"
+
+    fake_api = None
+    generation_url = args.generation_url
+    if generation_url is None:
+        fake_api = FakeGenerationServer(args.latency, args.jitter, args.size).start()
+        generation_url = fake_api.url
+
+    moto = None
+    s3_endpoint = args.s3_endpoint
+    if args.storage == "s3" and s3_endpoint is None:
+        moto, s3_endpoint = _start_moto()
+
+    _configure_env(args, generation_url, s3_endpoint, workdir)
+
+    from database.migrations import run_migrations
+    from database.outbox import drain_outbox
+    from database.s3.s3 import s3_client
+
+    logging.getLogger().setLevel(logging.INFO if args.verbose else logging.WARNING)
+    run_migrations()
+    if args.storage == "s3":
+        try:
+            s3_client.client.create_bucket(Bucket=args.s3_bucket)
+        except s3_client.client.exceptions.BucketAlreadyOwnedByYou:
+            pass
+
+    recorder = Recorder()
+    run_id = uuid.uuid4().hex[:8]
+    start = time.perf_counter()
+    try:
+        with ThreadPoolExecutor(max_workers=args.users, thread_name_prefix="bench-user") as pool:
+            futures = [pool.submit(_simulate_user, i, run_id, args, recorder) for i in range(args.users)]
+            for future in futures:
+                try:
+                    future.result()
+                except Exception as e:
+                    logger.warning(f"Simulated user aborted: {e}")
+        with recorder.measure("outbox_drain"):
+            drain_outbox()
+    finally:
+        wall = time.perf_counter() - start
+        if fake_api:
+            fake_api.stop()
+        if moto:
+            moto.stop()
+
+    rows = recorder.report(wall)
+    print_report(rows, wall)
+    if args.json_path:
+        with open(args.json_path, "w") as f:
+            json.dump({"args": vars(args), "wall_seconds": round(wall, 3), "results": rows}, f, indent=2)
+
+
+if __name__ == "__main__":
+    main()
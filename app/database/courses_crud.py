@@ -1,8 +1,9 @@
-from database import *
+from sqlalchemy.orm import Session
+from database.database import Course
 
 # ----- Курсы (Course) -----
-def create_course(db: Session, title: str, description: str = None) -> Course:
-    course = Course(title=title, description=description)
+def create_course(db: Session, title: str, description: str = None, author_id: int = None) -> Course:
+    course = Course(title=title, description=description, author_id=author_id)
     db.add(course)
     db.commit()
     db.refresh(course)
@@ -13,6 +14,10 @@ def get_course(db: Session, course_id: int) -> Course:
     return db.query(Course).filter(Course.id == course_id).first()
 
 
+def list_courses_by_author(db: Session, author_id: int) -> list[Course]:
+    return db.query(Course).filter(Course.author_id == author_id).order_by(Course.id.desc()).all()
+
+
 def update_course(db: Session, course_id: int, **kwargs) -> Course:
     course = get_course(db, course_id)
     if course:
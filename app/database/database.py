@@ -1,5 +1,11 @@
 import datetime
+import logging
 import os
+import sys
+import threading
+import time
+import weakref
+from contextlib import contextmanager
 
 from dotenv import load_dotenv
 from sqlalchemy import (
@@ -10,24 +16,170 @@ from sqlalchemy import (
     Text,
     DateTime,
     ForeignKey,
+    Boolean,
+    LargeBinary,
+    JSON,
+    UniqueConstraint,
     text
 )
 from sqlalchemy.orm import declarative_base, relationship, sessionmaker, Session
+from sqlalchemy.pool import QueuePool
+
+from metrics import instrument_engine, register_gauges
 
 load_dotenv()
 DATABASE_URL = os.getenv('DATABASE_URL')
 
+# Настройки пула соединений
+DB_POOL_SIZE = int(os.getenv('DB_POOL_SIZE', '10'))
+DB_MAX_OVERFLOW = int(os.getenv('DB_MAX_OVERFLOW', '20'))
+DB_POOL_TIMEOUT = float(os.getenv('DB_POOL_TIMEOUT', '30'))
+DB_POOL_RECYCLE = int(os.getenv('DB_POOL_RECYCLE', '1800'))
+DB_POOL_PRE_PING = os.getenv('DB_POOL_PRE_PING', '1') == '1'
+# Сессия, открытая дольше этого времени, считается утёкшей
+DB_SESSION_LEAK_SECONDS = float(os.getenv('DB_SESSION_LEAK_SECONDS', '60'))
+
+logger = logging.getLogger(__name__)
+
+
+# =======================================================
+# Пул соединений и метрики
+# =======================================================
+class PoolStats:
+    """Время ожидания соединения из пула и счётчик утёкших сессий."""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self.wait_count = 0
+        self.wait_seconds_total = 0.0
+        self.wait_seconds_max = 0.0
+        self.leaked_sessions = 0
+
+    def record_wait(self, seconds: float) -> None:
+        with self._lock:
+            self.wait_count += 1
+            self.wait_seconds_total += seconds
+            self.wait_seconds_max = max(self.wait_seconds_max, seconds)
+
+    def record_leak(self) -> None:
+        with self._lock:
+            self.leaked_sessions += 1
+
+
+pool_stats = PoolStats()
+
+
+class MeteredQueuePool(QueuePool):
+    def _do_get(self):
+        start = time.perf_counter()
+        try:
+            return super()._do_get()
+        finally:
+            pool_stats.record_wait(time.perf_counter() - start)
+
+
+def _engine_kwargs(url: str) -> dict:
+    if url.startswith('sqlite'):
+        # У SQLite свой пул, параметры QueuePool к нему неприменимы
+        return {}
+    return {
+        'poolclass': MeteredQueuePool,
+        'pool_size': DB_POOL_SIZE,
+        'max_overflow': DB_MAX_OVERFLOW,
+        'pool_timeout': DB_POOL_TIMEOUT,
+        'pool_recycle': DB_POOL_RECYCLE,
+        'pool_pre_ping': DB_POOL_PRE_PING,
+    }
+
+
+# =======================================================
+# Сессии с отслеживанием утечек
+# =======================================================
+_open_sessions = weakref.WeakSet()
+
+
+def _caller() -> str:
+    """Первый кадр стека вне SQLAlchemy и этого модуля — место открытия сессии."""
+    frame = sys._getframe(1)
+    while frame and (frame.f_code.co_filename == __file__ or 'sqlalchemy' in frame.f_code.co_filename):
+        frame = frame.f_back
+    if frame is None:
+        return '<unknown>'
+    return f"{frame.f_code.co_filename}:{frame.f_lineno}"
+
+
+def _report_unclosed(state: dict) -> None:
+    if not state['closed']:
+        pool_stats.record_leak()
+        age = time.time() - state['opened_at']
+        logger.warning(f"DB session opened at {state['origin']} was never closed (age {age:.1f}s)")
+
+
+class TrackedSession(Session):
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        self._leak_state = {'closed': False, 'opened_at': time.time(), 'origin': _caller()}
+        weakref.finalize(self, _report_unclosed, self._leak_state)
+        _open_sessions.add(self)
+
+    def close(self) -> None:
+        self._leak_state['closed'] = True
+        _open_sessions.discard(self)
+        super().close()
+
+
 Base = declarative_base()
-engine = create_engine(DATABASE_URL, echo=False)
-SessionLocal = sessionmaker(bind=engine)
+engine = create_engine(DATABASE_URL, echo=False, **_engine_kwargs(DATABASE_URL))
+SessionLocal = sessionmaker(bind=engine, class_=TrackedSession)
+instrument_engine(engine)
 
-def get_db():
+
+@contextmanager
+def session_scope():
+    """Сессия БД, которая гарантированно закрывается (и откатывается при ошибке)."""
     db = SessionLocal()
     try:
         yield db
+    except Exception:
+        db.rollback()
+        raise
     finally:
         db.close()
 
+
+def get_db():
+    with session_scope() as db:
+        yield db
+
+
+def pool_status() -> dict:
+    """Метрики пула соединений для мониторинга; логирует давно открытые сессии."""
+    pool = engine.pool
+    now = time.time()
+    stale = [
+        s._leak_state for s in list(_open_sessions)
+        if now - s._leak_state['opened_at'] > DB_SESSION_LEAK_SECONDS
+    ]
+    for state in stale:
+        logger.warning(f"DB session opened at {state['origin']} is open for {now - state['opened_at']:.1f}s")
+    return {
+        'pool_size': pool.size() if hasattr(pool, 'size') else None,
+        'checked_out': pool.checkedout() if hasattr(pool, 'checkedout') else None,
+        'checked_in': pool.checkedin() if hasattr(pool, 'checkedin') else None,
+        'overflow': pool.overflow() if hasattr(pool, 'overflow') else None,
+        'open_sessions': len(_open_sessions),
+        'stale_sessions': len(stale),
+        'leaked_sessions': pool_stats.leaked_sessions,
+        'wait_count': pool_stats.wait_count,
+        'wait_seconds_total': round(pool_stats.wait_seconds_total, 6),
+        'wait_seconds_max': round(pool_stats.wait_seconds_max, 6),
+    }
+
+register_gauges(
+    "kursor_db_pool", "Database connection pool state", pool_status,
+    counters=("leaked_sessions", "wait_count", "wait_seconds_total")
+)
+
 # =======================================================
 # Определения моделей
 # =======================================================
@@ -39,6 +191,7 @@ class User(Base):
     telegram_nick = Column(String, unique=True, nullable=False, index=True)
     telegram_id = Column(String, unique=True, nullable=False, index=True)
     password_hash = Column(String, nullable=False)
+    login_token = Column(String, unique=True, nullable=True, index=True)  # токен постоянного входа (cookie)
     last_online = Column(DateTime, default=datetime.datetime.utcnow)
 
     # Отношения с шаблонами и уроками, созданными пользователем
@@ -55,6 +208,7 @@ class Course(Base):
     id = Column(Integer, primary_key=True)
     title = Column(String, nullable=False)
     description = Column(Text)
+    author_id = Column(Integer, ForeignKey('users.id'), nullable=True, index=True)
     created_at = Column(DateTime, default=datetime.datetime.utcnow)
 
     # Курс содержит модули
@@ -87,6 +241,12 @@ class Template(Base):
     author_id = Column(Integer, ForeignKey('users.id'), nullable=False, index=True)
     s3_key = Column(String, nullable=False)  # ссылка на HTML-файл шаблона, хранящийся в S3
     created_at = Column(DateTime, default=datetime.datetime.utcnow)
+    # Метаданные для выбора шаблона без загрузки HTML из S3
+    size = Column(Integer)
+    content_hash = Column(String(64))
+    palette = Column(JSON)  # основные цвета, #rrggbb
+    fonts = Column(JSON)
+    preview_snippet = Column(Text)  # небольшой HTML-превью
 
     author = relationship("User", back_populates="templates")
     # Связь с уроками, использующими шаблон (при необходимости)
@@ -107,11 +267,14 @@ class Lesson(Base):
     created_at = Column(DateTime, default=datetime.datetime.utcnow)
     creation_prompt = Column(Text)
     template_id = Column(Integer, ForeignKey('templates.id'), nullable=False, index=True)
+    # Текст урока и история промптов для поиска (на Postgres по нему строится tsvector)
+    search_text = Column(Text)
 
     module = relationship("Module", back_populates="lessons")
     author = relationship("User", back_populates="lessons")
     template = relationship("Template", back_populates="lessons")
     prompt_history = relationship("LessonPromptHistory", back_populates="lesson", cascade="all, delete-orphan")
+    versions = relationship("LessonVersion", back_populates="lesson", cascade="all, delete-orphan")
 
     def __repr__(self):
         return f"<Lesson(id={self.id}, title='{self.title}', module_id={self.module_id})>"
@@ -131,34 +294,136 @@ class LessonPromptHistory(Base):
         return f"<LessonPromptHistory(id={self.id}, lesson_id={self.lesson_id}, updated_at={self.updated_at})>"
 
 
+class LessonVersion(Base):
+    __tablename__ = 'lesson_versions'
+    __table_args__ = (UniqueConstraint('lesson_id', 'version', name='uq_lesson_versions_lesson_version'),)
+
+    id = Column(Integer, primary_key=True)
+    lesson_id = Column(Integer, ForeignKey('lessons.id'), nullable=False, index=True)
+    version = Column(Integer, nullable=False)
+    prompt_history_id = Column(Integer, ForeignKey('lesson_prompt_history.id'), nullable=True)
+    is_snapshot = Column(Boolean, nullable=False, default=False)
+    payload = Column(LargeBinary, nullable=False)  # zlib: полный HTML или дельта к предыдущей версии
+    size = Column(Integer, nullable=False)  # размер HTML этой версии
+    content_hash = Column(String(64), nullable=False)
+    note = Column(String)  # служебная пометка версии (например, восстановление), не промпт
+    created_at = Column(DateTime, default=datetime.datetime.utcnow)
+
+    lesson = relationship("Lesson", back_populates="versions")
+    prompt = relationship("LessonPromptHistory")
+
+    def __repr__(self):
+        return f"<LessonVersion(lesson_id={self.lesson_id}, version={self.version}, snapshot={self.is_snapshot})>"
+
+
+class StoredObject(Base):
+    __tablename__ = 's3_objects'
+
+    # Ключ адресуется содержимым: <folder>/<sha256>.html
+    s3_key = Column(String, primary_key=True)
+    content_hash = Column(String(64), nullable=False, index=True)
+    size = Column(Integer, nullable=False)
+    ref_count = Column(Integer, nullable=False, default=0)  # сколько уроков/шаблонов ссылаются на объект
+    created_at = Column(DateTime, default=datetime.datetime.utcnow)
+
+    def __repr__(self):
+        return f"<StoredObject(s3_key='{self.s3_key}', ref_count={self.ref_count})>"
+
+
+class GenerationCacheEntry(Base):
+    __tablename__ = 'generation_cache'
+
+    # sha256 от (эндпоинт, нормализованный запрос, хэш шаблона)
+    key = Column(String(64), primary_key=True)
+    endpoint = Column(String, nullable=False)
+    html = Column(Text, nullable=False)
+    size = Column(Integer, nullable=False)
+    created_at = Column(DateTime, default=datetime.datetime.utcnow, index=True)
+    last_used_at = Column(DateTime, default=datetime.datetime.utcnow, index=True)
+
+    def __repr__(self):
+        return f"<GenerationCacheEntry(key='{self.key}', endpoint='{self.endpoint}')>"
+
+
+class S3Outbox(Base):
+    # Отложенное удаление объекта S3, записанное в одной транзакции с изменением строк
+    __tablename__ = 's3_outbox'
+
+    id = Column(Integer, primary_key=True)
+    s3_key = Column(String, nullable=False, index=True)
+    created_at = Column(DateTime, default=datetime.datetime.utcnow)
+    not_before = Column(DateTime, default=datetime.datetime.utcnow, index=True)
+    attempts = Column(Integer, nullable=False, default=0)
+    last_error = Column(Text)
+
+    def __repr__(self):
+        return f"<S3Outbox(id={self.id}, s3_key='{self.s3_key}', attempts={self.attempts})>"
+
+
+class Document(Base):
+    __tablename__ = 'documents'
+
+    id = Column(Integer, primary_key=True)
+    author_id = Column(Integer, ForeignKey('users.id'), nullable=False, index=True)
+    title = Column(String, nullable=False)
+    s3_key = Column(String, nullable=True)  # исходный PDF в S3
+    size = Column(Integer)
+    page_count = Column(Integer)
+    status = Column(String, nullable=False, default='processing')  # processing | ready | failed
+    error = Column(Text)
+    created_at = Column(DateTime, default=datetime.datetime.utcnow)
+
+    chunks = relationship("DocumentChunk", back_populates="document", cascade="all, delete-orphan")
+
+    def __repr__(self):
+        return f"<Document(id={self.id}, title='{self.title}', status='{self.status}')>"
+
+
+class DocumentChunk(Base):
+    __tablename__ = 'document_chunks'
+
+    id = Column(Integer, primary_key=True)
+    document_id = Column(Integer, ForeignKey('documents.id'), nullable=False, index=True)
+    chunk_index = Column(Integer, nullable=False)
+    page_start = Column(Integer, nullable=False)
+    page_end = Column(Integer, nullable=False)
+    text = Column(Text, nullable=False)
+
+    document = relationship("Document", back_populates="chunks")
+
+    def __repr__(self):
+        return f"<DocumentChunk(document_id={self.document_id}, chunk_index={self.chunk_index})>"
+
+
 # =======================================================
-# Инициализация базы данных, создание индексов и представлений
+# Инициализация базы данных
 # =======================================================
+# Миграции применяются при деплое (python -m database.migrations upgrade);
+# здесь — страховка на случай запуска без этого шага, не чаще раза за процесс.
+DB_AUTO_MIGRATE = os.getenv('DB_AUTO_MIGRATE', '1') == '1'
+
+_init_lock = threading.Lock()
+_initialized = False
+
+
 def init_db():
-    Base.metadata.create_all(bind=engine)
-    with engine.connect() as conn:
-        # Создание дополнительных индексов
-        conn.execute(text("CREATE INDEX IF NOT EXISTS idx_lessons_author ON lessons (author_id)"))
-        conn.execute(text("CREATE INDEX IF NOT EXISTS idx_lessons_template ON lessons (template_id)"))
-        conn.execute(text("CREATE INDEX IF NOT EXISTS idx_modules_course ON modules (course_id)"))
-        conn.execute(text("CREATE INDEX IF NOT EXISTS idx_templates_author ON templates (author_id)"))
-        conn.execute(text("CREATE INDEX IF NOT EXISTS idx_history_lesson ON lesson_prompt_history (lesson_id)"))
-
-        # Пример представления для получения подробной информации по урокам
-        conn.execute(text("DROP VIEW IF EXISTS view_lessons_detailed"))
-        conn.execute(text("""
-            CREATE VIEW view_lessons_detailed AS
-            SELECT l.id AS lesson_id,
-                   l.title AS lesson_title,
-                   l.created_at,
-                   u.telegram_nick AS author_nick,
-                   m.title AS module_title,
-                   c.title AS course_title,
-                   t.title AS template_title
-            FROM lessons l
-            JOIN users u ON l.author_id = u.id
-            JOIN modules m ON l.module_id = m.id
-            JOIN courses c ON m.course_id = c.id
-            JOIN templates t ON l.template_id = t.id
-        """))
-        conn.commit()
+    """Проверяет схему один раз за процесс; перезапуски скрипта Streamlit не выполняют DDL."""
+    global _initialized
+    if _initialized:
+        return
+    with _init_lock:
+        if _initialized:
+            return
+        try:
+            from database.migrations import run_migrations, current_version, HEAD_VERSION
+        except ImportError:
+            from migrations import run_migrations, current_version, HEAD_VERSION
+
+        if DB_AUTO_MIGRATE:
+            run_migrations()
+        else:
+            with engine.connect() as conn:
+                version = current_version(conn)
+            if version < HEAD_VERSION:
+                logger.warning(f"Database schema is at version {version}, expected {HEAD_VERSION}")
+        _initialized = True
@@ -0,0 +1,81 @@
+from sqlalchemy.orm import Session
+from database.database import Document, DocumentChunk
+
+
+# ----- Загруженные документы (Document, DocumentChunk) -----
+def create_document(db: Session, author_id: int, title: str, size: int = None) -> Document:
+    document = Document(author_id=author_id, title=title, size=size, status='processing')
+    db.add(document)
+    db.commit()
+    db.refresh(document)
+    return document
+
+
+def get_document(db: Session, document_id: int) -> Document | None:
+    return db.get(Document, document_id)
+
+
+def update_document(db: Session, document_id: int, **kwargs) -> Document | None:
+    document = get_document(db, document_id)
+    if document:
+        for key, value in kwargs.items():
+            setattr(document, key, value)
+        db.commit()
+        db.refresh(document)
+    return document
+
+
+def add_document_chunks(db: Session, document_id: int, chunks: list[tuple[int, int, int, str]]) -> None:
+    """chunks: (chunk_index, page_start, page_end, text)."""
+    db.add_all([
+        DocumentChunk(
+            document_id=document_id,
+            chunk_index=index,
+            page_start=page_start,
+            page_end=page_end,
+            text=text
+        )
+        for index, page_start, page_end, text in chunks
+    ])
+    db.commit()
+
+
+def list_ready_documents_by_author(db: Session, author_id: int) -> list:
+    """(id, title, page_count) of documents that finished ingestion."""
+    return (
+        db.query(Document.id, Document.title, Document.page_count)
+        .filter(Document.author_id == author_id, Document.status == 'ready')
+        .order_by(Document.id.desc())
+        .all()
+    )
+
+
+def _overlap_length(previous: str, text: str, overlap: int) -> int:
+    """Length of the prefix of text that repeats the end of previous (at most overlap)."""
+    for length in range(min(overlap, len(previous), len(text)), 0, -1):
+        if previous.endswith(text[:length]):
+            return length
+    return 0
+
+
+def get_document_text(db: Session, document_id: int, max_chars: int, overlap: int = 0) -> str:
+    """
+    Document text up to max_chars. Chunks are cut with overlap characters
+    repeated from the previous chunk; the repeat is dropped, so the text is continuous.
+    """
+    parts, total, previous = [], 0, ""
+    query = (
+        db.query(DocumentChunk.text)
+        .filter(DocumentChunk.document_id == document_id)
+        .order_by(DocumentChunk.chunk_index)
+        .yield_per(50)
+    )
+    for (text,) in query:
+        piece = text[_overlap_length(previous, text, overlap):] if overlap else text
+        previous = text
+        if total + len(piece) > max_chars:
+            parts.append(piece[:max_chars - total])
+            break
+        parts.append(piece)
+        total += len(piece)
+    return "".join(parts)
@@ -0,0 +1,51 @@
+import datetime
+from sqlalchemy.orm import Session
+from sqlalchemy.exc import IntegrityError
+
+from database.database import GenerationCacheEntry
+
+
+# ----- Кэш результатов генерации (GenerationCacheEntry) -----
+def get_cached_generation(db: Session, key: str, ttl_seconds: int) -> str | None:
+    now = datetime.datetime.utcnow()
+    entry = db.get(GenerationCacheEntry, key)
+    if entry is None or entry.created_at < now - datetime.timedelta(seconds=ttl_seconds):
+        return None
+    entry.last_used_at = now
+    db.commit()
+    return entry.html
+
+
+def store_generation(db: Session, key: str, endpoint: str, html: str, ttl_seconds: int, max_entries: int) -> None:
+    now = datetime.datetime.utcnow()
+    db.merge(GenerationCacheEntry(
+        key=key,
+        endpoint=endpoint,
+        html=html,
+        size=len(html.encode('utf-8')),
+        created_at=now,
+        last_used_at=now
+    ))
+    try:
+        db.commit()
+    except IntegrityError:
+        # Ту же запись параллельно сохранил другой процесс
+        db.rollback()
+        return
+    evict_generations(db, ttl_seconds, max_entries)
+
+
+def evict_generations(db: Session, ttl_seconds: int, max_entries: int) -> None:
+    """Удаляет просроченные записи и самые давно использованные сверх лимита."""
+    deadline = datetime.datetime.utcnow() - datetime.timedelta(seconds=ttl_seconds)
+    db.query(GenerationCacheEntry).filter(GenerationCacheEntry.created_at < deadline).delete(synchronize_session=False)
+    overflow = db.query(GenerationCacheEntry).count() - max_entries
+    if overflow > 0:
+        oldest = (
+            db.query(GenerationCacheEntry.key)
+            .order_by(GenerationCacheEntry.last_used_at)
+            .limit(overflow)
+            .subquery()
+        )
+        db.query(GenerationCacheEntry).filter(GenerationCacheEntry.key.in_(oldest.select())).delete(synchronize_session=False)
+    db.commit()
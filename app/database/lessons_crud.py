@@ -1,8 +1,8 @@
 import os
 import sys
-import uuid
 import logging
 from dotenv import load_dotenv
+from sqlalchemy import func, or_, and_, literal_column
 from sqlalchemy.orm import Session
 from sqlalchemy.exc import IntegrityError
 from sqlalchemy.orm import joinedload
@@ -15,15 +15,27 @@ if root not in sys.path:
     sys.path.insert(0, root)
 
 try:
-    from database.database import Lesson, User, Template, SessionLocal
+    from database.database import Lesson, LessonPromptHistory, User, Template, Module, SessionLocal
 except ImportError:
-    from database import Lesson, User, Template, SessionLocal
+    from database import Lesson, LessonPromptHistory, User, Template, Module, SessionLocal
 
 try:
     from database.s3.s3 import s3_client
 except ImportError:
     from s3.s3 import s3_client
 
+try:
+    from database.objects_crud import acquire_html, release_object
+except ImportError:
+    from objects_crud import acquire_html, release_object
+
+try:
+    from database.versions_crud import latest_version, record_version
+except ImportError:
+    from versions_crud import latest_version, record_version
+
+from utils.html_text import html_to_text
+
 # ---------------------------
 # Logging setup
 # ---------------------------
@@ -34,24 +46,20 @@ logging.basicConfig(
 )
 logger = logging.getLogger(__name__)
 
-# ---------------------------
-# S3 helper functions
-# ---------------------------
-
-def upload_html_to_s3(html: str, folder: str) -> str:
-    """Upload HTML string to S3 and return object key."""
-    key = f"{folder}/{uuid.uuid4()}.html"
-    s3_client.put_object(
-        object_key=key,
-        body=html.encode('utf-8'),
-        content_type='text/html'
-    )
-    return key
+# Сколько символов текста урока попадает в поисковый индекс
+LESSON_SEARCH_TEXT_CHARS = int(os.getenv("LESSON_SEARCH_TEXT_CHARS", "20000"))
+SEARCH_CONFIG = literal_column("'russian'::regconfig")
 
 
-def delete_from_s3(key: str) -> None:
-    """Delete object by key from S3."""
-    s3_client.client.delete_object(Bucket=s3_client.bucket_name, Key=key)
+def _search_text(db: Session, lesson_id: int, html: str) -> str:
+    """Prompt history plus visible lesson text, stored for full-text search."""
+    prompts = [
+        row.prompt_text
+        for row in db.query(LessonPromptHistory.prompt_text)
+        .filter(LessonPromptHistory.lesson_id == lesson_id)
+        .distinct()
+    ]
+    return "\n".join([*prompts, html_to_text(html, LESSON_SEARCH_TEXT_CHARS)])
 
 # ---------------------------
 # Lesson CRUD operations (Module and Course entities are not required)
@@ -63,7 +71,8 @@ def create_lesson_with_s3(
     author_id: int,
     html_content: str,
     creation_prompt: str,
-    template_id: int
+    template_id: int,
+    module_id: int = None
 ) -> Lesson:
     """Upload HTML to S3 and create a Lesson record."""
     # validate foreign keys
@@ -72,16 +81,20 @@ def create_lesson_with_s3(
     if not db.get(Template, template_id):
         raise ValueError(f"Template id={template_id} not found")
 
-    s3_key = upload_html_to_s3(html_content, folder='lessons')
+    s3_key = acquire_html(db, html_content, folder='lessons')
     lesson = Lesson(
         title=title,
         author_id=author_id,
         s3_key=s3_key,
         creation_prompt=creation_prompt,
-        template_id=template_id
+        template_id=template_id,
+        module_id=module_id
     )
     db.add(lesson)
     try:
+        db.flush()
+        record_version(db, lesson.id, html_content, prompt_text=creation_prompt)
+        lesson.search_text = _search_text(db, lesson.id, html_content)
         db.commit()
         db.refresh(lesson)
         logger.info(f"Lesson created id={lesson.id}")
@@ -103,20 +116,129 @@ def list_lessons_by_author_id(db: Session, author_id: int) -> list[Lesson]:
     return db.query(Lesson).options(joinedload(Lesson.template)).filter(Lesson.author_id == author_id).all()
 
 
+def list_lesson_summaries(
+    db: Session,
+    author_id: int,
+    limit: int = 20,
+    before_id: int | None = None
+) -> list:
+    """
+    Lightweight page of an author's lessons, newest first: (id, title, template_title).
+    Keyset pagination: pass the smallest id of the previous page as before_id.
+    """
+    query = (
+        db.query(Lesson.id, Lesson.title, Template.title.label("template_title"))
+        .outerjoin(Template, Lesson.template_id == Template.id)
+        .filter(Lesson.author_id == author_id)
+    )
+    if before_id is not None:
+        query = query.filter(Lesson.id < before_id)
+    return query.order_by(Lesson.id.desc()).limit(limit).all()
+
+
+def search_lessons(
+    db: Session,
+    author_id: int,
+    query: str,
+    limit: int = 20,
+    offset: int = 0
+) -> list:
+    """
+    Author's lessons matching query, best first: (id, title, template_title).
+    Postgres: full-text match over title, prompts and lesson text (GIN index on
+    search_vector) or trigram similarity of the title, ranked by both.
+    Other dialects: every word must occur in title, prompt or text (LIKE).
+    """
+    query = " ".join(query.split())
+    if not query:
+        return []
+    rows = (
+        db.query(Lesson.id, Lesson.title, Template.title.label("template_title"))
+        .outerjoin(Template, Lesson.template_id == Template.id)
+        .filter(Lesson.author_id == author_id)
+    )
+    if db.bind.dialect.name == 'postgresql':
+        vector = literal_column("lessons.search_vector")
+        ts_query = func.websearch_to_tsquery(SEARCH_CONFIG, query)
+        rank = func.ts_rank_cd(vector, ts_query) + func.similarity(Lesson.title, query)
+        rows = (
+            rows.filter(or_(vector.op("@@")(ts_query), Lesson.title.op("%")(query)))
+            .order_by(rank.desc(), Lesson.id.desc())
+        )
+    else:
+        rows = rows.filter(and_(*(
+            or_(
+                Lesson.title.icontains(word, autoescape=True),
+                Lesson.creation_prompt.icontains(word, autoescape=True),
+                Lesson.search_text.icontains(word, autoescape=True)
+            )
+            for word in query.split()
+        ))).order_by(Lesson.id.desc())
+    return rows.offset(offset).limit(limit).all()
+
+
+def list_lesson_prompts_by_module(db: Session, module_id: int) -> list[str]:
+    """creation_prompt of lessons already stored in a module (used to resume batch runs)."""
+    return [
+        row.creation_prompt
+        for row in db.query(Lesson.creation_prompt).filter(Lesson.module_id == module_id).all()
+    ]
+
+
+def list_lesson_files_by_author(db: Session, author_id: int) -> list:
+    """(id, title, s3_key) of all author's lessons, for bulk export."""
+    return (
+        db.query(Lesson.id, Lesson.title, Lesson.s3_key)
+        .filter(Lesson.author_id == author_id)
+        .order_by(Lesson.id)
+        .all()
+    )
+
+
+def list_lesson_files_by_course(db: Session, course_id: int) -> list:
+    """(id, title, s3_key, module_title, module_order) of a course's lessons, for bulk export."""
+    return (
+        db.query(
+            Lesson.id, Lesson.title, Lesson.s3_key,
+            Module.title.label("module_title"), Module.order.label("module_order")
+        )
+        .join(Module, Lesson.module_id == Module.id)
+        .filter(Module.course_id == course_id)
+        .order_by(Module.order, Module.id, Lesson.id)
+        .all()
+    )
+
+
 def update_lesson_with_s3(
     db: Session,
     lesson_id: int,
+    prompt_text: str = None,
+    version_note: str = None,
     **fields
 ) -> Lesson | None:
-    """Update Lesson fields; if html_content provided, re-upload and delete old."""
+    """
+    Update Lesson fields; if html_content provided, re-upload and delete old.
+    The new HTML is recorded as a lesson version; prompt_text (the prompt that
+    produced it) goes to the prompt history, version_note is kept on the version.
+    """
     lesson = get_lesson(db, lesson_id)
     if not lesson:
         return None
     if 'html_content' in fields:
         new_html = fields.pop('html_content')
         old_key = lesson.s3_key
-        lesson.s3_key = upload_html_to_s3(new_html, folder='lessons')
-        delete_from_s3(old_key)
+        previous_html = None
+        if latest_version(db, lesson.id) is None:
+            # Урок создан до появления версий: текущее содержимое становится версией 1
+            previous_html = s3_client.get_object(old_key).decode('utf-8')
+            record_version(db, lesson.id, previous_html, prompt_text=lesson.creation_prompt)
+        record_version(
+            db, lesson.id, new_html,
+            prompt_text=prompt_text, previous_html=previous_html, note=version_note
+        )
+        lesson.search_text = _search_text(db, lesson.id, new_html)
+        lesson.s3_key = acquire_html(db, new_html, folder='lessons')
+        release_object(db, old_key)
     for k, v in fields.items():
         setattr(lesson, k, v)
     db.commit()
@@ -130,7 +252,7 @@ def delete_lesson_with_s3(db: Session, lesson_id: int) -> None:
     lesson = get_lesson(db, lesson_id)
     if not lesson:
         return
-    delete_from_s3(lesson.s3_key)
+    release_object(db, lesson.s3_key)
     db.delete(lesson)
     db.commit()
     logger.info(f"Lesson id={lesson_id} deleted")
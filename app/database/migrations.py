@@ -0,0 +1,396 @@
+"""
+Версионированные миграции схемы БД.
+
+Запуск из каталога app (при деплое, до старта Streamlit):
+    python -m database.migrations upgrade
+    python -m database.migrations status
+"""
+import os
+import sys
+import hashlib
+import argparse
+import logging
+from dotenv import load_dotenv
+from sqlalchemy import (
+    text, inspect, MetaData, Table, Column, Integer, String, Text, DateTime, Boolean, LargeBinary,
+    ForeignKey, UniqueConstraint,
+)
+
+# ---------------------------
+# Adjust imports for local vs Docker
+# ---------------------------
+root = os.path.abspath(os.path.join(os.path.dirname(__file__), '..'))
+if root not in sys.path:
+    sys.path.insert(0, root)
+
+try:
+    from database.database import engine
+except ImportError:
+    from database import engine
+
+# ---------------------------
+# Logging setup
+# ---------------------------
+load_dotenv()
+logging.basicConfig(
+    level=logging.INFO,
+    format="%(asctime)s [%(levelname)s] %(message)s"
+)
+logger = logging.getLogger(__name__)
+
+# Ключ advisory-lock Postgres, чтобы миграции не запускались параллельно
+MIGRATION_LOCK_ID = 74201
+
+# ---------------------------
+# Helpers
+# ---------------------------
+
+def _is_postgres(conn) -> bool:
+    return conn.dialect.name == 'postgresql'
+
+
+def _add_column(conn, table: str, column: str, ddl_type: str) -> None:
+    """ADD COLUMN that is a no-op when the column exists (works on SQLite too)."""
+    columns = {c['name'] for c in inspect(conn).get_columns(table)}
+    if column not in columns:
+        conn.execute(text(f"ALTER TABLE {table} ADD COLUMN {column} {ddl_type}"))
+
+# ---------------------------
+# Migrations
+# ---------------------------
+
+# Таблицы в том виде, в каком их создаёт миграция. Заморожены: миграции не должны
+# зависеть от текущих моделей, иначе новая и обновлённая БД получат разные схемы.
+# Колонки, добавленные позже, добавляют последующие миграции.
+_baseline = MetaData()
+
+# Схема на момент введения миграций (миграция 1)
+
+Table(
+    'users', _baseline,
+    Column('id', Integer, primary_key=True),
+    Column('telegram_nick', String, unique=True, nullable=False, index=True),
+    Column('telegram_id', String, unique=True, nullable=False, index=True),
+    Column('password_hash', String, nullable=False),
+    Column('last_online', DateTime),
+)
+
+Table(
+    'courses', _baseline,
+    Column('id', Integer, primary_key=True),
+    Column('title', String, nullable=False),
+    Column('description', Text),
+    Column('created_at', DateTime),
+)
+
+Table(
+    'modules', _baseline,
+    Column('id', Integer, primary_key=True),
+    Column('course_id', Integer, ForeignKey('courses.id'), nullable=True, index=True),
+    Column('title', String, nullable=False),
+    Column('order', Integer, nullable=True),
+)
+
+Table(
+    'templates', _baseline,
+    Column('id', Integer, primary_key=True),
+    Column('title', String, nullable=False),
+    Column('author_id', Integer, ForeignKey('users.id'), nullable=False, index=True),
+    Column('s3_key', String, nullable=False),
+    Column('created_at', DateTime),
+)
+
+Table(
+    'lessons', _baseline,
+    Column('id', Integer, primary_key=True),
+    Column('module_id', Integer, ForeignKey('modules.id'), nullable=True, index=True),
+    Column('title', String, nullable=False),
+    Column('author_id', Integer, ForeignKey('users.id'), nullable=False, index=True),
+    Column('s3_key', String, nullable=False),
+    Column('created_at', DateTime),
+    Column('creation_prompt', Text),
+    Column('template_id', Integer, ForeignKey('templates.id'), nullable=False, index=True),
+)
+
+Table(
+    'lesson_prompt_history', _baseline,
+    Column('id', Integer, primary_key=True),
+    Column('lesson_id', Integer, ForeignKey('lessons.id'), nullable=False, index=True),
+    Column('prompt_text', Text, nullable=False),
+    Column('updated_at', DateTime),
+)
+
+BASELINE_TABLES = ('users', 'courses', 'modules', 'templates', 'lessons', 'lesson_prompt_history')
+
+# Миграция 5
+Table(
+    's3_objects', _baseline,
+    Column('s3_key', String, primary_key=True),
+    Column('content_hash', String(64), nullable=False, index=True),
+    Column('size', Integer, nullable=False),
+    Column('ref_count', Integer, nullable=False),
+    Column('created_at', DateTime),
+)
+
+# Миграция 7
+Table(
+    'generation_cache', _baseline,
+    Column('key', String(64), primary_key=True),
+    Column('endpoint', String, nullable=False),
+    Column('html', Text, nullable=False),
+    Column('size', Integer, nullable=False),
+    Column('created_at', DateTime, index=True),
+    Column('last_used_at', DateTime, index=True),
+)
+
+# Миграция 9
+Table(
+    'documents', _baseline,
+    Column('id', Integer, primary_key=True),
+    Column('author_id', Integer, ForeignKey('users.id'), nullable=False, index=True),
+    Column('title', String, nullable=False),
+    Column('s3_key', String, nullable=True),
+    Column('size', Integer),
+    Column('page_count', Integer),
+    Column('status', String, nullable=False),
+    Column('error', Text),
+    Column('created_at', DateTime),
+)
+
+Table(
+    'document_chunks', _baseline,
+    Column('id', Integer, primary_key=True),
+    Column('document_id', Integer, ForeignKey('documents.id'), nullable=False, index=True),
+    Column('chunk_index', Integer, nullable=False),
+    Column('page_start', Integer, nullable=False),
+    Column('page_end', Integer, nullable=False),
+    Column('text', Text, nullable=False),
+)
+
+# Миграция 10
+Table(
+    'lesson_versions', _baseline,
+    Column('id', Integer, primary_key=True),
+    Column('lesson_id', Integer, ForeignKey('lessons.id'), nullable=False, index=True),
+    Column('version', Integer, nullable=False),
+    Column('prompt_history_id', Integer, ForeignKey('lesson_prompt_history.id'), nullable=True),
+    Column('is_snapshot', Boolean, nullable=False),
+    Column('payload', LargeBinary, nullable=False),
+    Column('size', Integer, nullable=False),
+    Column('content_hash', String(64), nullable=False),
+    Column('note', String),
+    Column('created_at', DateTime),
+    UniqueConstraint('lesson_id', 'version', name='uq_lesson_versions_lesson_version'),
+)
+
+# Миграция 11
+Table(
+    's3_outbox', _baseline,
+    Column('id', Integer, primary_key=True),
+    Column('s3_key', String, nullable=False, index=True),
+    Column('created_at', DateTime),
+    Column('not_before', DateTime, index=True),
+    Column('attempts', Integer, nullable=False),
+    Column('last_error', Text),
+)
+
+
+def _create_tables(conn, *names):
+    _baseline.create_all(bind=conn, tables=[_baseline.tables[name] for name in names])
+
+
+def _baseline_tables(conn):
+    _create_tables(conn, *BASELINE_TABLES)
+
+
+def _baseline_indexes(conn):
+    conn.execute(text("CREATE INDEX IF NOT EXISTS idx_lessons_author ON lessons (author_id)"))
+    conn.execute(text("CREATE INDEX IF NOT EXISTS idx_lessons_template ON lessons (template_id)"))
+    conn.execute(text("CREATE INDEX IF NOT EXISTS idx_modules_course ON modules (course_id)"))
+    conn.execute(text("CREATE INDEX IF NOT EXISTS idx_templates_author ON templates (author_id)"))
+    conn.execute(text("CREATE INDEX IF NOT EXISTS idx_history_lesson ON lesson_prompt_history (lesson_id)"))
+
+
+def _lessons_detailed_view(conn):
+    # Пример представления для получения подробной информации по урокам
+    conn.execute(text("DROP VIEW IF EXISTS view_lessons_detailed"))
+    conn.execute(text("""
+        CREATE VIEW view_lessons_detailed AS
+        SELECT l.id AS lesson_id,
+               l.title AS lesson_title,
+               l.created_at,
+               u.telegram_nick AS author_nick,
+               m.title AS module_title,
+               c.title AS course_title,
+               t.title AS template_title
+        FROM lessons l
+        JOIN users u ON l.author_id = u.id
+        JOIN modules m ON l.module_id = m.id
+        JOIN courses c ON m.course_id = c.id
+        JOIN templates t ON l.template_id = t.id
+    """))
+
+
+def _users_login_token(conn):
+    # Токен постоянного входа: колонка, уникальный индекс и заполнение для существующих пользователей
+    _add_column(conn, 'users', 'login_token', 'VARCHAR')
+    conn.execute(text("CREATE UNIQUE INDEX IF NOT EXISTS ix_users_login_token ON users (login_token)"))
+    if _is_postgres(conn):
+        conn.execute(text(
+            "UPDATE users SET login_token = encode(sha256(telegram_id::bytea), 'hex') "
+            "WHERE login_token IS NULL"
+        ))
+        return
+    rows = conn.execute(text("SELECT id, telegram_id FROM users WHERE login_token IS NULL")).all()
+    for user_id, telegram_id in rows:
+        conn.execute(
+            text("UPDATE users SET login_token = :token WHERE id = :id"),
+            {"token": hashlib.sha256(str(telegram_id).encode()).hexdigest(), "id": user_id}
+        )
+
+
+def _stored_objects(conn):
+    _create_tables(conn, 's3_objects')
+
+
+def _lessons_keyset_index(conn):
+    conn.execute(text("CREATE INDEX IF NOT EXISTS idx_lessons_author_id_desc ON lessons (author_id, id DESC)"))
+
+
+def _generation_cache(conn):
+    _create_tables(conn, 'generation_cache')
+
+
+def _courses_author(conn):
+    _add_column(conn, 'courses', 'author_id', 'INTEGER REFERENCES users (id)')
+    conn.execute(text("CREATE INDEX IF NOT EXISTS ix_courses_author_id ON courses (author_id)"))
+
+
+def _documents(conn):
+    _create_tables(conn, 'documents', 'document_chunks')
+
+
+def _lesson_versions(conn):
+    _create_tables(conn, 'lesson_versions')
+
+
+def _s3_outbox(conn):
+    _create_tables(conn, 's3_outbox')
+
+
+def _templates_metadata(conn):
+    # Заполняются при создании шаблона; для старых — при первом показе в списке
+    _add_column(conn, 'templates', 'size', 'INTEGER')
+    _add_column(conn, 'templates', 'content_hash', 'VARCHAR(64)')
+    _add_column(conn, 'templates', 'palette', 'JSON')
+    _add_column(conn, 'templates', 'fonts', 'JSON')
+    _add_column(conn, 'templates', 'preview_snippet', 'TEXT')
+
+
+def _lessons_search(conn):
+    # search_text заполняется при записи урока; название и промпт индексируются и без него
+    _add_column(conn, 'lessons', 'search_text', 'TEXT')
+    if not _is_postgres(conn):
+        # SQLite (тесты, бенчмарк) ищет через LIKE без индексов
+        return
+    conn.execute(text("CREATE EXTENSION IF NOT EXISTS pg_trgm"))
+    _add_column(
+        conn, 'lessons', 'search_vector',
+        "tsvector GENERATED ALWAYS AS ("
+        "setweight(to_tsvector('russian'::regconfig, coalesce(title, '')), 'A') || "
+        "setweight(to_tsvector('russian'::regconfig, coalesce(creation_prompt, '')), 'B') || "
+        "setweight(to_tsvector('russian'::regconfig, coalesce(search_text, '')), 'C')"
+        ") STORED"
+    )
+    conn.execute(text("CREATE INDEX IF NOT EXISTS idx_lessons_search_vector ON lessons USING GIN (search_vector)"))
+    conn.execute(text("CREATE INDEX IF NOT EXISTS idx_lessons_title_trgm ON lessons USING GIN (title gin_trgm_ops)"))
+
+
+# (версия, описание, функция) — только добавлять в конец, не менять существующие
+MIGRATIONS = [
+    (1, "baseline tables", _baseline_tables),
+    (2, "baseline indexes", _baseline_indexes),
+    (3, "view_lessons_detailed", _lessons_detailed_view),
+    (4, "users.login_token", _users_login_token),
+    (5, "s3_objects reference counts", _stored_objects),
+    (6, "lessons (author_id, id DESC) index", _lessons_keyset_index),
+    (7, "generation_cache", _generation_cache),
+    (8, "courses.author_id", _courses_author),
+    (9, "documents and document_chunks", _documents),
+    (10, "lesson_versions", _lesson_versions),
+    (11, "s3_outbox", _s3_outbox),
+    (12, "templates metadata", _templates_metadata),
+    (13, "lessons full-text and trigram search", _lessons_search),
+]
+
+HEAD_VERSION = MIGRATIONS[-1][0]
+
+# ---------------------------
+# Runner
+# ---------------------------
+
+def _ensure_version_table(conn):
+    conn.execute(text("""
+        CREATE TABLE IF NOT EXISTS schema_migrations (
+            version INTEGER PRIMARY KEY,
+            name VARCHAR NOT NULL,
+            applied_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
+        )
+    """))
+
+
+def current_version(conn) -> int:
+    if not inspect(conn).has_table('schema_migrations'):
+        return 0
+    return conn.execute(text("SELECT COALESCE(MAX(version), 0) FROM schema_migrations")).scalar()
+
+
+def run_migrations(bind=engine) -> list[int]:
+    """Apply pending migrations, each in its own transaction. Returns applied versions."""
+    applied = []
+    with bind.connect() as conn:
+        if _is_postgres(conn):
+            conn.execute(text("SELECT pg_advisory_lock(:id)"), {"id": MIGRATION_LOCK_ID})
+            conn.commit()
+        try:
+            _ensure_version_table(conn)
+            conn.commit()
+            version = current_version(conn)
+            for number, name, migrate in MIGRATIONS:
+                if number <= version:
+                    continue
+                logger.info(f"Applying migration {number}: {name}")
+                migrate(conn)
+                conn.execute(
+                    text("INSERT INTO schema_migrations (version, name) VALUES (:version, :name)"),
+                    {"version": number, "name": name}
+                )
+                conn.commit()
+                applied.append(number)
+        except Exception:
+            conn.rollback()
+            raise
+        finally:
+            if _is_postgres(conn):
+                conn.execute(text("SELECT pg_advisory_unlock(:id)"), {"id": MIGRATION_LOCK_ID})
+                conn.commit()
+    if applied:
+        logger.info(f"Schema migrated to version {applied[-1]}")
+    return applied
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Database schema migrations")
+    parser.add_argument("command", nargs="?", default="upgrade", choices=["upgrade", "status"])
+    args = parser.parse_args()
+
+    if args.command == "status":
+        with engine.connect() as conn:
+            version = current_version(conn)
+        logger.info(f"Schema version {version}, head {HEAD_VERSION}")
+        return
+    run_migrations()
+
+
+if __name__ == "__main__":
+    main()
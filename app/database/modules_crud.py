@@ -1,4 +1,5 @@
-from database import *
+from sqlalchemy.orm import Session
+from database.database import Module
 
 # ----- Модули (Module) -----
 def create_module(db: Session, course_id: int, title: str, order: int = None) -> Module:
@@ -13,6 +14,10 @@ def get_module(db: Session, module_id: int) -> Module:
     return db.query(Module).filter(Module.id == module_id).first()
 
 
+def list_modules_by_course(db: Session, course_id: int) -> list[Module]:
+    return db.query(Module).filter(Module.course_id == course_id).order_by(Module.order, Module.id).all()
+
+
 def update_module(db: Session, module_id: int, **kwargs) -> Module:
     module = get_module(db, module_id)
     if module:
@@ -0,0 +1,101 @@
+import os
+import sys
+import hashlib
+import logging
+from dotenv import load_dotenv
+from sqlalchemy.orm import Session
+from sqlalchemy.dialects import postgresql, sqlite
+
+# ---------------------------
+# Adjust imports for local vs Docker
+# ---------------------------
+root = os.path.abspath(os.path.join(os.path.dirname(__file__), '..'))
+if root not in sys.path:
+    sys.path.insert(0, root)
+
+try:
+    from database.database import StoredObject
+except ImportError:
+    from database import StoredObject
+
+try:
+    from database.s3.s3 import s3_client
+except ImportError:
+    from s3.s3 import s3_client
+
+try:
+    from database.outbox import enqueue_delete, cancel_delete
+except ImportError:
+    from outbox import enqueue_delete, cancel_delete
+
+# ---------------------------
+# Logging setup
+# ---------------------------
+load_dotenv()
+logging.basicConfig(
+    level=logging.INFO,
+    format="%(asctime)s [%(levelname)s] %(message)s"
+)
+logger = logging.getLogger(__name__)
+
+# ---------------------------
+# Content-addressed HTML storage with reference counting
+# ---------------------------
+
+def content_key(content_hash: str, folder: str) -> str:
+    """Object key derived from the SHA-256 of the content."""
+    return f"{folder}/{content_hash}.html"
+
+
+def _increment_ref(db: Session, key: str, content_hash: str, size: int) -> int:
+    """Atomically create the object row or bump its ref_count; returns the new count."""
+    insert = postgresql.insert if db.bind.dialect.name == 'postgresql' else sqlite.insert
+    stmt = (
+        insert(StoredObject)
+        .values(s3_key=key, content_hash=content_hash, size=size, ref_count=1)
+        .on_conflict_do_update(
+            index_elements=[StoredObject.s3_key],
+            set_={"ref_count": StoredObject.ref_count + 1}
+        )
+        .returning(StoredObject.ref_count)
+    )
+    return db.execute(stmt).scalar_one()
+
+
+def acquire_html(db: Session, html: str, folder: str) -> str:
+    """
+    Store HTML under a content-addressed key and take a reference to it.
+    The S3 PUT is skipped when an identical object is already stored.
+    Changes are committed by the caller together with the owning row.
+    """
+    body = html.encode('utf-8')
+    content_hash = hashlib.sha256(body).hexdigest()
+    key = content_key(content_hash, folder)
+    refs = _increment_ref(db, key, content_hash, len(body))
+    if refs == 1:
+        # Объект мог стоять в очереди на удаление после освобождения последней ссылки
+        cancel_delete(db, key)
+        s3_client.put_object(
+            object_key=key,
+            body=body,
+            content_type='text/html'
+        )
+    else:
+        logger.info(f"Reusing stored object '{key}' (refs={refs})")
+    return key
+
+
+def release_object(db: Session, key: str) -> None:
+    """
+    Drop a reference to the object. With the last one the S3 delete is queued
+    in the outbox, so it only happens if the caller's transaction commits.
+    """
+    obj = db.get(StoredObject, key, with_for_update=True)
+    if obj is None:
+        # Ключи, созданные до перехода на адресацию по содержимому, не разделяются
+        enqueue_delete(db, key)
+        return
+    obj.ref_count -= 1
+    if obj.ref_count <= 0:
+        db.delete(obj)
+        enqueue_delete(db, key)
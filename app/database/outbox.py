@@ -0,0 +1,234 @@
+"""
+Отложенное удаление объектов S3 (outbox) и сборщик осиротевших объектов.
+
+Удаление объекта записывается в s3_outbox в той же транзакции, что и
+изменение строк БД, и выполняется позже пачками через DeleteObjects.
+Сборщик сверяет содержимое бакета с таблицами и ставит в outbox объекты,
+на которые ничего не ссылается (например, загруженные перед упавшим коммитом).
+
+Запуск из каталога app:
+    python -m database.outbox process
+    python -m database.outbox reap [--prefix lessons/] [--dry-run]
+"""
+import os
+import sys
+import time
+import argparse
+import datetime
+import logging
+import threading
+from dotenv import load_dotenv
+from sqlalchemy import select, union
+from sqlalchemy.orm import Session
+
+# ---------------------------
+# Adjust imports for local vs Docker
+# ---------------------------
+root = os.path.abspath(os.path.join(os.path.dirname(__file__), '..'))
+if root not in sys.path:
+    sys.path.insert(0, root)
+
+try:
+    from database.database import S3Outbox, StoredObject, Lesson, Template, Document, session_scope
+except ImportError:
+    from database import S3Outbox, StoredObject, Lesson, Template, Document, session_scope
+
+try:
+    from database.s3.s3 import s3_client
+except ImportError:
+    from s3.s3 import s3_client
+
+# ---------------------------
+# Logging setup
+# ---------------------------
+load_dotenv()
+logging.basicConfig(
+    level=logging.INFO,
+    format="%(asctime)s [%(levelname)s] %(message)s"
+)
+logger = logging.getLogger(__name__)
+
+OUTBOX_BATCH_SIZE = int(os.getenv("OUTBOX_BATCH_SIZE", "1000"))
+OUTBOX_INTERVAL = float(os.getenv("OUTBOX_INTERVAL", "30"))
+OUTBOX_MAX_ATTEMPTS = int(os.getenv("OUTBOX_MAX_ATTEMPTS", "10"))
+# Объекты моложе этого возраста сборщик не трогает: их строка может быть ещё не закоммичена
+REAPER_GRACE_SECONDS = int(os.getenv("REAPER_GRACE_SECONDS", "3600"))
+REAPER_INTERVAL = float(os.getenv("REAPER_INTERVAL", "86400"))
+REAPER_PREFIXES = ["lessons/", "templates/", "documents/"]
+# Сколько ключей сверяется с БД за один запрос (как страница ListObjectsV2)
+REAPER_PAGE_SIZE = 1000
+
+# ---------------------------
+# Outbox
+# ---------------------------
+
+def enqueue_delete(db: Session, key: str) -> None:
+    """Запланировать удаление объекта; фиксируется коммитом вызывающего."""
+    db.add(S3Outbox(s3_key=key))
+
+
+def cancel_delete(db: Session, key: str) -> None:
+    """
+    Отменить запланированное удаление (объект снова используется).
+    На Postgres ждёт, пока обработчик outbox не закончит удаление этого ключа.
+    """
+    db.query(S3Outbox).filter(S3Outbox.s3_key == key).delete(synchronize_session=False)
+
+
+def _referenced_keys(db: Session, keys: list[str]) -> set[str]:
+    """Ключи из списка, на которые есть ссылки в БД."""
+    if not keys:
+        return set()
+    query = union(
+        select(StoredObject.s3_key).where(StoredObject.s3_key.in_(keys)),
+        select(Lesson.s3_key).where(Lesson.s3_key.in_(keys)),
+        select(Template.s3_key).where(Template.s3_key.in_(keys)),
+        select(Document.s3_key).where(Document.s3_key.in_(keys))
+    )
+    return set(db.execute(query).scalars())
+
+
+def process_outbox(batch_size: int = OUTBOX_BATCH_SIZE) -> int:
+    """
+    Удаляет из S3 одну пачку запланированных объектов. Объекты, на которые
+    к моменту обработки снова появилась ссылка, не удаляются.
+    Возвращает число обработанных записей.
+    """
+    now = datetime.datetime.utcnow()
+    with session_scope() as db:
+        # SKIP LOCKED: несколько процессов делят очередь, не мешая друг другу
+        rows = (
+            db.query(S3Outbox)
+            .filter(S3Outbox.not_before <= now, S3Outbox.attempts < OUTBOX_MAX_ATTEMPTS)
+            .order_by(S3Outbox.id)
+            .limit(batch_size)
+            .with_for_update(skip_locked=True)
+            .all()
+        )
+        if not rows:
+            return 0
+
+        keys = list(dict.fromkeys(row.s3_key for row in rows))
+        live = _referenced_keys(db, keys)
+        doomed = [key for key in keys if key not in live]
+        failed = set(s3_client.delete_objects(doomed)) if doomed else set()
+
+        for row in rows:
+            if row.s3_key in failed:
+                row.attempts += 1
+                row.last_error = "DeleteObjects failed"
+                row.not_before = now + datetime.timedelta(seconds=min(3600, 30 * 2 ** row.attempts))
+            else:
+                db.delete(row)
+        db.commit()
+
+    logger.info(
+        f"Outbox: {len(doomed) - len(failed)} objects deleted, {len(live)} still referenced, "
+        f"{len(failed)} failed"
+    )
+    return len(rows)
+
+
+def drain_outbox(batch_size: int = OUTBOX_BATCH_SIZE) -> int:
+    total = 0
+    while True:
+        processed = process_outbox(batch_size)
+        total += processed
+        if processed < batch_size:
+            return total
+
+# ---------------------------
+# Orphan reaper
+# ---------------------------
+
+def _pages(items, size: int):
+    page = []
+    for item in items:
+        page.append(item)
+        if len(page) >= size:
+            yield page
+            page = []
+    if page:
+        yield page
+
+
+def reap_orphans(
+    prefixes: list[str] = REAPER_PREFIXES,
+    grace_seconds: int = REAPER_GRACE_SECONDS,
+    dry_run: bool = False
+) -> dict:
+    """
+    Сверяет бакет с таблицами и ставит в outbox объекты старше grace_seconds,
+    на которые нет ссылок.
+    """
+    deadline = datetime.datetime.now(datetime.timezone.utc) - datetime.timedelta(seconds=grace_seconds)
+    stats = {"scanned": 0, "orphans": 0}
+    for prefix in prefixes:
+        for page in _pages(s3_client.iter_keys(prefix), REAPER_PAGE_SIZE):
+            candidates = [key for key, modified in page if modified < deadline]
+            stats["scanned"] += len(page)
+            if not candidates:
+                continue
+            with session_scope() as db:
+                live = _referenced_keys(db, candidates)
+                queued = set(
+                    db.execute(select(S3Outbox.s3_key).where(S3Outbox.s3_key.in_(candidates))).scalars()
+                )
+                orphans = [key for key in candidates if key not in live and key not in queued]
+                stats["orphans"] += len(orphans)
+                for key in orphans:
+                    logger.info(f"{'Would reap' if dry_run else 'Reaping'} orphan '{key}'")
+                    if not dry_run:
+                        enqueue_delete(db, key)
+                db.commit()
+    logger.info(f"Reaper: {stats}")
+    return stats
+
+# ---------------------------
+# Background worker
+# ---------------------------
+
+_worker = None
+_worker_lock = threading.Lock()
+
+
+def _worker_loop() -> None:
+    last_reap = time.monotonic()
+    while True:
+        time.sleep(OUTBOX_INTERVAL)
+        try:
+            drain_outbox()
+            if time.monotonic() - last_reap >= REAPER_INTERVAL:
+                last_reap = time.monotonic()
+                reap_orphans()
+        except Exception as e:
+            logger.error(f"Outbox worker error: {e}")
+
+
+def start_outbox_worker() -> None:
+    """Запускает фоновый поток обработки outbox (один на процесс)."""
+    global _worker
+    if _worker is not None or OUTBOX_INTERVAL <= 0:
+        return
+    with _worker_lock:
+        if _worker is None:
+            _worker = threading.Thread(target=_worker_loop, name="s3-outbox", daemon=True)
+            _worker.start()
+
+
+def main():
+    parser = argparse.ArgumentParser(description="S3 outbox and orphan reaper")
+    parser.add_argument("command", choices=["process", "reap"])
+    parser.add_argument("--prefix", action="append", default=None,
+                        help="Key prefix to reconcile (repeatable), default: lessons/, templates/, documents/")
+    parser.add_argument("--dry-run", action="store_true", help="Only report orphans")
+    args = parser.parse_args()
+
+    if args.command == "process":
+        logger.info(f"Outbox: {drain_outbox()} entries processed")
+        return
+    reap_orphans(args.prefix or REAPER_PREFIXES, dry_run=args.dry_run)
+
+
+if __name__ == "__main__":
+    main()
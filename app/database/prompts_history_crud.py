@@ -1,4 +1,6 @@
-from database import *
+import datetime
+from sqlalchemy.orm import Session
+from database.database import LessonPromptHistory
 
 # ----- История промптов (LessonPromptHistory) -----
 def create_lesson_prompt_history(db: Session, lesson_id: int, prompt_text: str) -> LessonPromptHistory:
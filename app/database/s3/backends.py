@@ -0,0 +1,171 @@
+import os
+import shutil
+import logging
+import datetime
+import tempfile
+import threading
+
+logger = logging.getLogger(__name__)
+
+
+class StorageBackend:
+    """
+    Хранилище объектов (HTML уроков и шаблонов, PDF). Реализации: S3Client,
+    LocalStorage и MemoryStorage; пакетные операции по умолчанию выражены
+    через одиночные.
+    """
+
+    supports_presigned_urls = False
+    compression_encoding = None
+    cache = None
+    max_workers = 1
+
+    def put_object(self, object_key: str, body: bytes | str, content_type: str = None, compress: bool = True) -> dict:
+        raise NotImplementedError
+
+    def get_object(self, object_key: str, use_cache: bool = True) -> bytes:
+        raise NotImplementedError
+
+    def delete_object(self, object_key: str) -> None:
+        raise NotImplementedError
+
+    def iter_keys(self, prefix: str = ""):
+        """Yields (key, last_modified) of stored objects under prefix; last_modified is UTC-aware."""
+        raise NotImplementedError
+
+    def delete_objects(self, object_keys) -> list[str]:
+        """Delete several objects; returns the keys that could not be deleted."""
+        failed = []
+        for key in object_keys:
+            try:
+                self.delete_object(key)
+            except Exception as e:
+                logger.error(f"Error deleting '{key}': {e}")
+                failed.append(key)
+        return failed
+
+    def presigned_url(self, object_key: str, expires_in: int = 300, content_type: str = None, expires_at: int = None) -> str:
+        raise NotImplementedError(f"{type(self).__name__} cannot issue presigned URLs")
+
+    def download_file(self, object_key: str, dest_path: str, chunk_size: int = 1024 * 1024) -> None:
+        with open(dest_path, "wb") as f:
+            f.write(self.get_object(object_key, use_cache=False))
+
+    def iter_many(self, object_keys, max_workers: int = None, use_cache: bool = True):
+        for key in object_keys:
+            yield key, self.get_object(key, use_cache)
+
+    def get_many(self, object_keys, max_workers: int = None) -> dict[str, bytes]:
+        return dict(self.iter_many(object_keys, max_workers))
+
+    def put_many(self, items, max_workers: int = None) -> list[dict]:
+        return [self.put_object(key, body, content_type) for key, body, content_type in items]
+
+    def upload_fileobj(self, fileobj, object_key: str, content_type: str = None, **kwargs) -> None:
+        self.put_object(object_key, fileobj.read(), content_type, compress=False)
+
+    def upload_file(self, src_path: str, object_key: str, content_type: str = None) -> None:
+        with open(src_path, "rb") as f:
+            self.upload_fileobj(f, object_key, content_type)
+
+
+class LocalStorage(StorageBackend):
+    """
+    Объекты — обычные несжатые файлы в каталоге root (ключ — относительный путь).
+    Для установок на одном сервере: без сетевых запросов, содержимое кэширует
+    страничный кэш ОС, файлы можно отдавать/отображать в память напрямую.
+    """
+
+    def __init__(self, root: str):
+        self.root = os.path.abspath(root)
+        os.makedirs(self.root, exist_ok=True)
+        logger.info(f"Local storage at '{self.root}'")
+
+    def path(self, object_key: str) -> str:
+        path = os.path.abspath(os.path.join(self.root, object_key))
+        if os.path.commonpath([path, self.root]) != self.root:
+            raise ValueError(f"Key '{object_key}' escapes the storage root")
+        return path
+
+    def _write(self, object_key: str, write) -> str:
+        # Запись во временный файл и атомарная замена: читатели не видят частичных файлов
+        path = self.path(object_key)
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        fd, tmp = tempfile.mkstemp(dir=os.path.dirname(path), prefix=".tmp-")
+        try:
+            with os.fdopen(fd, "wb") as f:
+                write(f)
+            os.replace(tmp, path)
+        except BaseException:
+            os.unlink(tmp)
+            raise
+        return path
+
+    def put_object(self, object_key: str, body: bytes | str, content_type: str = None, compress: bool = True) -> dict:
+        data = body.encode("utf-8") if isinstance(body, str) else body
+        self._write(object_key, lambda f: f.write(data))
+        logger.info(f"Put object '{object_key}', {len(data)} bytes stored")
+        return {}
+
+    def get_object(self, object_key: str, use_cache: bool = True) -> bytes:
+        with open(self.path(object_key), "rb") as f:
+            return f.read()
+
+    def delete_object(self, object_key: str) -> None:
+        try:
+            os.remove(self.path(object_key))
+            logger.info(f"Deleted '{object_key}'")
+        except FileNotFoundError:
+            pass
+
+    def iter_keys(self, prefix: str = ""):
+        for directory, _, files in os.walk(self.root):
+            for name in files:
+                if name.startswith(".tmp-"):
+                    continue
+                path = os.path.join(directory, name)
+                key = os.path.relpath(path, self.root).replace(os.sep, "/")
+                if key.startswith(prefix):
+                    mtime = os.stat(path).st_mtime
+                    yield key, datetime.datetime.fromtimestamp(mtime, datetime.timezone.utc)
+
+    def download_file(self, object_key: str, dest_path: str, chunk_size: int = 1024 * 1024) -> None:
+        # copyfile использует sendfile/copy_file_range и не гоняет данные через Python
+        shutil.copyfile(self.path(object_key), dest_path)
+
+    def upload_fileobj(self, fileobj, object_key: str, content_type: str = None, **kwargs) -> None:
+        self._write(object_key, lambda f: shutil.copyfileobj(fileobj, f, 1024 * 1024))
+
+    def upload_file(self, src_path: str, object_key: str, content_type: str = None) -> None:
+        with open(src_path, "rb") as src:
+            self.upload_fileobj(src, object_key, content_type)
+
+
+class MemoryStorage(StorageBackend):
+    """Объекты в словаре процесса: для тестов и бенчмарков, без сохранения между запусками."""
+
+    def __init__(self):
+        self._objects: dict[str, tuple[bytes, datetime.datetime]] = {}
+        self._lock = threading.Lock()
+
+    def put_object(self, object_key: str, body: bytes | str, content_type: str = None, compress: bool = True) -> dict:
+        data = body.encode("utf-8") if isinstance(body, str) else bytes(body)
+        with self._lock:
+            self._objects[object_key] = (data, datetime.datetime.now(datetime.timezone.utc))
+        return {}
+
+    def get_object(self, object_key: str, use_cache: bool = True) -> bytes:
+        with self._lock:
+            try:
+                return self._objects[object_key][0]
+            except KeyError:
+                raise KeyError(f"Object '{object_key}' not found") from None
+
+    def delete_object(self, object_key: str) -> None:
+        with self._lock:
+            self._objects.pop(object_key, None)
+
+    def iter_keys(self, prefix: str = ""):
+        with self._lock:
+            items = [(key, modified) for key, (_, modified) in self._objects.items() if key.startswith(prefix)]
+        yield from items
@@ -0,0 +1,171 @@
+import os
+import hashlib
+import logging
+import threading
+import tempfile
+
+from cachetools import TTLCache
+
+logger = logging.getLogger(__name__)
+
+
+class ObjectCache:
+    """
+    Процессный кэш содержимого объектов S3.
+
+    Ключи S3 в приложении не перезаписываются (при обновлении всегда создаётся
+    новый ключ), поэтому содержимое по ключу неизменно и его можно безопасно
+    переиспользовать между сессиями Streamlit.
+
+    Первый уровень — LRU в памяти с ограничением по суммарному размеру в байтах
+    и TTL, второй (необязательный) — каталог на диске.
+    """
+
+    def __init__(
+        self,
+        max_bytes: int,
+        ttl: int,
+        max_item_bytes: int = None,
+        disk_dir: str = None,
+        disk_max_bytes: int = None
+    ):
+        """
+        :param max_bytes: Суммарный размер объектов в памяти
+        :param ttl: Время жизни записи в памяти, секунд
+        :param max_item_bytes: (optional) Объекты крупнее не кэшируются в памяти
+        :param disk_dir: (optional) Каталог дискового уровня кэша
+        :param disk_max_bytes: (optional) Ограничение размера дискового уровня
+        """
+        self._memory = TTLCache(maxsize=max_bytes, ttl=ttl, getsizeof=len)
+        self._lock = threading.Lock()
+        self.max_item_bytes = min(max_item_bytes or max_bytes, max_bytes)
+
+        self.disk_dir = disk_dir
+        self.disk_max_bytes = disk_max_bytes
+        self._disk_bytes = 0
+        if disk_dir:
+            os.makedirs(disk_dir, exist_ok=True)
+            self._disk_bytes = sum(size for _, size, _ in self._scan_disk())
+
+        self.hits = 0
+        self.disk_hits = 0
+        self.misses = 0
+
+    # ---------------------------
+    # Public API
+    # ---------------------------
+    def get(self, key: str) -> bytes | None:
+        with self._lock:
+            data = self._memory.get(key)
+            if data is not None:
+                self.hits += 1
+                return data
+
+        data = self._disk_get(key)
+        with self._lock:
+            if data is None:
+                self.misses += 1
+                return None
+            self.disk_hits += 1
+            self._memory_put(key, data)
+        return data
+
+    def put(self, key: str, data: bytes) -> None:
+        with self._lock:
+            self._memory_put(key, data)
+        self._disk_put(key, data)
+
+    def invalidate(self, key: str) -> None:
+        with self._lock:
+            self._memory.pop(key, None)
+        if self.disk_dir:
+            path = self._disk_path(key)
+            try:
+                size = os.path.getsize(path)
+                os.remove(path)
+                with self._lock:
+                    self._disk_bytes -= size
+            except FileNotFoundError:
+                pass
+
+    def stats(self) -> dict:
+        with self._lock:
+            return {
+                "hits": self.hits,
+                "disk_hits": self.disk_hits,
+                "misses": self.misses,
+                "memory_items": len(self._memory),
+                "memory_bytes": self._memory.currsize,
+                "disk_bytes": self._disk_bytes,
+            }
+
+    # ---------------------------
+    # Memory tier
+    # ---------------------------
+    def _memory_put(self, key: str, data: bytes) -> None:
+        if len(data) > self.max_item_bytes:
+            return
+        self._memory[key] = data
+
+    # ---------------------------
+    # Disk tier
+    # ---------------------------
+    def _disk_path(self, key: str) -> str:
+        return os.path.join(self.disk_dir, hashlib.sha256(key.encode()).hexdigest())
+
+    def _disk_get(self, key: str) -> bytes | None:
+        if not self.disk_dir:
+            return None
+        try:
+            with open(self._disk_path(key), "rb") as f:
+                return f.read()
+        except FileNotFoundError:
+            return None
+        except OSError as e:
+            logger.warning(f"Disk cache read failed for '{key}': {e}")
+            return None
+
+    def _disk_put(self, key: str, data: bytes) -> None:
+        if not self.disk_dir:
+            return
+        if self.disk_max_bytes and len(data) > self.disk_max_bytes:
+            return
+        path = self._disk_path(key)
+        if os.path.exists(path):
+            return
+        try:
+            fd, tmp_path = tempfile.mkstemp(dir=self.disk_dir, suffix=".tmp")
+            with os.fdopen(fd, "wb") as f:
+                f.write(data)
+            os.replace(tmp_path, path)
+        except OSError as e:
+            logger.warning(f"Disk cache write failed for '{key}': {e}")
+            return
+
+        with self._lock:
+            self._disk_bytes += len(data)
+            over_limit = self.disk_max_bytes and self._disk_bytes > self.disk_max_bytes
+        if over_limit:
+            self._evict_disk()
+
+    def _scan_disk(self):
+        for entry in os.scandir(self.disk_dir):
+            if entry.is_file() and not entry.name.endswith(".tmp"):
+                stat = entry.stat()
+                yield entry.path, stat.st_size, stat.st_mtime
+
+    def _evict_disk(self) -> None:
+        """Удаляет самые старые файлы, пока кэш не займёт 90% лимита."""
+        files = sorted(self._scan_disk(), key=lambda item: item[2])
+        total = sum(size for _, size, _ in files)
+        target = int(self.disk_max_bytes * 0.9)
+        for path, size, _ in files:
+            if total <= target:
+                break
+            try:
+                os.remove(path)
+                total -= size
+            except OSError:
+                pass
+        with self._lock:
+            self._disk_bytes = total
@@ -0,0 +1,78 @@
+import gzip
+import zlib
+
+try:
+    import zstandard
+except ImportError:  # zstd is optional, gzip is always available
+    zstandard = None
+
+GZIP = "gzip"
+ZSTD = "zstd"
+
+# Типы содержимого, которые имеет смысл сжимать
+COMPRESSIBLE_TYPES = ("text/", "application/json", "application/javascript", "image/svg+xml")
+
+
+def available_encoding(preferred: str | None) -> str | None:
+    """Return the usable encoding for the configured one (zstd falls back to gzip)."""
+    if not preferred or preferred == "none":
+        return None
+    if preferred == ZSTD and zstandard is None:
+        return GZIP
+    return preferred
+
+
+def is_compressible(content_type: str | None) -> bool:
+    return bool(content_type) and content_type.startswith(COMPRESSIBLE_TYPES)
+
+
+def compress(data: bytes, encoding: str) -> bytes:
+    if encoding == GZIP:
+        return gzip.compress(data, compresslevel=6)
+    if encoding == ZSTD:
+        return zstandard.ZstdCompressor(level=10).compress(data)
+    raise ValueError(f"Unsupported encoding: {encoding}")
+
+
+def decompress(data: bytes, encoding: str | None) -> bytes:
+    if not encoding or encoding == "identity":
+        return data
+    if encoding == GZIP:
+        return gzip.decompress(data)
+    if encoding == ZSTD:
+        if zstandard is None:
+            raise RuntimeError("Object is zstd-encoded but the zstandard package is not installed")
+        return zstandard.ZstdDecompressor().decompress(data)
+    raise ValueError(f"Unsupported encoding: {encoding}")
+
+
+class _Identity:
+    def decompress(self, data: bytes) -> bytes:
+        return data
+
+    def flush(self) -> bytes:
+        return b""
+
+
+class _ZstdStream:
+    def __init__(self):
+        self._obj = zstandard.ZstdDecompressor().decompressobj()
+
+    def decompress(self, data: bytes) -> bytes:
+        return self._obj.decompress(data)
+
+    def flush(self) -> bytes:
+        return b""
+
+
+def stream_decompressor(encoding: str | None):
+    """Incremental decoder with decompress(chunk)/flush() for streamed downloads."""
+    if not encoding or encoding == "identity":
+        return _Identity()
+    if encoding == GZIP:
+        return zlib.decompressobj(16 + zlib.MAX_WBITS)
+    if encoding == ZSTD:
+        if zstandard is None:
+            raise RuntimeError("Object is zstd-encoded but the zstandard package is not installed")
+        return _ZstdStream()
+    raise ValueError(f"Unsupported encoding: {encoding}")
@@ -0,0 +1,82 @@
+"""
+Пережатие уже загруженных объектов S3.
+
+Запуск из каталога app:
+    python -m database.s3.recompress --prefix lessons/ --prefix templates/ [--dry-run]
+"""
+import os
+import sys
+import argparse
+import logging
+
+# ---------------------------
+# Adjust imports for local vs Docker
+# ---------------------------
+root = os.path.abspath(os.path.join(os.path.dirname(__file__), '..', '..'))
+if root not in sys.path:
+    sys.path.insert(0, root)
+
+from database.s3.s3 import s3_client, S3Client
+from database.s3 import compression
+
+logger = logging.getLogger(__name__)
+
+
+def recompress_prefix(prefix: str, dry_run: bool = False) -> dict:
+    """Compress every uncompressed text object under prefix in place."""
+    encoding = s3_client.compression_encoding
+    stats = {"scanned": 0, "recompressed": 0, "bytes_before": 0, "bytes_after": 0}
+    if not isinstance(s3_client.backend, S3Client):
+        logger.error("Recompression applies to the S3 storage backend only")
+        return stats
+    if not encoding:
+        logger.error("S3_COMPRESSION is disabled, nothing to do")
+        return stats
+
+    paginator = s3_client.client.get_paginator("list_objects_v2")
+    for page in paginator.paginate(Bucket=s3_client.bucket_name, Prefix=prefix):
+        for item in page.get("Contents", []):
+            key = item["Key"]
+            stats["scanned"] += 1
+            if item["Size"] < s3_client.compression_min_bytes:
+                continue
+
+            head = s3_client.client.head_object(Bucket=s3_client.bucket_name, Key=key)
+            if head.get("ContentEncoding") or not compression.is_compressible(head.get("ContentType")):
+                continue
+
+            raw = s3_client.client.get_object(Bucket=s3_client.bucket_name, Key=key)["Body"].read()
+            packed = compression.compress(raw, encoding)
+            stats["bytes_before"] += len(raw)
+            stats["bytes_after"] += len(packed)
+            if len(packed) >= len(raw):
+                continue
+
+            if not dry_run:
+                s3_client.client.put_object(
+                    Bucket=s3_client.bucket_name,
+                    Key=key,
+                    Body=packed,
+                    ContentType=head["ContentType"],
+                    ContentEncoding=encoding,
+                    Metadata=head.get("Metadata", {})
+                )
+            stats["recompressed"] += 1
+            logger.info(f"{'Would recompress' if dry_run else 'Recompressed'} '{key}': {len(raw)} -> {len(packed)} bytes")
+    return stats
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Recompress existing S3 objects")
+    parser.add_argument("--prefix", action="append", default=None,
+                        help="Key prefix to process (repeatable), default: lessons/ and templates/")
+    parser.add_argument("--dry-run", action="store_true", help="Only report what would change")
+    args = parser.parse_args()
+
+    for prefix in args.prefix or ["lessons/", "templates/"]:
+        stats = recompress_prefix(prefix, dry_run=args.dry_run)
+        logger.info(f"{prefix}: {stats}")
+
+
+if __name__ == "__main__":
+    main()
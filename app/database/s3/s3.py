@@ -1,10 +1,25 @@
 import os
+import time
 import logging
+import threading
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor
 from botocore.session import Session
 from botocore.config import Config
 from botocore.exceptions import ClientError
 from dotenv import load_dotenv
 
+try:
+    from database.s3.cache import ObjectCache
+    from database.s3 import compression
+    from database.s3.backends import StorageBackend, LocalStorage, MemoryStorage
+except ImportError:
+    from s3.cache import ObjectCache
+    from s3 import compression
+    from s3.backends import StorageBackend, LocalStorage, MemoryStorage
+
+from metrics import timed, register_gauges, S3_BYTES
+
 # Загрузка переменных окружения из .env
 load_dotenv()
 
@@ -15,14 +30,20 @@ logging.basicConfig(
 )
 logger = logging.getLogger(__name__)
 
-class S3Client:
+class S3Client(StorageBackend):
+    supports_presigned_urls = True
+
     def __init__(
         self,
         access_key: str,
         secret_key: str,
         endpoint_url: str,
         bucket_name: str,
-        region_name: str = None
+        region_name: str = None,
+        cache: ObjectCache = None,
+        compression_encoding: str = None,
+        compression_min_bytes: int = 1024,
+        max_workers: int = 8
     ):
         """
         :param access_key: AWS Access Key ID
@@ -30,12 +51,21 @@ class S3Client:
         :param endpoint_url: S3-compatible endpoint URL
         :param bucket_name: Name of the S3 bucket
         :param region_name: (optional) AWS region
+        :param cache: (optional) Shared cache for object contents
+        :param compression_encoding: (optional) 'gzip' or 'zstd' for text objects
+        :param compression_min_bytes: Smaller bodies are stored uncompressed
+        :param max_workers: Concurrency of batch and multipart operations
         """
         self.bucket_name = bucket_name
+        self.cache = cache
+        self.compression_encoding = compression.available_encoding(compression_encoding)
+        self.compression_min_bytes = compression_min_bytes
+        self.max_workers = max_workers
         # Создаем конфиг для отключения payload signing (избежать SHA256Mismatch) и SigV2
         self.client_config = Config(
             signature_version="s3",  # SigV2, не рассчитывает SHA256 тела
-            s3={"payload_signing_enabled": False}
+            s3={"payload_signing_enabled": False},
+            max_pool_connections=max(10, max_workers * 2)  # запас под параллельные операции
         )
         session = Session()
         client_kwargs = {
@@ -55,57 +85,347 @@ class S3Client:
         )
         logger.info("S3 client created with SigV2 and payload signing disabled.")
 
-    def put_object(self, object_key: str, body: bytes | str, content_type: str = None) -> dict:
-        """Upload arbitrary content to S3"""
+    def put_object(
+        self,
+        object_key: str,
+        body: bytes | str,
+        content_type: str = None,
+        compress: bool = True
+    ) -> dict:
+        """Upload arbitrary content to S3 (text bodies are compressed above the size threshold)"""
+        data = body.encode("utf-8") if isinstance(body, str) else body
         try:
             kwargs = {
                 "Bucket": self.bucket_name,
                 "Key": object_key,
-                "Body": body,
+                "Body": data,
             }
             if content_type:
                 kwargs["ContentType"] = content_type
-            resp = self.client.put_object(**kwargs)
+            if (
+                compress
+                and self.compression_encoding
+                and isinstance(data, bytes)
+                and len(data) >= self.compression_min_bytes
+                and compression.is_compressible(content_type)
+            ):
+                kwargs["Body"] = compression.compress(data, self.compression_encoding)
+                kwargs["ContentEncoding"] = self.compression_encoding
+            with timed("s3_put_object"):
+                resp = self.client.put_object(**kwargs)
             status = resp["ResponseMetadata"]["HTTPStatusCode"]
-            logger.info(f"Put object '{object_key}', HTTP {status}")
-            return resp
+            stored = len(kwargs["Body"]) if isinstance(kwargs["Body"], bytes) else None
+            if stored:
+                S3_BYTES.inc(stored, "upload")
+            logger.info(f"Put object '{object_key}', HTTP {status}, {stored} bytes stored")
         except ClientError as e:
             logger.error(f"Error putting object '{object_key}': {e}")
             raise
+        if self.cache and isinstance(data, bytes):
+            self.cache.put(object_key, data)
+        return resp
 
-    def get_object(self, object_key: str) -> bytes:
-        """Retrieve object content from S3 as bytes"""
+    def get_object(self, object_key: str, use_cache: bool = True) -> bytes:
+        """Retrieve object content from S3 as bytes (served from cache when possible)"""
+        if use_cache and self.cache:
+            data = self.cache.get(object_key)
+            if data is not None:
+                return data
         try:
-            resp = self.client.get_object(Bucket=self.bucket_name, Key=object_key)
-            data = resp["Body"].read()
-            logger.info(f"Retrieved '{object_key}', {len(data)} bytes")
-            return data
+            with timed("s3_get_object"):
+                resp = self.client.get_object(Bucket=self.bucket_name, Key=object_key)
+                raw = resp["Body"].read()
+            S3_BYTES.inc(len(raw), "download")
+            data = compression.decompress(raw, resp.get("ContentEncoding"))
+            logger.info(f"Retrieved '{object_key}', {len(raw)} bytes ({len(data)} decoded)")
         except ClientError as e:
             logger.error(f"Error retrieving '{object_key}': {e}")
             raise
+        if self.cache:
+            self.cache.put(object_key, data)
+        return data
+
+    def delete_object(self, object_key: str) -> None:
+        """Delete object from S3 and drop it from the cache"""
+        if self.cache:
+            self.cache.invalidate(object_key)
+        try:
+            self.client.delete_object(Bucket=self.bucket_name, Key=object_key)
+            logger.info(f"Deleted '{object_key}'")
+        except ClientError as e:
+            logger.error(f"Error deleting '{object_key}': {e}")
+            raise
 
-    def download_file(self, object_key: str, dest_path: str) -> None:
-        """Download S3 object to a local file"""
-        data = self.get_object(object_key)
+    def delete_objects(self, object_keys) -> list[str]:
+        """
+        Delete objects in batches of up to 1000 keys (DeleteObjects).
+        Returns the keys S3 failed to delete.
+        """
+        keys = list(object_keys)
+        failed = []
+        for start in range(0, len(keys), 1000):
+            batch = keys[start:start + 1000]
+            if self.cache:
+                for key in batch:
+                    self.cache.invalidate(key)
+            try:
+                with timed("s3_delete_objects"):
+                    resp = self.client.delete_objects(
+                        Bucket=self.bucket_name,
+                        Delete={"Objects": [{"Key": key} for key in batch], "Quiet": True}
+                    )
+            except ClientError as e:
+                logger.error(f"Error deleting {len(batch)} objects: {e}")
+                failed.extend(batch)
+                continue
+            errors = resp.get("Errors", [])
+            for error in errors:
+                logger.error(f"Error deleting '{error.get('Key')}': {error.get('Code')} {error.get('Message')}")
+            failed.extend(error["Key"] for error in errors)
+            logger.info(f"Deleted {len(batch) - len(errors)} objects")
+        return failed
+
+    def download_file(self, object_key: str, dest_path: str, chunk_size: int = 1024 * 1024) -> None:
+        """Stream S3 object to a local file chunk by chunk (decoded if compressed)"""
+        try:
+            resp = self.client.get_object(Bucket=self.bucket_name, Key=object_key)
+        except ClientError as e:
+            logger.error(f"Error retrieving '{object_key}': {e}")
+            raise
+        decoder = compression.stream_decompressor(resp.get("ContentEncoding"))
+        written = 0
         with open(dest_path, "wb") as f:
-            f.write(data)
-        logger.info(f"Downloaded '{object_key}' to '{dest_path}'")
+            for chunk in resp["Body"].iter_chunks(chunk_size):
+                S3_BYTES.inc(len(chunk), "download")
+                data = decoder.decompress(chunk)
+                f.write(data)
+                written += len(data)
+            tail = decoder.flush()
+            f.write(tail)
+            written += len(tail)
+        logger.info(f"Downloaded '{object_key}' to '{dest_path}', {written} bytes")
+
+    def presigned_url(
+        self,
+        object_key: str,
+        expires_in: int = 300,
+        content_type: str = "text/html; charset=utf-8",
+        expires_at: int = None
+    ) -> str:
+        """
+        Short-lived GET URL so the browser loads the object directly from S3.
+        Keys are immutable, so the response may be cached for expires_in seconds.
+        expires_at (unix time) sets an absolute expiry instead (to within a second).
+        """
+        sign_expires_in = expires_in if expires_at is None else expires_at - time.time()
+        params = {
+            "Bucket": self.bucket_name,
+            "Key": object_key,
+            "ResponseCacheControl": f"private, max-age={expires_in}, immutable",
+        }
+        if content_type:
+            params["ResponseContentType"] = content_type
+        return self.client.generate_presigned_url("get_object", Params=params, ExpiresIn=sign_expires_in)
+
+    def iter_keys(self, prefix: str = ""):
+        """Yields (key, last_modified) for every object under prefix"""
+        paginator = self.client.get_paginator("list_objects_v2")
+        for page in paginator.paginate(Bucket=self.bucket_name, Prefix=prefix):
+            for item in page.get("Contents", []):
+                yield item["Key"], item["LastModified"]
+
+    # ---------------------------
+    # Batch operations
+    # ---------------------------
+    def iter_many(self, object_keys, max_workers: int = None, use_cache: bool = True):
+        """
+        Yields (key, bytes) in input order, fetching concurrently with at most
+        max_workers requests in flight (memory stays bounded for long key lists).
+        """
+        workers = max_workers or self.max_workers
+        with ThreadPoolExecutor(max_workers=workers, thread_name_prefix="s3-get") as pool:
+            pending = deque()
+            for key in object_keys:
+                pending.append((key, pool.submit(self.get_object, key, use_cache)))
+                if len(pending) >= workers:
+                    done_key, future = pending.popleft()
+                    yield done_key, future.result()
+            while pending:
+                done_key, future = pending.popleft()
+                yield done_key, future.result()
+
+    def get_many(self, object_keys, max_workers: int = None) -> dict[str, bytes]:
+        """Fetch several objects concurrently"""
+        return dict(self.iter_many(object_keys, max_workers))
+
+    def put_many(self, items, max_workers: int = None) -> list[dict]:
+        """Upload (key, body, content_type) tuples concurrently"""
+        with ThreadPoolExecutor(max_workers=max_workers or self.max_workers, thread_name_prefix="s3-put") as pool:
+            futures = [
+                pool.submit(self.put_object, key, body, content_type)
+                for key, body, content_type in items
+            ]
+            return [future.result() for future in futures]
 
-# Инициализация глобального клиента из .env
+    # ---------------------------
+    # Multipart upload
+    # ---------------------------
+    def upload_fileobj(
+        self,
+        fileobj,
+        object_key: str,
+        content_type: str = None,
+        part_size: int = 8 * 1024 * 1024,
+        max_workers: int = None
+    ) -> None:
+        """
+        Upload a file-like object without reading it fully into memory.
+        Bodies smaller than one part go through put_object; larger ones use
+        multipart upload with parts sent concurrently.
+        """
+        first = fileobj.read(part_size)
+        if len(first) < part_size:
+            self.put_object(object_key, first, content_type, compress=False)
+            return
+
+        kwargs = {"Bucket": self.bucket_name, "Key": object_key}
+        if content_type:
+            kwargs["ContentType"] = content_type
+        upload_id = self.client.create_multipart_upload(**kwargs)["UploadId"]
+        workers = max_workers or self.max_workers
+
+        def upload_part(number: int, data: bytes) -> dict:
+            with timed("s3_upload_part"):
+                resp = self.client.upload_part(
+                    Bucket=self.bucket_name,
+                    Key=object_key,
+                    UploadId=upload_id,
+                    PartNumber=number,
+                    Body=data
+                )
+            S3_BYTES.inc(len(data), "upload")
+            return {"PartNumber": number, "ETag": resp["ETag"]}
+
+        parts = []
+        try:
+            with ThreadPoolExecutor(max_workers=workers, thread_name_prefix="s3-part") as pool:
+                pending = deque()
+                number, data = 1, first
+                while data:
+                    pending.append(pool.submit(upload_part, number, data))
+                    # Не держим в памяти больше частей, чем потоков
+                    if len(pending) >= workers:
+                        parts.append(pending.popleft().result())
+                    number += 1
+                    data = fileobj.read(part_size)
+                parts.extend(future.result() for future in pending)
+            self.client.complete_multipart_upload(
+                Bucket=self.bucket_name,
+                Key=object_key,
+                UploadId=upload_id,
+                MultipartUpload={"Parts": parts}
+            )
+            logger.info(f"Multipart upload '{object_key}' completed, {len(parts)} parts")
+        except Exception as e:
+            logger.error(f"Multipart upload '{object_key}' failed: {e}")
+            self.client.abort_multipart_upload(Bucket=self.bucket_name, Key=object_key, UploadId=upload_id)
+            raise
+
+    def upload_file(self, src_path: str, object_key: str, content_type: str = None) -> None:
+        """Upload a local file (multipart for large files)"""
+        with open(src_path, "rb") as f:
+            self.upload_fileobj(f, object_key, content_type)
+
+
+class LazyStorage:
+    """
+    Proxy that builds the configured backend on first use, so importing CRUD
+    modules needs neither credentials nor a network client.
+    """
+
+    def __init__(self, factory):
+        self._factory = factory
+        self._backend = None
+        self._lock = threading.Lock()
+
+    @property
+    def backend(self) -> StorageBackend:
+        if self._backend is None:
+            with self._lock:
+                if self._backend is None:
+                    self._backend = self._factory()
+        return self._backend
+
+    def __getattr__(self, name):
+        return getattr(self.backend, name)
+
+
+# Хранилище объектов: s3, local (каталог на диске) или memory (тесты, бенчмарки)
+STORAGE_BACKEND = os.getenv("STORAGE_BACKEND", "s3").lower()
+STORAGE_LOCAL_DIR = os.getenv("STORAGE_LOCAL_DIR", "/var/lib/kursor/objects")
+
+# Настройки S3 из .env
 S3_ACCESS_KEY = os.getenv("AWS_ACCESS_KEY_ID")
 S3_SECRET_KEY = os.getenv("AWS_SECRET_ACCESS_KEY")
 S3_ENDPOINT = os.getenv("S3_ENDPOINT_URL")
 S3_BUCKET = os.getenv("S3_BUCKET")
 S3_REGION = os.getenv("S3_REGION")
 
-if not all([S3_ACCESS_KEY, S3_SECRET_KEY, S3_ENDPOINT, S3_BUCKET]):
-    logger.error("Incomplete S3 configuration in .env")
-    raise RuntimeError("Missing S3 config variables")
+# Кэш содержимого объектов (общий для всех сессий процесса)
+S3_CACHE_MAX_BYTES = int(os.getenv("S3_CACHE_MAX_BYTES", str(64 * 1024 * 1024)))
+S3_CACHE_MAX_ITEM_BYTES = int(os.getenv("S3_CACHE_MAX_ITEM_BYTES", str(8 * 1024 * 1024)))
+S3_CACHE_TTL = int(os.getenv("S3_CACHE_TTL", "86400"))
+S3_CACHE_DIR = os.getenv("S3_CACHE_DIR")
+S3_CACHE_DISK_MAX_BYTES = int(os.getenv("S3_CACHE_DISK_MAX_BYTES", str(1024 * 1024 * 1024)))
 
-s3_client = S3Client(
-    access_key=S3_ACCESS_KEY,
-    secret_key=S3_SECRET_KEY,
-    endpoint_url=S3_ENDPOINT,
-    bucket_name=S3_BUCKET,
-    region_name=S3_REGION
-)
+# Сжатие текстовых объектов: gzip, zstd или none
+S3_COMPRESSION = os.getenv("S3_COMPRESSION", "gzip")
+S3_COMPRESSION_MIN_BYTES = int(os.getenv("S3_COMPRESSION_MIN_BYTES", "1024"))
+
+# Параллелизм пакетных и multipart-операций
+S3_MAX_WORKERS = int(os.getenv("S3_MAX_WORKERS", "8"))
+
+
+def _create_s3_client() -> S3Client:
+    if not all([S3_ACCESS_KEY, S3_SECRET_KEY, S3_ENDPOINT, S3_BUCKET]):
+        logger.error("Incomplete S3 configuration in .env")
+        raise RuntimeError("Missing S3 config variables")
+
+    client = S3Client(
+        access_key=S3_ACCESS_KEY,
+        secret_key=S3_SECRET_KEY,
+        endpoint_url=S3_ENDPOINT,
+        bucket_name=S3_BUCKET,
+        region_name=S3_REGION,
+        cache=ObjectCache(
+            max_bytes=S3_CACHE_MAX_BYTES,
+            ttl=S3_CACHE_TTL,
+            max_item_bytes=S3_CACHE_MAX_ITEM_BYTES,
+            disk_dir=S3_CACHE_DIR,
+            disk_max_bytes=S3_CACHE_DISK_MAX_BYTES
+        ) if S3_CACHE_MAX_BYTES > 0 else None,
+        compression_encoding=S3_COMPRESSION,
+        compression_min_bytes=S3_COMPRESSION_MIN_BYTES,
+        max_workers=S3_MAX_WORKERS
+    )
+    if client.cache:
+        register_gauges(
+            "kursor_s3_cache", "S3 object cache counters", client.cache.stats,
+            counters=("hits", "disk_hits", "misses")
+        )
+    return client
+
+
+def _create_storage() -> StorageBackend:
+    if STORAGE_BACKEND == "s3":
+        return _create_s3_client()
+    if STORAGE_BACKEND == "local":
+        return LocalStorage(STORAGE_LOCAL_DIR)
+    if STORAGE_BACKEND == "memory":
+        logger.warning("Using in-memory object storage, objects are lost on restart")
+        return MemoryStorage()
+    raise RuntimeError(f"Unknown STORAGE_BACKEND '{STORAGE_BACKEND}'")
+
+
+# Имя s3_client сохранено: все модули обращаются к хранилищу через него
+s3_client = LazyStorage(_create_storage)
@@ -1,6 +1,6 @@
 import os
 import sys
-import uuid
+import time
 import logging
 from dotenv import load_dotenv
 from sqlalchemy.orm import Session
@@ -16,10 +16,13 @@ if dir_root not in sys.path:
 
 try:
     from database.database import Template, User, SessionLocal
+    from database.objects_crud import acquire_html, release_object
 except ImportError:
     from app.database.database import Template, User, SessionLocal
+    from app.database.objects_crud import acquire_html, release_object
 
 from database.s3.s3 import s3_client
+from utils.template_meta import template_metadata
 
 # ---------------------------
 # Logging setup
@@ -38,32 +41,14 @@ def ensure_author(db: Session, author_id: int):
     if not db.get(User, author_id):
         raise ValueError(f"Author with id={author_id} not found in users table.")
 
-# ---------------------------
-# S3 helpers
-# ---------------------------
-def upload_html_to_s3(html: str, folder: str) -> str:
-    """Upload HTML string to S3 and return the generated object key."""
-    unique_id = uuid.uuid4()
-    key = f"{folder}/{unique_id}.html"
-    s3_client.put_object(
-        object_key=key,
-        body=html.encode('utf-8'),
-        content_type='text/html'
-    )
-    return key
-
-def delete_from_s3(key: str) -> None:
-    """Delete object by key from S3."""
-    s3_client.client.delete_object(Bucket=s3_client.bucket_name, Key=key)
-
 # ---------------------------
 # Templates CRUD
 # ---------------------------
 
 def create_template_with_s3(db: Session, title: str, author_id: int, html: str) -> Template:
     ensure_author(db, author_id)
-    s3_key = upload_html_to_s3(html, folder='templates')
-    tmpl = Template(title=title, author_id=author_id, s3_key=s3_key)
+    s3_key = acquire_html(db, html, folder='templates')
+    tmpl = Template(title=title, author_id=author_id, s3_key=s3_key, **template_metadata(html))
     db.add(tmpl)
     try:
         db.commit()
@@ -84,6 +69,49 @@ def list_templates_by_author(db: Session, author_id: int) -> list[Template]:
     return db.query(Template).filter_by(author_id=author_id).all()
 
 
+# id шаблона -> время неудачной попытки; такие шаблоны пропускаются до повтора
+_metadata_failures: dict[int, float] = {}
+TEMPLATE_METADATA_RETRY = 3600
+
+
+def ensure_template_metadata(db: Session, templates: list[Template]) -> None:
+    """
+    Compute metadata for templates created before it was stored (one S3 fetch each, once).
+    Best effort: an unreadable template keeps NULL metadata and is skipped
+    for TEMPLATE_METADATA_RETRY seconds; errors are logged, never raised.
+    """
+    now = time.monotonic()
+    missing = [
+        t for t in templates
+        if t.content_hash is None and now - _metadata_failures.get(t.id, -TEMPLATE_METADATA_RETRY) >= TEMPLATE_METADATA_RETRY
+    ]
+    if not missing:
+        return
+    computed = 0
+    for tmpl in missing:
+        try:
+            metadata = template_metadata(s3_client.get_object(tmpl.s3_key).decode('utf-8'))
+        except Exception as e:
+            logger.warning(f"Template id={tmpl.id} metadata skipped: {e}")
+            _metadata_failures[tmpl.id] = now
+            continue
+        for field, value in metadata.items():
+            setattr(tmpl, field, value)
+        _metadata_failures.pop(tmpl.id, None)
+        computed += 1
+    try:
+        db.commit()
+    except Exception as e:
+        db.rollback()
+        logger.error(f"Template metadata not saved: {e}")
+        computed = 0
+    # Коммит сбрасывает загруженные атрибуты, а шаблоны используются после закрытия сессии
+    for tmpl in templates:
+        db.refresh(tmpl)
+    if computed:
+        logger.info(f"Template metadata computed for {computed} templates")
+
+
 def update_template_with_s3(db: Session, template_id: int, **fields) -> Template | None:
     tmpl = get_template(db, template_id)
     if not tmpl:
@@ -91,8 +119,9 @@ def update_template_with_s3(db: Session, template_id: int, **fields) -> Template
     if 'html' in fields:
         new_html = fields.pop('html')
         old_key = tmpl.s3_key
-        tmpl.s3_key = upload_html_to_s3(new_html, folder='templates')
-        delete_from_s3(old_key)
+        tmpl.s3_key = acquire_html(db, new_html, folder='templates')
+        release_object(db, old_key)
+        fields.update(template_metadata(new_html))
     for k, v in fields.items():
         setattr(tmpl, k, v)
     db.commit()
@@ -105,7 +134,10 @@ def delete_template_with_s3(db: Session, template_id: int) -> None:
     tmpl = get_template(db, template_id)
     if not tmpl:
         return
-    delete_from_s3(tmpl.s3_key)
+    # Уроки удаляются каскадно вместе с шаблоном — освобождаем и их объекты
+    for lesson in tmpl.lessons:
+        release_object(db, lesson.s3_key)
+    release_object(db, tmpl.s3_key)
     db.delete(tmpl)
     db.commit()
     logger.info(f"Template id={template_id} deleted")
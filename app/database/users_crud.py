@@ -1,12 +1,25 @@
+import hashlib
 from database.database import User, SessionLocal
 from sqlalchemy.orm import Session
 from datetime import datetime
 
+
+def make_login_token(telegram_id) -> str:
+    """Токен постоянного входа, который хранится в cookie и в users.login_token."""
+    return hashlib.sha256(str(telegram_id).encode()).hexdigest()
+
+
 # ----- Пользователи (User) -----
 def create_user(db: Session, telegram_nick: str, telegram_id: str, password_hash: str, last_online: datetime = None) -> User:
     if last_online is None:
         last_online = datetime.utcnow()
-    user = User(telegram_nick=telegram_nick, telegram_id=telegram_id, password_hash=password_hash, last_online=last_online)
+    user = User(
+        telegram_nick=telegram_nick,
+        telegram_id=telegram_id,
+        password_hash=password_hash,
+        login_token=make_login_token(telegram_id),
+        last_online=last_online
+    )
     db.add(user)
     db.commit()
     db.refresh(user)
@@ -22,6 +35,9 @@ def get_user_by_telegram_id(db: Session, telegram_id: str) -> User:
 def get_user_by_nick(db: Session, telegram_nick: str) -> User:
     return db.query(User).filter(User.telegram_nick == telegram_nick).first()
 
+def get_user_id_by_login_token(db: Session, login_token: str) -> int | None:
+    return db.query(User.id).filter(User.login_token == login_token).scalar()
+
 
 def update_user(db: Session, user_id: int, **kwargs) -> User:
     user = get_user(db, user_id)
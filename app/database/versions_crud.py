@@ -0,0 +1,164 @@
+import os
+import json
+import zlib
+import hashlib
+import difflib
+from sqlalchemy.orm import Session
+
+from database.database import LessonVersion, LessonPromptHistory
+
+# Полный снимок хранится каждые N версий, между ними — дельты к предыдущей версии
+LESSON_SNAPSHOT_EVERY = int(os.getenv("LESSON_SNAPSHOT_EVERY", "10"))
+# Дельта больше этой доли от полного HTML сохраняется снимком
+LESSON_DELTA_MAX_RATIO = float(os.getenv("LESSON_DELTA_MAX_RATIO", "0.5"))
+
+
+# ----- Дельты -----
+def make_delta(old: str, new: str) -> list:
+    """
+    Построчная дельта old -> new: список операций
+    [0, i, j] — скопировать строки old[i:j], [1, lines] — вставить строки.
+    """
+    old_lines = old.splitlines(keepends=True)
+    new_lines = new.splitlines(keepends=True)
+    ops = []
+    matcher = difflib.SequenceMatcher(None, old_lines, new_lines, autojunk=False)
+    for tag, i1, i2, j1, j2 in matcher.get_opcodes():
+        if tag == 'equal':
+            ops.append([0, i1, i2])
+        elif j2 > j1:
+            ops.append([1, new_lines[j1:j2]])
+    return ops
+
+
+def apply_delta(old: str, delta: list) -> str:
+    old_lines = old.splitlines(keepends=True)
+    parts = []
+    for op in delta:
+        if op[0] == 0:
+            parts.extend(old_lines[op[1]:op[2]])
+        else:
+            parts.extend(op[1])
+    return "".join(parts)
+
+
+def _pack(value) -> bytes:
+    return zlib.compress(json.dumps(value, ensure_ascii=False).encode('utf-8'))
+
+
+def _unpack(payload: bytes):
+    return json.loads(zlib.decompress(payload).decode('utf-8'))
+
+
+# ----- Версии уроков (LessonVersion) -----
+def latest_version(db: Session, lesson_id: int) -> LessonVersion | None:
+    return (
+        db.query(LessonVersion)
+        .filter(LessonVersion.lesson_id == lesson_id)
+        .order_by(LessonVersion.version.desc())
+        .first()
+    )
+
+
+def list_lesson_versions(db: Session, lesson_id: int) -> list:
+    """(version, size, created_at, prompt_text, note) of a lesson, newest first."""
+    return (
+        db.query(
+            LessonVersion.version, LessonVersion.size, LessonVersion.created_at,
+            LessonPromptHistory.prompt_text, LessonVersion.note
+        )
+        .outerjoin(LessonPromptHistory, LessonVersion.prompt_history_id == LessonPromptHistory.id)
+        .filter(LessonVersion.lesson_id == lesson_id)
+        .order_by(LessonVersion.version.desc())
+        .all()
+    )
+
+
+def get_version_html(db: Session, lesson_id: int, version: int) -> str | None:
+    """Восстанавливает HTML версии: ближайший снимок и дельты после него."""
+    snapshot = (
+        db.query(LessonVersion.version)
+        .filter(
+            LessonVersion.lesson_id == lesson_id,
+            LessonVersion.version <= version,
+            LessonVersion.is_snapshot.is_(True)
+        )
+        .order_by(LessonVersion.version.desc())
+        .limit(1)
+        .scalar()
+    )
+    if snapshot is None:
+        return None
+    rows = (
+        db.query(LessonVersion.version, LessonVersion.is_snapshot, LessonVersion.payload)
+        .filter(
+            LessonVersion.lesson_id == lesson_id,
+            LessonVersion.version >= snapshot,
+            LessonVersion.version <= version
+        )
+        .order_by(LessonVersion.version)
+        .all()
+    )
+    if not rows or rows[-1].version != version:
+        return None
+    html = None
+    for row in rows:
+        value = _unpack(row.payload)
+        html = value if row.is_snapshot else apply_delta(html, value)
+    return html
+
+
+def record_version(
+    db: Session,
+    lesson_id: int,
+    html: str,
+    prompt_text: str = None,
+    previous_html: str = None,
+    note: str = None
+) -> LessonVersion | None:
+    """
+    Добавляет новую версию урока (и запись истории промптов, если передан prompt_text).
+    previous_html — HTML последней версии, если он уже известен вызывающему.
+    note — служебная пометка версии; в историю промптов не попадает.
+    Ничего не записывает, если HTML не изменился. Коммит — на стороне вызывающего.
+    """
+    content_hash = hashlib.sha256(html.encode('utf-8')).hexdigest()
+    last = latest_version(db, lesson_id)
+    if last is not None and last.content_hash == content_hash:
+        return None
+
+    history_id = None
+    if prompt_text:
+        history = LessonPromptHistory(lesson_id=lesson_id, prompt_text=prompt_text)
+        db.add(history)
+        db.flush()
+        history_id = history.id
+
+    number = last.version + 1 if last else 1
+    payload, is_snapshot = None, True
+    if last is not None and (number - 1) % LESSON_SNAPSHOT_EVERY != 0:
+        if previous_html is None:
+            previous_html = get_version_html(db, lesson_id, last.version)
+        if previous_html is not None:
+            delta = _pack(make_delta(previous_html, html))
+            full = _pack(html)
+            if len(delta) <= len(full) * LESSON_DELTA_MAX_RATIO:
+                payload, is_snapshot = delta, False
+            else:
+                payload = full
+    if payload is None:
+        payload = _pack(html)
+
+    version = LessonVersion(
+        lesson_id=lesson_id,
+        version=number,
+        prompt_history_id=history_id,
+        is_snapshot=is_snapshot,
+        payload=payload,
+        size=len(html.encode('utf-8')),
+        content_hash=content_hash,
+        note=note
+    )
+    db.add(version)
+    db.flush()
+    return version
@@ -0,0 +1,165 @@
+import os
+import re
+import time
+import zipfile
+import logging
+import uuid
+import threading
+from dotenv import load_dotenv
+
+from database.database import session_scope
+from database.lessons_crud import list_lesson_files_by_author, list_lesson_files_by_course
+from database.s3.s3 import s3_client
+
+# ---------------------------
+# Logging setup
+# ---------------------------
+load_dotenv()
+logging.basicConfig(
+    level=logging.INFO,
+    format="%(asctime)s [%(levelname)s] %(message)s"
+)
+logger = logging.getLogger(__name__)
+
+# Сколько объектов S3 скачивается параллельно при экспорте
+EXPORT_WORKERS = int(os.getenv("EXPORT_WORKERS", "8"))
+# Сколько секунд архив экспорта доступен для скачивания; более старые удаляются
+EXPORT_MAX_AGE = int(os.getenv("EXPORT_MAX_AGE", "3600"))
+EXPORT_FILE_PREFIX = "kursor-export-"
+# Архивы лежат в каталоге статики Streamlit (server.enableStaticServing)
+# и скачиваются браузером напрямую с диска
+EXPORT_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), "static", "exports")
+EXPORT_URL_PREFIX = "app/static/exports"
+
+
+def safe_filename(title: str, max_len: int = 60) -> str:
+    name = re.sub(r'[\\/:*?"<>|\s]+', "_", title or "").strip("._")
+    return name[:max_len] or "lesson"
+
+
+def lesson_entries(rows) -> list[tuple[str, str]]:
+    """(arcname, s3_key) for rows from list_lesson_files_by_author/by_course."""
+    entries = []
+    for row in rows:
+        name = f"{row.id}_{safe_filename(row.title)}.html"
+        module_title = getattr(row, "module_title", None)
+        if module_title is not None:
+            order = row.module_order if row.module_order is not None else 0
+            name = f"{order:02d}_{safe_filename(module_title)}/{name}"
+        entries.append((name, row.s3_key))
+    return entries
+
+
+class _ChunkSink:
+    """Write-only file object that collects zip output for streaming."""
+
+    def __init__(self):
+        self.chunks = []
+
+    def write(self, data) -> int:
+        self.chunks.append(bytes(data))
+        return len(data)
+
+    def flush(self):
+        pass
+
+    def drain(self) -> list[bytes]:
+        chunks, self.chunks = self.chunks, []
+        return chunks
+
+
+def iter_zip_chunks(entries, max_workers: int = EXPORT_WORKERS):
+    """Stream a ZIP of the given (arcname, s3_key) entries chunk by chunk."""
+    sink = _ChunkSink()
+    with zipfile.ZipFile(sink, mode="w", compression=zipfile.ZIP_DEFLATED) as archive:
+        names = [arcname for arcname, _ in entries]
+        fetched = s3_client.iter_many((key for _, key in entries), max_workers, use_cache=False)
+        for arcname, (_, data) in zip(names, fetched):
+            archive.writestr(arcname, data)
+            yield from sink.drain()
+    yield from sink.drain()
+    logger.info(f"Exported {len(entries)} lessons to ZIP")
+
+
+def write_zip(entries, fileobj, max_workers: int = EXPORT_WORKERS) -> None:
+    for chunk in iter_zip_chunks(entries, max_workers):
+        fileobj.write(chunk)
+
+
+def _export_path(token: str) -> str:
+    return os.path.join(EXPORT_DIR, f"{EXPORT_FILE_PREFIX}{token}.zip")
+
+
+def build_export(rows, max_workers: int = EXPORT_WORKERS) -> dict:
+    """
+    Пишет ZIP уроков в каталог статики Streamlit (фоновая задача). Файл отдаётся
+    браузеру по ссылке с диска, а не через память процесса; имя случайное.
+    Возвращает путь, URL и число уроков.
+    """
+    sweep_export_files(force=True)
+    token = uuid.uuid4().hex
+    path = _export_path(token)
+    tmp = path + ".part"
+    try:
+        with open(tmp, "wb") as f:
+            write_zip(lesson_entries(rows), f, max_workers)
+        os.replace(tmp, path)
+    except BaseException:
+        if os.path.exists(tmp):
+            os.remove(tmp)
+        raise
+    return {
+        "path": path,
+        "url": f"{EXPORT_URL_PREFIX}/{os.path.basename(path)}",
+        "count": len(rows),
+        "expires_at": time.time() + EXPORT_MAX_AGE,
+    }
+
+
+def export_author_lessons(author_id: int) -> dict:
+    with session_scope() as db:
+        rows = list_lesson_files_by_author(db, author_id)
+    return build_export(rows)
+
+
+def export_course_lessons(course_id: int) -> dict:
+    with session_scope() as db:
+        rows = list_lesson_files_by_course(db, course_id)
+    return build_export(rows)
+
+
+def remove_export(path: str | None) -> None:
+    if path and os.path.basename(path).startswith(EXPORT_FILE_PREFIX):
+        try:
+            os.remove(path)
+        except FileNotFoundError:
+            pass
+
+
+_swept = False
+_sweep_lock = threading.Lock()
+
+
+def sweep_export_files(max_age: int = EXPORT_MAX_AGE, force: bool = False) -> None:
+    """
+    Remove export archives older than max_age: once per process at startup
+    (force=False) and before each new export.
+    """
+    global _swept
+    if _swept and not force:
+        return
+    with _sweep_lock:
+        _swept = True
+        # Каталог статики должен существовать к первому запросу за архивом
+        os.makedirs(EXPORT_DIR, exist_ok=True)
+        deadline = time.time() - max_age
+        for name in os.listdir(EXPORT_DIR):
+            if not name.startswith(EXPORT_FILE_PREFIX):
+                continue
+            path = os.path.join(EXPORT_DIR, name)
+            try:
+                if os.path.getmtime(path) < deadline:
+                    os.remove(path)
+                    logger.info(f"Removed stale export '{path}'")
+            except OSError:
+                pass
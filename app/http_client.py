@@ -0,0 +1,177 @@
+import os
+import time
+import random
+import logging
+import threading
+import importlib.util
+from contextlib import contextmanager, ExitStack
+from dotenv import load_dotenv
+
+import httpx
+
+from metrics import timed
+
+# ---------------------------
+# Logging setup
+# ---------------------------
+load_dotenv()
+logging.basicConfig(
+    level=logging.INFO,
+    format="%(asctime)s [%(levelname)s] %(message)s"
+)
+logger = logging.getLogger(__name__)
+
+# ---------------------------
+# Configuration
+# ---------------------------
+GENERATION_API_URL = os.getenv("GENERATION_API_URL", "http://localhost:8000")
+HTTP_CONNECT_TIMEOUT = float(os.getenv("HTTP_CONNECT_TIMEOUT", "5"))
+HTTP_DEFAULT_TIMEOUT = float(os.getenv("HTTP_DEFAULT_TIMEOUT", "30"))
+GENERATION_TIMEOUT = float(os.getenv("GENERATION_TIMEOUT", "300"))
+HTTP_MAX_CONNECTIONS = int(os.getenv("HTTP_MAX_CONNECTIONS", "50"))
+HTTP_MAX_KEEPALIVE = int(os.getenv("HTTP_MAX_KEEPALIVE", "20"))
+HTTP_KEEPALIVE_EXPIRY = float(os.getenv("HTTP_KEEPALIVE_EXPIRY", "60"))
+HTTP_RETRIES = int(os.getenv("HTTP_RETRIES", "2"))
+HTTP_BACKOFF_BASE = float(os.getenv("HTTP_BACKOFF_BASE", "0.5"))
+HTTP_BACKOFF_MAX = float(os.getenv("HTTP_BACKOFF_MAX", "8"))
+
+# Таймаут чтения по эндпоинтам API генерации, секунд
+ENDPOINT_TIMEOUTS = {
+    "/generate_style/": GENERATION_TIMEOUT,
+    "/generate_content/": GENERATION_TIMEOUT,
+    "/generate_content_stream/": GENERATION_TIMEOUT,
+}
+
+# Ответы, после которых повторить можно любой запрос: сервер его не обрабатывал
+RETRY_STATUSES = {429, 503}
+# Ошибки, при которых запрос гарантированно не дошёл до обработчика
+RETRY_EXCEPTIONS = (httpx.ConnectError, httpx.ConnectTimeout, httpx.PoolTimeout)
+# Запрос мог дойти до сервера: повторяются только идемпотентные запросы,
+# иначе POST генерации выполнится (и будет оплачен) дважды
+IDEMPOTENT_RETRY_STATUSES = RETRY_STATUSES | {502, 504}
+IDEMPOTENT_RETRY_EXCEPTIONS = RETRY_EXCEPTIONS + (httpx.RemoteProtocolError,)
+IDEMPOTENT_METHODS = {"GET", "HEAD", "OPTIONS", "PUT", "DELETE"}
+
+
+class ApiClient:
+    """
+    Общий для процесса HTTP-клиент API генерации: пул соединений с keep-alive,
+    HTTP/2 при наличии пакета h2, таймауты по эндпоинтам и повтор запросов
+    с экспоненциальной задержкой и джиттером.
+    """
+
+    def __init__(
+        self,
+        base_url: str,
+        max_connections: int = HTTP_MAX_CONNECTIONS,
+        max_keepalive: int = HTTP_MAX_KEEPALIVE,
+        keepalive_expiry: float = HTTP_KEEPALIVE_EXPIRY,
+        retries: int = HTTP_RETRIES
+    ):
+        """
+        :param base_url: Base URL of the generation API
+        :param max_connections: Pool size
+        :param max_keepalive: Idle connections kept open
+        :param keepalive_expiry: Seconds an idle connection is kept
+        :param retries: Retry attempts after the first request
+        """
+        self.base_url = base_url.rstrip("/")
+        self.retries = retries
+        self._limits = httpx.Limits(
+            max_connections=max_connections,
+            max_keepalive_connections=max_keepalive,
+            keepalive_expiry=keepalive_expiry
+        )
+        self._client = None
+        self._lock = threading.Lock()
+
+    @property
+    def client(self) -> httpx.Client:
+        # Клиент создаётся при первом запросе, а не при импорте модуля
+        if self._client is None:
+            with self._lock:
+                if self._client is None:
+                    http2 = importlib.util.find_spec("h2") is not None
+                    self._client = httpx.Client(
+                        base_url=self.base_url,
+                        limits=self._limits,
+                        http2=http2,
+                        timeout=self.timeout_for(None)
+                    )
+                    logger.info(f"HTTP client created for {self.base_url} (http2={http2})")
+        return self._client
+
+    @staticmethod
+    def timeout_for(path: str | None) -> httpx.Timeout:
+        read = ENDPOINT_TIMEOUTS.get(path, HTTP_DEFAULT_TIMEOUT)
+        return httpx.Timeout(read, connect=HTTP_CONNECT_TIMEOUT)
+
+    def _backoff(self, attempt: int) -> None:
+        delay = random.uniform(0, min(HTTP_BACKOFF_MAX, HTTP_BACKOFF_BASE * 2 ** attempt))
+        time.sleep(delay)
+
+    @staticmethod
+    def _retry_policy(method: str, idempotent: bool | None) -> tuple[set, tuple]:
+        if idempotent is None:
+            idempotent = method.upper() in IDEMPOTENT_METHODS
+        if idempotent:
+            return IDEMPOTENT_RETRY_STATUSES, IDEMPOTENT_RETRY_EXCEPTIONS
+        return RETRY_STATUSES, RETRY_EXCEPTIONS
+
+    def request(self, method: str, path: str, idempotent: bool = None, **kwargs) -> httpx.Response:
+        """
+        Send a request with retries. Connection failures and 429/503 are always
+        retried; 502/504 and protocol errors only for idempotent requests
+        (by method, or idempotent=True for a POST that is safe to repeat).
+        """
+        with timed(f"http {method} {path}"):
+            return self._request(method, path, idempotent, **kwargs)
+
+    def _request(self, method: str, path: str, idempotent: bool = None, **kwargs) -> httpx.Response:
+        kwargs.setdefault("timeout", self.timeout_for(path))
+        retry_statuses, retry_exceptions = self._retry_policy(method, idempotent)
+        for attempt in range(self.retries + 1):
+            last = attempt == self.retries
+            try:
+                response = self.client.request(method, path, **kwargs)
+            except retry_exceptions as e:
+                if last:
+                    raise
+                logger.warning(f"{method} {path} failed ({e}), retry {attempt + 1}/{self.retries}")
+                self._backoff(attempt)
+                continue
+            if response.status_code in retry_statuses and not last:
+                logger.warning(f"{method} {path} HTTP {response.status_code}, retry {attempt + 1}/{self.retries}")
+                response.close()
+                self._backoff(attempt)
+                continue
+            return response
+
+    def post(self, path: str, **kwargs) -> httpx.Response:
+        return self.request("POST", path, **kwargs)
+
+    @contextmanager
+    def stream(self, method: str, path: str, idempotent: bool = None, **kwargs):
+        """Streaming request; only failures before a response arrives are retried (same policy as request)."""
+        kwargs.setdefault("timeout", self.timeout_for(path))
+        _, retry_exceptions = self._retry_policy(method, idempotent)
+        with ExitStack() as stack:
+            for attempt in range(self.retries + 1):
+                try:
+                    response = stack.enter_context(self.client.stream(method, path, **kwargs))
+                    break
+                except retry_exceptions as e:
+                    if attempt == self.retries:
+                        raise
+                    logger.warning(f"{method} {path} failed ({e}), retry {attempt + 1}/{self.retries}")
+                    self._backoff(attempt)
+            yield response
+
+    def close(self) -> None:
+        with self._lock:
+            if self._client is not None:
+                self._client.close()
+                self._client = None
+
+
+api_client = ApiClient(GENERATION_API_URL)
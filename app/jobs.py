@@ -0,0 +1,143 @@
+import os
+import time
+import uuid
+import logging
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from dotenv import load_dotenv
+
+# ---------------------------
+# Logging setup
+# ---------------------------
+load_dotenv()
+logging.basicConfig(
+    level=logging.INFO,
+    format="%(asctime)s [%(levelname)s] %(message)s"
+)
+logger = logging.getLogger(__name__)
+
+JOB_WORKERS = int(os.getenv("JOB_WORKERS", "8"))
+JOB_MAX_PER_USER = int(os.getenv("JOB_MAX_PER_USER", "2"))
+JOB_RETENTION_SECONDS = int(os.getenv("JOB_RETENTION_SECONDS", "900"))
+
+QUEUED = "queued"
+RUNNING = "running"
+DONE = "done"
+FAILED = "failed"
+
+_current = threading.local()
+
+
+class JobQueueFull(Exception):
+    """Пользователь превысил лимит одновременных задач."""
+
+
+class Job:
+    def __init__(self, user_id: int, name: str):
+        self.id = uuid.uuid4().hex
+        self.user_id = user_id
+        self.name = name
+        self.status = QUEUED
+        self.result = None
+        self.error = None
+        self.progress = None
+        self.created_at = time.time()
+        self.started_at = None
+        self.finished_at = None
+
+    @property
+    def finished(self) -> bool:
+        return self.status in (DONE, FAILED)
+
+    def __repr__(self):
+        return f"<Job(id={self.id}, name='{self.name}', user_id={self.user_id}, status='{self.status}')>"
+
+
+def report_progress(value) -> None:
+    """Сохраняет промежуточный результат текущей задачи (вызывается из рабочего потока)."""
+    job = getattr(_current, "job", None)
+    if job is not None:
+        job.progress = value
+
+
+class JobManager:
+    """
+    Фоновое выполнение долгих операций (генерация через LLM и т.п.).
+
+    Страницы отправляют задачу, получают её id и опрашивают статус на
+    следующих перезапусках скрипта, не блокируя поток Streamlit.
+    """
+
+    def __init__(self, max_workers: int, max_jobs_per_user: int, retention_seconds: int):
+        """
+        :param max_workers: Сколько задач выполняется одновременно
+        :param max_jobs_per_user: Лимит незавершённых задач одного пользователя
+        :param retention_seconds: Сколько хранить завершённые задачи
+        """
+        self.max_jobs_per_user = max_jobs_per_user
+        self.retention_seconds = retention_seconds
+        self._executor = ThreadPoolExecutor(max_workers=max_workers, thread_name_prefix="job")
+        self._jobs: dict[str, Job] = {}
+        self._lock = threading.Lock()
+
+    def submit(self, user_id: int, name: str, fn, *args, **kwargs) -> str:
+        """Ставит fn(*args, **kwargs) в очередь и возвращает id задачи."""
+        with self._lock:
+            self._prune()
+            pending = sum(
+                1 for j in self._jobs.values()
+                if j.user_id == user_id and not j.finished
+            )
+            if pending >= self.max_jobs_per_user:
+                raise JobQueueFull(f"User id={user_id} already has {pending} pending jobs")
+            job = Job(user_id, name)
+            self._jobs[job.id] = job
+
+        self._executor.submit(self._run, job, fn, args, kwargs)
+        logger.info(f"Job submitted {job}")
+        return job.id
+
+    def get(self, job_id: str | None) -> Job | None:
+        if not job_id:
+            return None
+        with self._lock:
+            return self._jobs.get(job_id)
+
+    def discard(self, job_id: str | None) -> None:
+        """Удаляет завершённую задачу, результат которой уже получен."""
+        with self._lock:
+            job = self._jobs.get(job_id)
+            if job and job.finished:
+                del self._jobs[job_id]
+
+    def _run(self, job: Job, fn, args, kwargs) -> None:
+        job.status = RUNNING
+        job.started_at = time.time()
+        _current.job = job
+        try:
+            job.result = fn(*args, **kwargs)
+            job.status = DONE
+        except Exception as e:
+            logger.error(f"Job {job.id} ({job.name}) failed: {e}")
+            job.error = str(e)
+            job.status = FAILED
+        finally:
+            _current.job = None
+            job.finished_at = time.time()
+            logger.info(f"Job finished {job} in {job.finished_at - job.started_at:.2f}s")
+
+    def _prune(self) -> None:
+        deadline = time.time() - self.retention_seconds
+        expired = [
+            job_id for job_id, job in self._jobs.items()
+            if job.finished and job.finished_at < deadline
+        ]
+        for job_id in expired:
+            del self._jobs[job_id]
+
+
+job_manager = JobManager(
+    max_workers=JOB_WORKERS,
+    max_jobs_per_user=JOB_MAX_PER_USER,
+    retention_seconds=JOB_RETENTION_SECONDS
+)
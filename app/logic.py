@@ -1,12 +1,14 @@
 import os
 import sys
+import hashlib
+import time
 import uuid
+import threading
+from concurrent.futures import Future
 import logging
 from dotenv import load_dotenv
 from sqlalchemy.orm import Session
 
-# HTTP clients
-import requests
 import httpx
 
 # ---------------------------
@@ -17,11 +19,19 @@ if dir_root not in sys.path:
     sys.path.insert(0, dir_root)
 
 try:
-    from database.database import SessionLocal
+    from database.database import session_scope
     from database.templates_crud import list_templates_by_author, create_template_with_s3
+    from database.generation_cache_crud import get_cached_generation, store_generation
+    from http_client import api_client
+    from metrics import timed
+    from utils.sse import iter_lesson_fragments, StreamError
 except ImportError:
-    from app.database.database import SessionLocal
+    from app.database.database import session_scope
     from app.database.templates_crud import list_templates_by_author, create_template_with_s3
+    from app.database.generation_cache_crud import get_cached_generation, store_generation
+    from app.http_client import api_client
+    from app.metrics import timed
+    from app.utils.sse import iter_lesson_fragments, StreamError
 
 
 # ---------------------------
@@ -34,68 +44,278 @@ logging.basicConfig(
 )
 logger = logging.getLogger(__name__)
 
+# Потоковая генерация урока (при отсутствии эндпоинта — обычный запрос)
+GENERATION_STREAMING = os.getenv("GENERATION_STREAMING", "1") == "1"
+# Как часто (секунды) передавать накопленный HTML в on_chunk при потоковой генерации
+STREAM_REPORT_INTERVAL = float(os.getenv("STREAM_REPORT_INTERVAL", "0.25"))
+# Кэш результатов генерации по (эндпоинт, запрос, шаблон)
+GENERATION_CACHE_ENABLED = os.getenv("GENERATION_CACHE_ENABLED", "1") == "1"
+GENERATION_CACHE_TTL = int(os.getenv("GENERATION_CACHE_TTL", str(7 * 24 * 3600)))
+GENERATION_CACHE_MAX_ENTRIES = int(os.getenv("GENERATION_CACHE_MAX_ENTRIES", "5000"))
+
 # ---------------------------
-# AI generation helpers
+# Generation API requests
 # ---------------------------
 
-def generate_style_sample(style_prompt: str, structure_prompt: str = None) -> str:
+class GenerationError(Exception):
+    """API генерации ответил без результата."""
+
+
+def _request_style(style_prompt: str, structure_prompt: str = None) -> str:
     payload = {
         "style": f"Запрос оформления: {style_prompt}, Запрос структуризации: {structure_prompt}",
     }
-    try:
-        response = requests.post("http://localhost:8000/generate_style/", json=payload)
+    response = api_client.post("/generate_style/", json=payload)
+    response.raise_for_status()
+    data = response.json()
+    html = data.get("html_code", "")
+    if not html:
+        error = data.get("error", "No HTML returned.")
+        logger.error(f"Style API error: {error}")
+        raise GenerationError(error)
+    return html
+
+
+def _lesson_payload(selected_style: str, lesson_prompt: str, context: str = None) -> dict:
+    payload = {"content": lesson_prompt, "html_code": selected_style}
+    if context:
+        # Текст из загруженного PDF, на который опирается урок
+        payload["context"] = context
+    return payload
+
+
+def _request_lesson(selected_style: str, lesson_prompt: str, context: str = None) -> str:
+    payload = _lesson_payload(selected_style, lesson_prompt, context)
+    response = api_client.post("/generate_content/", json=payload)
+    response.raise_for_status()
+    lesson = response.json().get("lesson", "")
+    if not lesson:
+        raise GenerationError("No lesson content returned.")
+    return lesson
+
+
+def _iter_stream_fragments(response: httpx.Response):
+    """Yields HTML fragments from an SSE or plain chunked response."""
+    if response.headers.get("content-type", "").startswith("text/event-stream"):
+        try:
+            yield from iter_lesson_fragments(response.iter_lines())
+        except StreamError as e:
+            raise GenerationError(str(e)) from None
+    else:
+        yield from response.iter_text()
+
+
+def _stream_lesson(selected_style: str, lesson_prompt: str, on_chunk=None, context: str = None) -> str:
+    payload = _lesson_payload(selected_style, lesson_prompt, context)
+    parts = []
+    last_report = 0.0
+    with api_client.stream("POST", "/generate_content_stream/", json=payload) as response:
+        if response.status_code in (404, 405):
+            logger.info("Streaming endpoint unavailable, falling back to generate_lesson")
+            return _request_lesson(selected_style, lesson_prompt, context)
         response.raise_for_status()
-        data = response.json()
-        html = data.get("html_code", "")
-        if not html:
-            error = data.get("error", "No HTML returned.")
-            logger.error(f"Style API error: {error}")
-            return f"<p>Error: {error}</p>"
+        for fragment in _iter_stream_fragments(response):
+            if not fragment:
+                continue
+            parts.append(fragment)
+            # Накопленный HTML собирается не чаще раза в STREAM_REPORT_INTERVAL,
+            # иначе склейка на каждом токене квадратична по длине урока
+            if on_chunk and time.monotonic() - last_report >= STREAM_REPORT_INTERVAL:
+                last_report = time.monotonic()
+                on_chunk("".join(parts))
+    if not parts:
+        raise GenerationError("No lesson content returned.")
+    html = "".join(parts)
+    if on_chunk:
+        on_chunk(html)
+    return html
+
+# ---------------------------
+# Request coalescing
+# ---------------------------
+
+class SingleFlight:
+    """
+    Одновременные вызовы с одинаковым ключом выполняются один раз:
+    первый вызывающий делает запрос, остальные ждут и получают его результат.
+    """
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._calls: dict[str, Future] = {}
+
+    def do(self, key: str, fn):
+        with self._lock:
+            future = self._calls.get(key)
+            leader = future is None
+            if leader:
+                future = Future()
+                self._calls[key] = future
+        if not leader:
+            logger.info(f"Joining in-flight generation {key[:12]}")
+            return future.result()
+
+        try:
+            result = fn()
+        except BaseException as e:
+            future.set_exception(e)
+            raise
+        else:
+            future.set_result(result)
+            return result
+        finally:
+            with self._lock:
+                del self._calls[key]
+
+
+_generation_flight = SingleFlight()
+
+# ---------------------------
+# Generation result cache
+# ---------------------------
+
+def _normalize_prompt(text: str | None) -> str:
+    return " ".join((text or "").split()).casefold()
+
+
+def generation_cache_key(endpoint: str, *prompts: str | None, template_html: str = None) -> str:
+    """sha256 of (endpoint, normalized prompts, template content hash)."""
+    template_hash = hashlib.sha256(template_html.encode("utf-8")).hexdigest() if template_html else ""
+    parts = [endpoint, *(_normalize_prompt(p) for p in prompts), template_hash]
+    return hashlib.sha256("\x1f".join(parts).encode("utf-8")).hexdigest()
+
+
+def _lesson_cache_key(selected_style: str, lesson_prompt: str, context: str = None) -> str:
+    # Без контекста ключ совпадает с прежним, чтобы не терять накопленный кэш
+    prompts = (lesson_prompt, context) if context else (lesson_prompt,)
+    return generation_cache_key("/generate_content/", *prompts, template_html=selected_style)
+
+
+def _cache_lookup(key: str) -> str | None:
+    try:
+        with session_scope() as db:
+            return get_cached_generation(db, key, GENERATION_CACHE_TTL)
+    except Exception as e:
+        logger.warning(f"Generation cache lookup failed: {e}")
+        return None
+
+
+def _cache_store(key: str, endpoint: str, html: str) -> None:
+    try:
+        with session_scope() as db:
+            store_generation(db, key, endpoint, html, GENERATION_CACHE_TTL, GENERATION_CACHE_MAX_ENTRIES)
+    except Exception as e:
+        logger.warning(f"Generation cache store failed: {e}")
+
+
+def _cached_generation(key: str, endpoint: str, produce, regenerate: bool = False) -> str:
+    """
+    Returns the cached result for key or calls produce() and caches its result.
+    Identical concurrent calls share a single produce() via single-flight.
+    """
+    if GENERATION_CACHE_ENABLED and not regenerate:
+        cached = _cache_lookup(key)
+        if cached is not None:
+            logger.info(f"Generation cache hit for {endpoint}")
+            return cached
+
+    def produce_and_store() -> str:
+        html = produce()
+        if GENERATION_CACHE_ENABLED:
+            _cache_store(key, endpoint, html)
         return html
+
+    return _generation_flight.do(key, produce_and_store)
+
+# ---------------------------
+# AI generation helpers
+# ---------------------------
+
+@timed("generate_style_sample")
+def generate_style_html(style_prompt: str, structure_prompt: str = None, regenerate: bool = False) -> str:
+    """Same as generate_style_sample, but raises on failure instead of returning error HTML."""
+    key = generation_cache_key("/generate_style/", style_prompt, structure_prompt)
+    return _cached_generation(
+        key, "/generate_style/",
+        lambda: _request_style(style_prompt, structure_prompt),
+        regenerate
+    )
+
+
+def generate_style_sample(style_prompt: str, structure_prompt: str = None, regenerate: bool = False) -> str:
+    try:
+        return generate_style_html(style_prompt, structure_prompt, regenerate)
     except Exception as e:
         logger.error(f"generate_style_sample failed: {e}")
         return f"<p>Generation error: {e}</p>"
 
 
-def generate_lesson(selected_style: str, lesson_prompt: str) -> str:
-    url = "http://localhost:8000/generate_content/"
-    payload = {"content": lesson_prompt, "html_code": selected_style}
+@timed("generate_lesson")
+def generate_lesson_html(
+    selected_style: str,
+    lesson_prompt: str,
+    regenerate: bool = False,
+    context: str = None
+) -> str:
+    """Same as generate_lesson, but raises on failure instead of returning error HTML."""
+    key = _lesson_cache_key(selected_style, lesson_prompt, context)
+    return _cached_generation(
+        key, "/generate_content/",
+        lambda: _request_lesson(selected_style, lesson_prompt, context),
+        regenerate
+    )
+
+
+def generate_lesson(selected_style: str, lesson_prompt: str, regenerate: bool = False, context: str = None) -> str:
     try:
-        response = requests.post(url, json=payload)
-        response.raise_for_status()
-        lesson = response.json().get("lesson", "")
-        return lesson or "<p>No lesson content returned.</p>"
+        return generate_lesson_html(selected_style, lesson_prompt, regenerate, context)
     except Exception as e:
         logger.error(f"generate_lesson failed: {e}")
         return f"<div>Error generating lesson: {e}</div>"
 
 
-async def pdf_upload(user_id: int,
-                     pdf_file,
-                     url: str = "http://localhost:8000/upload_pdf/") -> dict:
+def generate_lesson_stream_html(
+    selected_style: str,
+    lesson_prompt: str,
+    on_chunk=None,
+    regenerate: bool = False,
+    context: str = None
+) -> str:
     """
-    Асинхронно загружает PDF-файл на указанный сервер.
+    Генерирует урок потоково: on_chunk вызывается с накопленным HTML
+    по мере поступления фрагментов. Возвращает итоговый HTML, при ошибке
+    выбрасывает исключение (для фоновых задач: оно попадает в job.error).
+    Потоковый и обычный результаты взаимозаменяемы и кэшируются под одним ключом.
+    context — необязательный текст-источник (например, из загруженного PDF).
     """
+    if not GENERATION_STREAMING:
+        return generate_lesson_html(selected_style, lesson_prompt, regenerate, context)
+
+    key = _lesson_cache_key(selected_style, lesson_prompt, context)
+    with timed("generate_lesson_stream"):
+        return _cached_generation(
+            key, "/generate_content/",
+            lambda: _stream_lesson(selected_style, lesson_prompt, on_chunk, context),
+            regenerate
+        )
+
+
+def generate_lesson_stream(
+    selected_style: str,
+    lesson_prompt: str,
+    on_chunk=None,
+    regenerate: bool = False,
+    context: str = None
+) -> str:
+    """Same as generate_lesson_stream_html, but returns error HTML instead of raising."""
     try:
-        pdf_content = pdf_file.getvalue()
-        files = {"pdf_file": (pdf_file.name, pdf_content, pdf_file.type)}
-        headers = {"user_id": str(user_id)}
-        async with httpx.AsyncClient(timeout=30) as client:
-            resp = await client.post(url, headers=headers, files=files)
-            resp.raise_for_status()
-            try:
-                return resp.json()
-            except ValueError:
-                return {"success": False, "message": "Non-JSON response"}
+        return generate_lesson_stream_html(selected_style, lesson_prompt, on_chunk, regenerate, context)
     except Exception as e:
-        logger.error(f"pdf_upload error: {e}")
-        return {"success": False, "message": str(e)}
+        logger.error(f"generate_lesson_stream failed: {e}")
+        return f"<div>Error generating lesson: {e}</div>"
 
 
 def get_styles(user_id: int) -> list:
     """Возвращает список шаблонов пользователя из БД"""
-    db = SessionLocal()
-    try:
+    with session_scope() as db:
         return list_templates_by_author(db, user_id)
-    finally:
-        db.close()
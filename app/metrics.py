@@ -0,0 +1,264 @@
+import os
+import time
+import logging
+import threading
+from bisect import bisect_left
+from contextlib import ContextDecorator
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from dotenv import load_dotenv
+
+# ---------------------------
+# Logging setup
+# ---------------------------
+load_dotenv()
+logging.basicConfig(
+    level=logging.INFO,
+    format="%(asctime)s [%(levelname)s] %(message)s"
+)
+logger = logging.getLogger(__name__)
+
+# Порт HTTP-эндпоинта /metrics (0 — не запускать). Эндпоинт без аутентификации,
+# поэтому по умолчанию слушает только localhost
+METRICS_PORT = int(os.getenv("METRICS_PORT", "9100"))
+METRICS_ADDR = os.getenv("METRICS_ADDR", "127.0.0.1")
+
+LATENCY_BUCKETS = (0.001, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30, 60, 120, 300)
+
+# ---------------------------
+# Metric types
+# ---------------------------
+
+def _escape(value) -> str:
+    return str(value).replace("\\", "\\\\").replace("\n", "\\n").replace('"', '\\"')
+
+
+def _format_labels(names: tuple, values: tuple, extra: str = None) -> str:
+    parts = [f'{name}="{_escape(value)}"' for name, value in zip(names, values)]
+    if extra:
+        parts.append(extra)
+    return "{" + ",".join(parts) + "}" if parts else ""
+
+
+class Counter:
+    def __init__(self, name: str, help_text: str, labels: tuple = ()):
+        self.name = name
+        self.help = help_text
+        self.labels = labels
+        self._values: dict[tuple, float] = {}
+        self._lock = threading.Lock()
+
+    def inc(self, amount: float = 1, *label_values) -> None:
+        with self._lock:
+            self._values[label_values] = self._values.get(label_values, 0) + amount
+
+    def render(self) -> list[str]:
+        lines = [f"# HELP {self.name} {self.help}", f"# TYPE {self.name} counter"]
+        with self._lock:
+            for values, total in sorted(self._values.items()):
+                lines.append(f"{self.name}{_format_labels(self.labels, values)} {total}")
+        return lines
+
+
+class Histogram:
+    def __init__(self, name: str, help_text: str, labels: tuple = (), buckets: tuple = LATENCY_BUCKETS):
+        self.name = name
+        self.help = help_text
+        self.labels = labels
+        self.buckets = tuple(buckets)
+        # label values -> [counts per bucket..., +Inf count, sum]
+        self._series: dict[tuple, list] = {}
+        self._lock = threading.Lock()
+
+    def observe(self, value: float, *label_values) -> None:
+        index = bisect_left(self.buckets, value)
+        with self._lock:
+            series = self._series.get(label_values)
+            if series is None:
+                series = self._series[label_values] = [0] * (len(self.buckets) + 1) + [0.0]
+            series[index] += 1
+            series[-1] += value
+
+    def render(self) -> list[str]:
+        lines = [f"# HELP {self.name} {self.help}", f"# TYPE {self.name} histogram"]
+        with self._lock:
+            snapshot = {values: list(series) for values, series in self._series.items()}
+        for values, series in sorted(snapshot.items()):
+            cumulative = 0
+            for bound, count in zip(self.buckets + ("+Inf",), series[:-1]):
+                cumulative += count
+                le = f'le="{bound}"'
+                lines.append(f"{self.name}_bucket{_format_labels(self.labels, values, le)} {cumulative}")
+            lines.append(f"{self.name}_sum{_format_labels(self.labels, values)} {series[-1]}")
+            lines.append(f"{self.name}_count{_format_labels(self.labels, values)} {cumulative}")
+        return lines
+
+
+class GaugeCallback:
+    """
+    Values read on each scrape from fn() -> {name: value}. Keys listed in
+    counters are monotonic and exported as counters (name suffixed _total).
+    """
+
+    def __init__(self, prefix: str, help_text: str, fn, counters: tuple = ()):
+        self.prefix = prefix
+        self.help = help_text
+        self.fn = fn
+        self.counters = set(counters)
+
+    def render(self) -> list[str]:
+        try:
+            values = self.fn()
+        except Exception as e:
+            logger.warning(f"Metrics collector {self.prefix} failed: {e}")
+            return []
+        lines = []
+        for key, value in values.items():
+            if value is None:
+                continue
+            name = f"{self.prefix}_{key}"
+            kind = "gauge"
+            if key in self.counters:
+                kind = "counter"
+                if not name.endswith("_total"):
+                    name += "_total"
+            lines += [f"# HELP {name} {self.help}", f"# TYPE {name} {kind}", f"{name} {value}"]
+        return lines
+
+
+_registry: list = []
+_registry_lock = threading.Lock()
+# fn(kind, name, seconds) для каждого замера; kind — "operation" или "sql"
+_listeners: list = []
+
+
+def add_listener(fn) -> None:
+    """Subscribe to every observation (used by per-rerun profiling)."""
+    _listeners.append(fn)
+
+
+def _notify(kind: str, name: str, seconds: float) -> None:
+    for fn in _listeners:
+        fn(kind, name, seconds)
+
+
+def _register(metric):
+    with _registry_lock:
+        _registry.append(metric)
+    return metric
+
+
+def register_gauges(prefix: str, help_text: str, fn, counters: tuple = ()) -> None:
+    _register(GaugeCallback(prefix, help_text, fn, counters))
+
+
+def render_prometheus() -> str:
+    with _registry_lock:
+        metrics = list(_registry)
+    lines = []
+    for metric in metrics:
+        lines.extend(metric.render())
+    return "\n".join(lines) + "\n"
+
+# ---------------------------
+# Application metrics
+# ---------------------------
+
+OPERATION_SECONDS = _register(Histogram(
+    "kursor_operation_seconds", "Duration of instrumented operations", ("operation", "status")
+))
+SQL_QUERIES = _register(Counter("kursor_sql_queries_total", "SQL statements executed", ("statement",)))
+SQL_SECONDS = _register(Histogram("kursor_sql_query_seconds", "SQL statement duration", ("statement",)))
+S3_BYTES = _register(Counter("kursor_s3_bytes_total", "Bytes transferred to/from S3 (as stored)", ("direction",)))
+
+
+class timed(ContextDecorator):
+    """
+    Records the duration of a block or function in kursor_operation_seconds:
+        @timed("generate_lesson")
+        def ...
+        with timed("s3_get"):
+            ...
+    """
+
+    def __init__(self, operation: str):
+        self.operation = operation
+        self._starts = threading.local()
+
+    def __enter__(self):
+        stack = getattr(self._starts, "stack", None)
+        if stack is None:
+            stack = self._starts.stack = []
+        stack.append(time.perf_counter())
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        elapsed = time.perf_counter() - self._starts.stack.pop()
+        # Исключения перезапуска Streamlit — не ошибки (они наследуют BaseException)
+        status = "error" if exc_type is not None and issubclass(exc_type, Exception) else "ok"
+        OPERATION_SECONDS.observe(elapsed, self.operation, status)
+        _notify("operation", self.operation, elapsed)
+        return False
+
+
+def instrument_engine(engine) -> None:
+    """Count and time every SQL statement executed through engine."""
+    from sqlalchemy import event
+
+    @event.listens_for(engine, "before_cursor_execute")
+    def _before(conn, cursor, statement, parameters, context, executemany):
+        conn.info.setdefault("query_start", []).append(time.perf_counter())
+
+    @event.listens_for(engine, "after_cursor_execute")
+    def _after(conn, cursor, statement, parameters, context, executemany):
+        elapsed = time.perf_counter() - conn.info["query_start"].pop()
+        kind = statement.lstrip().split(None, 1)[0].upper() if statement.strip() else "OTHER"
+        SQL_QUERIES.inc(1, kind)
+        SQL_SECONDS.observe(elapsed, kind)
+        _notify("sql", kind, elapsed)
+
+    @event.listens_for(engine, "handle_error")
+    def _error(context):
+        starts = context.connection.info.get("query_start") if context.connection is not None else None
+        if starts:
+            starts.pop()
+
+# ---------------------------
+# HTTP endpoint
+# ---------------------------
+
+class _MetricsHandler(BaseHTTPRequestHandler):
+    def do_GET(self):
+        if self.path.split("?", 1)[0] != "/metrics":
+            self.send_error(404)
+            return
+        body = render_prometheus().encode("utf-8")
+        self.send_response(200)
+        self.send_header("Content-Type", "text/plain; version=0.0.4; charset=utf-8")
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def log_message(self, format, *args):
+        pass
+
+
+_server = None
+_server_lock = threading.Lock()
+
+
+def start_metrics_server(port: int = METRICS_PORT, addr: str = METRICS_ADDR) -> None:
+    """Serve /metrics from a daemon thread (once per process)."""
+    global _server
+    if _server is not None or port <= 0:
+        return
+    with _server_lock:
+        if _server is not None:
+            return
+        try:
+            _server = ThreadingHTTPServer((addr, port), _MetricsHandler)
+        except OSError as e:
+            logger.warning(f"Metrics endpoint not started on {addr}:{port}: {e}")
+            _server = False
+            return
+        threading.Thread(target=_server.serve_forever, name="metrics", daemon=True).start()
+        logger.info(f"Metrics served on http://{addr}:{port}/metrics")
@@ -1,15 +1,68 @@
+import os
+import time
+import shutil
+import tempfile
 import streamlit as st
-from ui_components import render_editable_iframe
-from logic import generate_style_sample, generate_lesson, pdf_upload
-import asyncio
-from database.database import SessionLocal
-from database.templates_crud import create_template_with_s3, list_templates_by_author
-from database.lessons_crud import create_lesson_with_s3
+from ui_components import (
+    render_editable_iframe, render_url_iframe, invalidate_sidebar_lessons, render_template_card,
+    render_export, running_export_jobs, presigned_urls_enabled, presigned_object_url
+)
+from logic import generate_style_html, generate_lesson_stream_html
+from jobs import job_manager, JobQueueFull, report_progress
+from database.database import session_scope
+from database.templates_crud import create_template_with_s3, list_templates_by_author, ensure_template_metadata
+from database.lessons_crud import create_lesson_with_s3, update_lesson_with_s3
+from database.versions_crud import list_lesson_versions, get_version_html
+from database.courses_crud import list_courses_by_author
+from database.documents_crud import list_ready_documents_by_author, get_document_text
+from batch import parse_outline, run_course_batch
+from pdf_ingest import ingest_pdf, PDF_CHUNK_OVERLAP
+from export import export_course_lessons, safe_filename
 from database.s3.s3 import s3_client
 import logging
 
 logger = logging.getLogger(__name__)
 
+# Пауза между опросами статуса фоновой генерации, секунд
+JOB_POLL_INTERVAL = float(os.getenv("JOB_POLL_INTERVAL", "1.0"))
+# Пауза между обновлениями превью при потоковой генерации урока
+STREAM_POLL_INTERVAL = float(os.getenv("STREAM_POLL_INTERVAL", "0.3"))
+# Сколько символов текста PDF передавать в генерацию урока
+PDF_CONTEXT_CHARS = int(os.getenv("PDF_CONTEXT_CHARS", "12000"))
+
+
+def _poll_while_running(*jobs, interval: float = None):
+    """
+    Перезапускает скрипт через паузу, пока хотя бы одна задача не завершена.
+    Задачи экспорта из сайдбара опрашиваются на любой странице.
+    """
+    if any(job and not job.finished for job in (*jobs, *running_export_jobs())):
+        time.sleep(interval or JOB_POLL_INTERVAL)
+        st.rerun()
+
+
+def _save_generated_template(sample_html: str):
+    with session_scope() as db:
+        author_id = st.session_state.user_id
+        existing = list_templates_by_author(db, author_id)
+        title = f"Сгенерированный шаблон {len(existing) + 1}"
+        tmpl = create_template_with_s3(
+            db=db,
+            title=title,
+            author_id=author_id,
+            html=sample_html
+        )
+
+    user_tpls = st.session_state.setdefault("user_templates", [])
+    user_tpls.append({
+        "db_id": tmpl.id,
+        "title": tmpl.title,
+        "html_content": sample_html,
+        "s3_key": tmpl.s3_key
+    })
+
+    st.success(f"Шаблон сохранён {len(existing) + 1}")
+
 
 def render_style_sample_page():
     col_input, col_preview = st.columns(2)
@@ -17,6 +70,8 @@ def render_style_sample_page():
     with col_input:
         style_prompt = st.text_input("Внешний вид", placeholder="Цвет, шрифт, размер, фон…")
         structure_prompt = st.text_input("Структура", placeholder="Порядок изложения, разбиение на части…")
+        regenerate = st.checkbox("Сгенерировать заново", key="style_regenerate",
+                                 help="Не использовать сохранённый результат для того же запроса")
 
         if st.button("Создать шаблон"):
             # Set defaults
@@ -25,51 +80,146 @@ def render_style_sample_page():
             if not structure_prompt:
                 structure_prompt = "Введение, основная часть с bullet списком и заключение"
 
-            # Generate HTML
-            with st.spinner("Создаём шаблон…"):
-                sample_html = generate_style_sample(style_prompt, structure_prompt)
-
-            st.session_state.generated_sample = sample_html
-
-            # Persist to DB
-            db = SessionLocal()
+            # Generate HTML in background
             try:
-                author_id = st.session_state.user_id
-                existing = list_templates_by_author(db, author_id)
-                title = f"Сгенерированный шаблон {len(existing) + 1}"
-                tmpl = create_template_with_s3(
-                    db=db,
-                    title=title,
-                    author_id=author_id,
-                    html=sample_html
+                st.session_state.style_job_id = job_manager.submit(
+                    st.session_state.user_id, "generate_style_sample",
+                    generate_style_html, style_prompt, structure_prompt,
+                    regenerate=regenerate
                 )
-            finally:
-                db.close()
+            except JobQueueFull:
+                st.error("Дождитесь завершения текущих генераций.")
 
-            user_tpls = st.session_state.setdefault("user_templates", [])
-            user_tpls.append({
-                "db_id": tmpl.id,
-                "title": tmpl.title,
-                "html_content": sample_html,
-                "s3_key": tmpl.s3_key
-            })
-
-            st.success(f"Шаблон сохранён {len(existing) + 1}")
+        job = job_manager.get(st.session_state.get("style_job_id"))
+        if job and not job.finished:
+            st.info("Создаём шаблон…")
+        elif job:
+            st.session_state.style_job_id = None
+            job_manager.discard(job.id)
+            if job.error:
+                st.error(f"Ошибка генерации: {job.error}")
+            else:
+                st.session_state.generated_sample = job.result
+                _save_generated_template(job.result)
 
     with col_preview:
         if st.session_state.get("generated_sample"):
             render_editable_iframe(st.session_state.generated_sample, height=500)
 
+    _poll_while_running(job)
+
+
+def _render_pdf_upload():
+    """
+    Загрузка PDF: файл копируется на диск и обрабатывается фоновой задачей.
+    Возвращает фоновую задачу обработки (если она ещё отслеживается).
+    """
+    uploaded = st.file_uploader("Загрузить PDF", type=["pdf"], key="pdf_uploader")
+    pdf_job = st.session_state.get("pdf_job") or {}
+
+    if uploaded is not None and uploaded.file_id not in st.session_state.setdefault("pdf_submitted", set()):
+        # Копируем кусками во временный файл: задача читает его с диска, а не из памяти сессии
+        with tempfile.NamedTemporaryFile(suffix=".pdf", delete=False) as tmp:
+            uploaded.seek(0)
+            shutil.copyfileobj(uploaded, tmp, length=1024 * 1024)
+        try:
+            pdf_job = {
+                "id": job_manager.submit(
+                    st.session_state.user_id, "ingest_pdf",
+                    ingest_pdf, st.session_state.user_id, uploaded.name, tmp.name,
+                    progress=report_progress
+                ),
+                "name": uploaded.name
+            }
+            st.session_state.pdf_job = pdf_job
+            st.session_state.pdf_submitted.add(uploaded.file_id)
+        except JobQueueFull:
+            os.remove(tmp.name)
+            st.error("Дождитесь завершения текущих задач.")
+
+    job = job_manager.get(pdf_job.get("id"))
+    if job and not job.finished:
+        st.progress(job.progress or 0.0, text=f"Обработка {pdf_job['name']}...")
+    elif job:
+        st.session_state.pdf_job = None
+        job_manager.discard(job.id)
+        if job.error:
+            st.error(f"Не удалось обработать PDF: {job.error}")
+        else:
+            st.success(f"PDF «{pdf_job['name']}» обработан.")
+    return job
+
+
+def _render_lesson_versions(current_lesson: dict):
+    with st.expander("История версий"):
+        with session_scope() as db:
+            versions = list_lesson_versions(db, current_lesson["db_id"])
+        if not versions:
+            st.caption("Версий пока нет.")
+            return
+        labels = {
+            f"v{v.version} · {v.created_at:%d.%m.%Y %H:%M} · {(v.note or v.prompt_text or '')[:40]}": v.version
+            for v in versions
+        }
+        selected = st.selectbox("Версия", list(labels), key="lesson_version")
+        if st.button("Восстановить версию", disabled=labels[selected] == versions[0].version):
+            version = labels[selected]
+            with session_scope() as db:
+                html = get_version_html(db, current_lesson["db_id"], version)
+                if html is not None:
+                    # Восстановление тоже записывается новой версией
+                    update_lesson_with_s3(
+                        db, current_lesson["db_id"],
+                        version_note=f"Восстановлена версия {version}",
+                        html_content=html
+                    )
+            if html is None:
+                st.error("Версия не найдена.")
+                return
+            st.session_state.generated_lesson = html
+            current_lesson.update(content=html, s3_key=None)
+            st.rerun()
+
+
+def _save_current_lesson(templates: list, as_new: bool):
+    current_lesson = st.session_state.get("current_lesson")
+    if not current_lesson or not st.session_state.get("generated_lesson"):
+        st.error("Нет сгенерированного урока для сохранения.")
+        return
+    tpl = next((t for t in templates if t.title == current_lesson.get("selected_template")), None)
+    if tpl is None:
+        st.error("Шаблон урока не найден.")
+        return
+    prompt = current_lesson.get("prompt") or ""
+    with session_scope() as db:
+        if current_lesson.get("db_id") and not as_new:
+            # Шаблон мог смениться при перегенерации — урок должен ссылаться на актуальный
+            update_lesson_with_s3(
+                db, current_lesson["db_id"],
+                prompt_text=prompt or None,
+                html_content=st.session_state.generated_lesson,
+                template_id=tpl.id
+            )
+        else:
+            lesson_obj = create_lesson_with_s3(
+                db=db,
+                title=prompt[:20] or "Новый урок",
+                author_id=st.session_state.user_id,
+                html_content=st.session_state.generated_lesson,
+                creation_prompt=prompt,
+                template_id=tpl.id
+            )
+            current_lesson["db_id"] = lesson_obj.id
+    invalidate_sidebar_lessons()
+    st.success("Урок сохранён")
+
 
 def render_lesson_page():
-    pdf_upload_enabled = False
     col_input, col_preview = st.columns(2)
 
-    db = SessionLocal()
-    try:
+    with session_scope() as db:
         templates = list_templates_by_author(db, st.session_state.user_id)
-    finally:
-        db.close()
+        ensure_template_metadata(db, templates)
     titles = [tpl.title for tpl in templates]
 
     with col_input:
@@ -88,10 +238,25 @@ def render_lesson_page():
             if prev in titles:
                 idx = titles.index(prev)
             selected_title = st.selectbox("Выбор шаблона", titles, index=idx)
+            tpl = next(t for t in templates if t.title == selected_title)
+            render_template_card(tpl)
+            if presigned_urls_enabled():
+                with st.expander("Предпросмотр шаблона"):
+                    render_url_iframe(presigned_object_url(tpl.s3_key), height=300)
         else:
             st.error("Нет доступных шаблонов. Создайте хотя бы один шаблон.")
             selected_title = None
 
+        regenerate = st.checkbox("Сгенерировать заново", key="lesson_regenerate",
+                                 help="Не использовать сохранённый результат для того же запроса и шаблона")
+
+        pdf_job = _render_pdf_upload()
+        with session_scope() as db:
+            documents = list_ready_documents_by_author(db, st.session_state.user_id)
+        document_options = {"Без контекста": None}
+        document_options.update({f"{d.title} ({d.page_count} стр.)": d.id for d in documents})
+        selected_document = st.selectbox("Контекст из PDF", list(document_options))
+
         if st.button("Создать урок"):
             if lesson_prompt and selected_title:
                 tpl = next(t for t in templates if t.title == selected_title)
@@ -101,46 +266,56 @@ def render_lesson_page():
                 except Exception as e:
                     st.error(f"Ошибка загрузки шаблона: {e}")
                     return
-                with st.spinner("Генерация урока..."):
-                    generated = generate_lesson(template_html, lesson_prompt)
-                st.session_state.generated_lesson = generated
-                st.session_state.current_lesson = {
-                    "content": generated,
-                    "prompt": lesson_prompt,
-                    "selected_template": selected_title
-                }
-                st.success("Урок сгенерирован и готов к сохранению.")
+                context = None
+                document_id = document_options[selected_document]
+                if document_id:
+                    with session_scope() as db:
+                        context = get_document_text(db, document_id, PDF_CONTEXT_CHARS, overlap=PDF_CHUNK_OVERLAP)
+                try:
+                    st.session_state.lesson_job = {
+                        "id": job_manager.submit(
+                            st.session_state.user_id, "generate_lesson",
+                            generate_lesson_stream_html, template_html, lesson_prompt,
+                            on_chunk=report_progress, regenerate=regenerate, context=context
+                        ),
+                        "prompt": lesson_prompt,
+                        "selected_template": selected_title,
+                        "db_id": current_lesson.get("db_id")
+                    }
+                except JobQueueFull:
+                    st.error("Дождитесь завершения текущих генераций.")
             else:
                 st.error("Введите запрос и выберите шаблон.")
 
-        st.file_uploader(
-            "Загрузить PDF",
-            type=["pdf"],
-            disabled=not pdf_upload_enabled,
-            help="Скоро будет доступно." if not pdf_upload_enabled else None
-        )
+        lesson_job = st.session_state.get("lesson_job") or {}
+        job = job_manager.get(lesson_job.get("id"))
+        if job and not job.finished:
+            st.info("Генерация урока...")
+        elif job:
+            st.session_state.lesson_job = None
+            job_manager.discard(job.id)
+            if job.error:
+                st.error(f"Ошибка генерации: {job.error}")
+            else:
+                st.session_state.generated_lesson = job.result
+                st.session_state.current_lesson = {
+                    "content": job.result,
+                    "prompt": lesson_job["prompt"],
+                    "selected_template": lesson_job["selected_template"],
+                    "db_id": lesson_job.get("db_id")
+                }
+                st.success("Урок сгенерирован и готов к сохранению.")
 
         col_save, col_export = st.columns(2)
         with col_save:
-            if st.button("Сохранить урок"):
-                if not st.session_state.get("current_lesson"):
-                    st.error("Нет сгенерированного урока для сохранения.")
-                else:
-                    db2 = SessionLocal()
-                    try:
-                        lesson_name = st.session_state.current_lesson.get("prompt")[:20] or "Новый урок"
-                        tpl = next(t for t in templates if t.title == st.session_state.current_lesson["selected_template"])
-                        lesson_obj = create_lesson_with_s3(
-                            db=db2,
-                            title=lesson_name,
-                            author_id=st.session_state.user_id,
-                            html_content=st.session_state.generated_lesson,
-                            creation_prompt=lesson_prompt,
-                            template_id=tpl.id
-                        )
-                    finally:
-                        db2.close()
-                    st.success(f"Урок сохранён")
+            if (st.session_state.get("current_lesson") or {}).get("db_id"):
+                # Открытый урок: новая версия этого урока или отдельный новый урок
+                if st.button("Сохранить как версию"):
+                    _save_current_lesson(templates, as_new=False)
+                if st.button("Сохранить как новый урок"):
+                    _save_current_lesson(templates, as_new=True)
+            elif st.button("Сохранить урок"):
+                _save_current_lesson(templates, as_new=True)
         with col_export:
             if st.session_state.get("generated_lesson"):
                 st.download_button(
@@ -149,7 +324,112 @@ def render_lesson_page():
                     file_name="lesson.html",
                     mime="text/html"
                 )
+            elif current_lesson.get("s3_key"):
+                st.link_button("Открыть HTML", presigned_object_url(current_lesson["s3_key"]))
+
+        if current_lesson.get("db_id"):
+            _render_lesson_versions(current_lesson)
 
     with col_preview:
-        if st.session_state.get("generated_lesson"):
-            render_editable_iframe(st.session_state.generated_lesson, height=500)
\ No newline at end of file
+        if job and not job.finished:
+            # Промежуточный HTML, пришедший из потока генерации
+            if job.progress:
+                render_editable_iframe(job.progress, height=500)
+        elif st.session_state.get("generated_lesson"):
+            render_editable_iframe(st.session_state.generated_lesson, height=500)
+        elif current_lesson.get("s3_key"):
+            render_url_iframe(presigned_object_url(current_lesson["s3_key"]), height=500)
+
+    _poll_while_running(job, pdf_job, interval=STREAM_POLL_INTERVAL)
+
+
+def render_course_page():
+    with session_scope() as db:
+        templates = list_templates_by_author(db, st.session_state.user_id)
+        ensure_template_metadata(db, templates)
+        courses = list_courses_by_author(db, st.session_state.user_id)
+
+    course_job = st.session_state.get("course_job") or {}
+    job = job_manager.get(course_job.get("id"))
+
+    course_options = {"Новый курс": None}
+    course_options.update({f"{c.title} (id {c.id})": c.id for c in courses})
+    selected_course = st.selectbox(
+        "Курс", list(course_options),
+        help="Для существующего курса уже сгенерированные уроки пропускаются"
+    )
+    selected_course_id = course_options[selected_course]
+    export_job = None
+    if selected_course_id:
+        course = next(c for c in courses if c.id == selected_course_id)
+        export_job = render_export(
+            f"course_{course.id}", "Экспорт курса (ZIP)", export_course_lessons, course.id,
+            container=st, file_name=f"{safe_filename(course.title)}.zip"
+        )
+    course_title = st.text_input("Название курса", placeholder="Введение в Python")
+    outline_text = st.text_area(
+        "План курса",
+        height=250,
+        placeholder="# Модуль 1\n- Запрос для урока\n- Запрос для урока\n# Модуль 2\n- Запрос для урока"
+    )
+
+    if templates:
+        titles = [tpl.title for tpl in templates]
+        selected_title = st.selectbox("Шаблон уроков", titles, key="course_template")
+        render_template_card(next(t for t in templates if t.title == selected_title))
+    else:
+        st.error("Нет доступных шаблонов. Создайте хотя бы один шаблон.")
+        selected_title = None
+
+    if st.button("Сгенерировать курс", disabled=bool(job and not job.finished)):
+        course_id = course_options[selected_course]
+        title = course_title or (selected_course if course_id else "")
+        outline = parse_outline(title, outline_text)
+        if not title or not outline.modules or not selected_title:
+            st.error("Укажите название курса, план и шаблон.")
+        else:
+            tpl = next(t for t in templates if t.title == selected_title)
+            try:
+                st.session_state.course_job = {
+                    "id": job_manager.submit(
+                        st.session_state.user_id, "course_batch",
+                        run_course_batch, outline, st.session_state.user_id, tpl.id,
+                        course_id=course_id, progress=report_progress
+                    )
+                }
+                st.session_state.course_result = None
+                job = job_manager.get(st.session_state.course_job["id"])
+            except JobQueueFull:
+                st.error("Дождитесь завершения текущих генераций.")
+
+    if job and job.finished:
+        # Результат забирается один раз; дальше показывается только итог
+        st.session_state.course_job = None
+        job_manager.discard(job.id)
+        invalidate_sidebar_lessons()
+        st.session_state.course_result = {
+            "state": None if job.error else job.result,
+            "error": job.error
+        }
+        job = None
+
+    result = st.session_state.get("course_result")
+    state = job.progress if job else (result or {}).get("state")
+    if state:
+        st.progress(
+            state["done"] / state["total"] if state["total"] else 1.0,
+            text=f"Уроков готово: {state['done']} из {state['total']}"
+        )
+        for failure in state["failed"]:
+            st.warning(f"Не удалось сгенерировать «{failure['prompt']}»: {failure['error']}")
+    if job:
+        st.info("Генерация курса...")
+    elif result and result["error"]:
+        st.error(f"Ошибка генерации курса: {result['error']}")
+    elif result:
+        if state and state["failed"]:
+            st.info("Запустите генерацию для этого курса ещё раз, чтобы повторить неудавшиеся уроки.")
+        else:
+            st.success("Курс сгенерирован.")
+
+    _poll_while_running(job, export_job)
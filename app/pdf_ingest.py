@@ -0,0 +1,124 @@
+import os
+import uuid
+import logging
+import threading
+import multiprocessing
+from concurrent.futures import ProcessPoolExecutor
+from dotenv import load_dotenv
+
+from database.database import session_scope
+from database.documents_crud import create_document, update_document, add_document_chunks
+from database.s3.s3 import s3_client
+import pdf_text
+
+# ---------------------------
+# Logging setup
+# ---------------------------
+load_dotenv()
+logging.basicConfig(
+    level=logging.INFO,
+    format="%(asctime)s [%(levelname)s] %(message)s"
+)
+logger = logging.getLogger(__name__)
+
+PDF_WORKERS = int(os.getenv("PDF_WORKERS", "2"))
+PDF_PAGES_PER_TASK = int(os.getenv("PDF_PAGES_PER_TASK", "20"))
+PDF_CHUNK_CHARS = int(os.getenv("PDF_CHUNK_CHARS", "2000"))
+PDF_CHUNK_OVERLAP = int(os.getenv("PDF_CHUNK_OVERLAP", "200"))
+PDF_MAX_BYTES = int(os.getenv("PDF_MAX_MB", "50")) * 1024 * 1024
+
+_pool = None
+_pool_lock = threading.Lock()
+
+
+def _get_pool() -> ProcessPoolExecutor:
+    # Пул создаётся при первой загрузке; spawn, чтобы не форкать процесс Streamlit с его потоками
+    global _pool
+    if _pool is None:
+        with _pool_lock:
+            if _pool is None:
+                _pool = ProcessPoolExecutor(
+                    max_workers=PDF_WORKERS,
+                    mp_context=multiprocessing.get_context("spawn")
+                )
+    return _pool
+
+
+def chunk_pages(pages: list[str], size: int = PDF_CHUNK_CHARS, overlap: int = PDF_CHUNK_OVERLAP) -> list[tuple[int, int, int, str]]:
+    """
+    Склеивает текст страниц и режет его на куски около size символов
+    с перекрытием overlap. Возвращает (chunk_index, page_start, page_end, text),
+    номера страниц с 1.
+    """
+    chunks = []
+    buffer, start_page, last_page = "", 1, 1
+    for number, text in enumerate(pages, start=1):
+        text = " ".join(text.split())
+        if not text:
+            continue
+        last_page = number
+        if not buffer:
+            start_page = number
+        buffer = f"{buffer} {text}".strip()
+        while len(buffer) >= size:
+            chunks.append((len(chunks), start_page, number, buffer[:size]))
+            buffer = buffer[size - overlap:]
+            start_page = number
+    if buffer.strip():
+        chunks.append((len(chunks), start_page, last_page, buffer))
+    return chunks
+
+
+def ingest_pdf(author_id: int, filename: str, src_path: str, progress=None) -> int:
+    """
+    Загружает PDF из локального файла в S3 (multipart), извлекает текст
+    по страницам в пуле процессов и сохраняет куски текста в БД.
+
+    progress(float 0..1) вызывается по мере обработки. Файл src_path
+    удаляется по завершении. Возвращает id документа.
+    """
+    size = os.path.getsize(src_path)
+    with session_scope() as db:
+        document_id = create_document(db, author_id, filename, size=size).id
+
+    try:
+        if size > PDF_MAX_BYTES:
+            raise ValueError(f"PDF is larger than {PDF_MAX_BYTES // (1024 * 1024)} MB")
+
+        s3_key = f"documents/{uuid.uuid4().hex}.pdf"
+        s3_client.upload_file(src_path, s3_key, content_type="application/pdf")
+        with session_scope() as db:
+            update_document(db, document_id, s3_key=s3_key)
+        if progress:
+            progress(0.1)
+
+        pool = _get_pool()
+        total = pool.submit(pdf_text.page_count, src_path).result()
+        ranges = [(start, min(start + PDF_PAGES_PER_TASK, total)) for start in range(0, total, PDF_PAGES_PER_TASK)]
+        futures = [pool.submit(pdf_text.extract_pages, src_path, start, end) for start, end in ranges]
+
+        pages = []
+        for (start, end), future in zip(ranges, futures):
+            pages.extend(future.result())
+            if progress:
+                progress(0.1 + 0.8 * end / max(total, 1))
+
+        chunks = chunk_pages(pages)
+        if not chunks:
+            raise ValueError("No text could be extracted (scanned PDF?)")
+        with session_scope() as db:
+            add_document_chunks(db, document_id, chunks)
+            update_document(db, document_id, page_count=total, status='ready')
+        if progress:
+            progress(1.0)
+        logger.info(f"Document id={document_id} '{filename}' ingested: {total} pages, {len(chunks)} chunks")
+        return document_id
+    except Exception as e:
+        with session_scope() as db:
+            update_document(db, document_id, status='failed', error=str(e))
+        raise
+    finally:
+        try:
+            os.remove(src_path)
+        except OSError:
+            pass
@@ -0,0 +1,24 @@
+"""
+Извлечение текста из PDF.
+
+Модуль намеренно зависит только от pypdf: он импортируется в дочерних
+процессах пула извлечения, которые запускаются через spawn.
+"""
+from pypdf import PdfReader
+
+
+def page_count(path: str) -> int:
+    return len(PdfReader(path).pages)
+
+
+def extract_pages(path: str, start: int, end: int) -> list[str]:
+    """Text of pages [start, end) of the PDF at path."""
+    reader = PdfReader(path)
+    texts = []
+    for number in range(start, min(end, len(reader.pages))):
+        try:
+            texts.append(reader.pages[number].extract_text() or "")
+        except Exception:
+            # Битая страница не должна ронять весь документ
+            texts.append("")
+    return texts
@@ -0,0 +1,157 @@
+"""
+Профилирование перезапусков скрипта Streamlit.
+
+Включается для всех сессий через PROFILE_RERUNS=1 или для отдельной сессии
+переключателем в сайдбаре (для пользователей из PROFILE_ADMIN_IDS).
+Для каждого перезапуска считается общее время, время по секциям
+(render_sidebar, render_navigation, страницы...) и время в БД, S3 и API
+генерации. cProfile самых медленных перезапусков сохраняется в PROFILE_DIR
+в формате .prof (pstats): snakeviz, flameprof, gprof2dot и т.п.
+"""
+import os
+import time
+import heapq
+import cProfile
+import logging
+import threading
+from contextlib import contextmanager
+from dotenv import load_dotenv
+
+import streamlit as st
+
+from metrics import timed, add_listener
+
+# ---------------------------
+# Logging setup
+# ---------------------------
+load_dotenv()
+logging.basicConfig(
+    level=logging.INFO,
+    format="%(asctime)s [%(levelname)s] %(message)s"
+)
+logger = logging.getLogger(__name__)
+
+PROFILE_RERUNS = os.getenv("PROFILE_RERUNS", "0") == "1"
+PROFILE_ADMIN_IDS = {int(v) for v in os.getenv("PROFILE_ADMIN_IDS", "").split(",") if v.strip()}
+PROFILE_DIR = os.getenv("PROFILE_DIR", "/tmp/kursor-profiles")
+# Сколько самых медленных перезапусков хранить на диске
+PROFILE_KEEP = int(os.getenv("PROFILE_KEEP", "10"))
+PROFILE_TOGGLE_KEY = "profile_reruns"
+PROFILE_LAST_KEY = "profile_last_rerun"
+
+_current = threading.local()
+# (длительность, путь) самых медленных сохранённых профилей, min-heap
+_slowest: list[tuple[float, str]] = []
+_slowest_lock = threading.Lock()
+
+
+class RerunProfile:
+    def __init__(self):
+        self.started = time.perf_counter()
+        self.total = 0.0
+        self.sections: dict[str, float] = {}
+        self.db_seconds = 0.0
+        self.db_queries = 0
+        self.s3_seconds = 0.0
+        self.s3_calls = 0
+        self.http_seconds = 0.0
+
+    def observe(self, kind: str, name: str, seconds: float) -> None:
+        if kind == "sql":
+            self.db_seconds += seconds
+            self.db_queries += 1
+        elif name.startswith("s3_"):
+            self.s3_seconds += seconds
+            self.s3_calls += 1
+        elif name.startswith("http "):
+            self.http_seconds += seconds
+
+    def summary(self) -> dict:
+        return {
+            "total_ms": round(self.total * 1000, 1),
+            "sections_ms": {name: round(s * 1000, 1) for name, s in self.sections.items()},
+            "db_ms": round(self.db_seconds * 1000, 1),
+            "db_queries": self.db_queries,
+            "s3_ms": round(self.s3_seconds * 1000, 1),
+            "s3_calls": self.s3_calls,
+            "http_ms": round(self.http_seconds * 1000, 1),
+        }
+
+
+def _observe(kind: str, name: str, seconds: float) -> None:
+    profile = getattr(_current, "profile", None)
+    if profile is not None:
+        profile.observe(kind, name, seconds)
+
+
+add_listener(_observe)
+
+
+def enabled() -> bool:
+    return PROFILE_RERUNS or bool(st.session_state.get(PROFILE_TOGGLE_KEY))
+
+
+def can_toggle(user_id: int | None) -> bool:
+    return user_id is not None and user_id in PROFILE_ADMIN_IDS
+
+
+def _keep_profile(profiler: cProfile.Profile | None, seconds: float) -> str | None:
+    """Сохраняет профиль, если перезапуск среди PROFILE_KEEP самых медленных."""
+    if profiler is None:
+        return None
+    with _slowest_lock:
+        if len(_slowest) >= PROFILE_KEEP and seconds <= _slowest[0][0]:
+            return None
+        os.makedirs(PROFILE_DIR, exist_ok=True)
+        name = f"rerun-{int(seconds * 1000):07d}ms-{time.strftime('%Y%m%d-%H%M%S')}-{threading.get_ident()}.prof"
+        path = os.path.join(PROFILE_DIR, name)
+        profiler.dump_stats(path)
+        heapq.heappush(_slowest, (seconds, path))
+        if len(_slowest) > PROFILE_KEEP:
+            _, evicted = heapq.heappop(_slowest)
+            try:
+                os.remove(evicted)
+            except OSError:
+                pass
+        return path
+
+
+@contextmanager
+def rerun():
+    """Оборачивает весь перезапуск скрипта; время попадает в метрику rerun всегда."""
+    with timed("rerun"):
+        if not enabled():
+            yield
+            return
+        profile = RerunProfile()
+        profiler = cProfile.Profile()
+        try:
+            profiler.enable()
+        except ValueError:
+            # В потоке уже работает другой профилировщик — считаем только секции
+            profiler = None
+        _current.profile = profile
+        try:
+            yield
+        finally:
+            if profiler is not None:
+                profiler.disable()
+            _current.profile = None
+            profile.total = time.perf_counter() - profile.started
+            path = _keep_profile(profiler, profile.total)
+            summary = profile.summary()
+            st.session_state[PROFILE_LAST_KEY] = summary
+            logger.info(f"Rerun profile: {summary}" + (f", saved to {path}" if path else ""))
+
+
+@contextmanager
+def section(name: str):
+    """Часть перезапуска (функция отрисовки); учитывается в метриках и в профиле."""
+    start = time.perf_counter()
+    with timed(name):
+        try:
+            yield
+        finally:
+            profile = getattr(_current, "profile", None)
+            if profile is not None:
+                profile.sections[name] = profile.sections.get(name, 0.0) + time.perf_counter() - start
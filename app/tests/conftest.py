@@ -0,0 +1,12 @@
+import os
+import sys
+import tempfile
+
+# Тесты работают с временной SQLite и хранилищем в памяти, а не с настройками из .env
+os.environ["DATABASE_URL"] = "sqlite:///" + os.path.join(tempfile.mkdtemp(prefix="kursor-tests-"), "test.db")
+os.environ["STORAGE_BACKEND"] = "memory"
+
+# Тесты импортируют модули так же, как приложение — из каталога app
+root = os.path.abspath(os.path.join(os.path.dirname(__file__), '..'))
+if root not in sys.path:
+    sys.path.insert(0, root)
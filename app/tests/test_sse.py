@@ -0,0 +1,48 @@
+import pytest
+
+from utils.sse import iter_sse_data, iter_lesson_fragments, StreamError
+
+
+def test_data_keeps_spaces_after_optional_one():
+    lines = ["data:  word ", "", "data:next", ""]
+    assert list(iter_sse_data(lines)) == [" word ", "next"]
+
+
+def test_multiline_data_joined_until_blank_line():
+    lines = ["data: <p>", "data: text</p>", "", "data: x", ""]
+    assert list(iter_sse_data(lines)) == ["<p>\ntext</p>", "x"]
+
+
+def test_comments_and_other_fields_ignored():
+    lines = [": keep-alive", "event: message", "id: 1", "data: a", "retry: 10", ""]
+    assert list(iter_sse_data(lines)) == ["a"]
+
+
+def test_last_event_without_blank_line():
+    assert list(iter_sse_data(["data: tail"])) == ["tail"]
+
+
+def test_plain_text_tokens_are_not_glued():
+    lines = ["data: Hello", "", "data:  world", "", "data: [DONE]", ""]
+    assert "".join(iter_lesson_fragments(lines)) == "Hello world"
+
+
+def test_json_events():
+    lines = [
+        'data: {"delta": "<h1>"}', "",
+        'data: {"delta": "Title</h1>"}', "",
+        'data: "str"', "",
+        "data: 42", "",
+    ]
+    assert list(iter_lesson_fragments(lines)) == ["<h1>", "Title</h1>", "str", "42"]
+
+
+def test_done_stops_stream():
+    lines = ["data: a", "", "data: [DONE]", "", "data: b", ""]
+    assert list(iter_lesson_fragments(lines)) == ["a"]
+
+
+def test_error_event_raises():
+    lines = ["data: a", "", 'data: {"error": "quota"}', ""]
+    with pytest.raises(StreamError, match="quota"):
+        list(iter_lesson_fragments(lines))
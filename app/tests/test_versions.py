@@ -0,0 +1,121 @@
+import pytest
+
+from database.database import Base, engine, SessionLocal, User, Template, Lesson, LessonVersion
+from database.s3.s3 import s3_client
+from database import versions_crud
+from database.versions_crud import make_delta, apply_delta, record_version, get_version_html, list_lesson_versions
+from database.lessons_crud import create_lesson_with_s3, update_lesson_with_s3
+
+
+@pytest.fixture
+def db():
+    Base.metadata.create_all(bind=engine)
+    session = SessionLocal()
+    try:
+        yield session
+    finally:
+        session.close()
+        Base.metadata.drop_all(bind=engine)
+
+
+@pytest.fixture
+def lesson(db):
+    user = User(telegram_nick="author", telegram_id="1", password_hash="x")
+    db.add(user)
+    db.flush()
+    s3_client.put_object("templates/t.html", "<style></style>")
+    template = Template(title="t", author_id=user.id, s3_key="templates/t.html")
+    db.add(template)
+    db.commit()
+    return create_lesson_with_s3(db, "Урок", user.id, _page(0), "первый промпт", template.id)
+
+
+def _page(n: int, lines: int = 40) -> str:
+    body = "".join(f"<p>Абзац {i}</p>\n" for i in range(lines))
+    return f"<html>\n<h1>Версия {n}</h1>\n{body}</html>\n"
+
+
+def _versions(db, lesson_id: int) -> list:
+    return (
+        db.query(LessonVersion)
+        .filter(LessonVersion.lesson_id == lesson_id)
+        .order_by(LessonVersion.version)
+        .all()
+    )
+
+
+@pytest.mark.parametrize("old, new", [
+    ("", "<p>a</p>\n"),
+    ("<p>a</p>\n", ""),
+    ("a\nb\nc\n", "a\nx\nc\n"),
+    ("a\nb", "a\nb\nc"),
+    ("без перевода строки", "другой текст"),
+    (_page(1), _page(2, lines=50)),
+])
+def test_delta_roundtrip(old, new):
+    assert apply_delta(old, make_delta(old, new)) == new
+
+
+def test_delta_copies_unchanged_lines():
+    delta = make_delta(_page(1), _page(2))
+    inserted = [line for op in delta if op[0] == 1 for line in op[1]]
+    assert inserted == ["<h1>Версия 2</h1>\n"]
+
+
+def test_every_version_reconstructed_across_snapshots(db, lesson, monkeypatch):
+    monkeypatch.setattr(versions_crud, "LESSON_SNAPSHOT_EVERY", 4)
+    pages = [_page(0)] + [_page(n) for n in range(1, 11)]
+    for html in pages[1:]:
+        assert record_version(db, lesson.id, html) is not None
+    db.commit()
+
+    versions = _versions(db, lesson.id)
+    assert [v.version for v in versions] == list(range(1, 12))
+    assert [v.version for v in versions if v.is_snapshot] == [1, 5, 9]
+    for number, html in enumerate(pages, start=1):
+        assert get_version_html(db, lesson.id, number) == html
+    assert get_version_html(db, lesson.id, 12) is None
+
+
+def test_large_change_stored_as_snapshot(db, lesson):
+    rewritten = "".join(f"<li>Новый пункт {i}</li>\n" for i in range(40))
+    record_version(db, lesson.id, _page(1))
+    record_version(db, lesson.id, rewritten)
+    db.commit()
+
+    small, large = _versions(db, lesson.id)[1:]
+    assert not small.is_snapshot
+    assert large.is_snapshot
+    assert get_version_html(db, lesson.id, 3) == rewritten
+
+
+def test_unchanged_html_not_recorded(db, lesson):
+    assert record_version(db, lesson.id, _page(0), prompt_text="тот же HTML") is None
+    db.commit()
+    assert len(_versions(db, lesson.id)) == 1
+
+
+def test_note_kept_off_prompt_history(db, lesson):
+    update_lesson_with_s3(db, lesson.id, html_content=_page(1), prompt_text="правка")
+    update_lesson_with_s3(db, lesson.id, html_content=_page(0), version_note="Восстановлена версия 1")
+
+    rows = list_lesson_versions(db, lesson.id)
+    assert [(r.version, r.prompt_text, r.note) for r in rows] == [
+        (3, None, "Восстановлена версия 1"),
+        (2, "правка", None),
+        (1, "первый промпт", None),
+    ]
+
+
+def test_legacy_lesson_backfills_version_one_from_storage(db, lesson):
+    # Урок, созданный до появления версий: HTML есть только в хранилище
+    db.query(LessonVersion).delete()
+    db.commit()
+
+    update_lesson_with_s3(db, lesson.id, html_content=_page(1), prompt_text="правка")
+
+    versions = _versions(db, lesson.id)
+    assert [(v.version, v.is_snapshot) for v in versions] == [(1, True), (2, False)]
+    assert get_version_html(db, lesson.id, 1) == _page(0)
+    assert get_version_html(db, lesson.id, 2) == _page(1)
+    assert s3_client.get_object(db.get(Lesson, lesson.id).s3_key).decode("utf-8") == _page(1)
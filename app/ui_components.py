@@ -1,8 +1,12 @@
 import os
+import time
+import tempfile
 from datetime import datetime
 import hashlib
 import datetime
 import random
+import html
+from functools import lru_cache
 from streamlit_telegram_login import TelegramLoginWidgetComponent
 
 from database.lessons_crud import *
@@ -10,9 +14,12 @@ from database.lessons_crud import *
 import streamlit as st
 import streamlit.components.v1 as components
 
-from database.database import SessionLocal, init_db
+from database.database import session_scope
 from database.users_crud import get_user_by_nick, create_user, update_user
 from utils.auth import set_persistent_login_token
+from export import export_author_lessons, remove_export
+from jobs import job_manager, JobQueueFull
+import profiling
 from dotenv import load_dotenv
 
 load_dotenv()
@@ -20,6 +27,10 @@ load_dotenv()
 BOT_USERNAME = os.getenv("BOT_USERNAME")
 BOT_TOKEN = os.getenv("BOT_TOKEN")
 
+# Отдавать уроки и шаблоны браузеру по presigned URL, минуя процесс Streamlit
+S3_PRESIGNED_URLS = os.getenv("S3_PRESIGNED_URLS", "0") == "1"
+S3_PRESIGNED_TTL = int(os.getenv("S3_PRESIGNED_TTL", "300"))
+
 def render_editable_iframe(html_content, height=700):
     iframe_html = f"""
     <html>
@@ -42,63 +53,233 @@ def render_editable_iframe(html_content, height=700):
     """
     components.html(iframe_html, height=height, scrolling=True)
 
+def presigned_urls_enabled() -> bool:
+    """Presigned URL включены и поддерживаются хранилищем (локальные объекты браузеру недоступны)."""
+    return S3_PRESIGNED_URLS and s3_client.supports_presigned_urls
+
+
+@lru_cache(maxsize=1024)
+def _presigned_url(s3_key: str, expires_at: int) -> str:
+    return s3_client.presigned_url(s3_key, expires_in=S3_PRESIGNED_TTL, expires_at=expires_at)
+
+
+def presigned_object_url(s3_key: str) -> str:
+    """
+    Presigned URL подписывается при отрисовке (сохранённая ссылка истекла бы),
+    а срок действия округляется до окна S3_PRESIGNED_TTL: в пределах окна
+    возвращается тот же URL, и браузер берёт объект из кэша.
+    Ссылка действует от TTL до 2·TTL.
+    """
+    expires_at = (int(time.time()) // S3_PRESIGNED_TTL + 2) * S3_PRESIGNED_TTL
+    return _presigned_url(s3_key, expires_at)
+
+
+def render_url_iframe(url: str, height=700):
+    """Показывает объект по presigned URL: браузер загружает его напрямую из S3."""
+    components.iframe(url, height=height, scrolling=True)
+
+
+def render_template_card(template):
+    """Превью шаблона по сохранённым метаданным, без загрузки HTML из S3."""
+    if template.preview_snippet:
+        st.markdown(template.preview_snippet, unsafe_allow_html=True)
+    details = []
+    if template.size:
+        details.append(f"{template.size / 1024:.1f} КБ")
+    if template.fonts:
+        details.append(", ".join(template.fonts))
+    if details:
+        st.caption(" · ".join(details))
+
+
+SIDEBAR_PAGE_SIZE = int(os.getenv("SIDEBAR_PAGE_SIZE", "20"))
+SIDEBAR_CACHE_KEY = "sidebar_lessons"
+
+
+def invalidate_sidebar_lessons():
+    """Сбрасывает кэш списка уроков в сайдбаре (после создания/удаления урока)."""
+    st.session_state.pop(SIDEBAR_CACHE_KEY, None)
+
+
+def _load_sidebar_page(user_id: int, before_id: int | None = None) -> tuple[list[dict], bool]:
+    with session_scope() as db:
+        rows = list_lesson_summaries(db, user_id, limit=SIDEBAR_PAGE_SIZE + 1, before_id=before_id)
+    items = [
+        {"id": row.id, "title": row.title, "template_title": row.template_title}
+        for row in rows[:SIDEBAR_PAGE_SIZE]
+    ]
+    return items, len(rows) > SIDEBAR_PAGE_SIZE
+
+
+def _load_search_page(user_id: int, query: str, offset: int = 0) -> tuple[list[dict], bool]:
+    with session_scope() as db:
+        rows = search_lessons(db, user_id, query, limit=SIDEBAR_PAGE_SIZE + 1, offset=offset)
+    items = [
+        {"id": row.id, "title": row.title, "template_title": row.template_title}
+        for row in rows[:SIDEBAR_PAGE_SIZE]
+    ]
+    return items, len(rows) > SIDEBAR_PAGE_SIZE
+
+
+def _open_lesson(lesson_id: int, template_title: str | None):
+    with session_scope() as db:
+        lesson = get_lesson(db, lesson_id)
+    if not lesson:
+        invalidate_sidebar_lessons()
+        st.rerun()
+
+    if presigned_urls_enabled():
+        # Содержимое не проходит через процесс: превью грузится браузером по ссылке,
+        # которая подписывается при отрисовке
+        html = ""
+        s3_key = lesson.s3_key
+    else:
+        raw = s3_client.get_object(lesson.s3_key)
+        html = raw.decode("utf-8", errors="replace")
+        s3_key = None
+
+    # Сохраняем загруженный урок в сессии
+    st.session_state.generated_lesson = html
+    st.session_state.current_lesson = {
+        "content": html,
+        "s3_key": s3_key,
+        "prompt": lesson.creation_prompt,
+        "selected_template": template_title,
+        "db_id": lesson.id
+    }
+    st.session_state.nav_option = "Generate Lesson"
+    st.rerun()
+
+
+EXPORT_STATE_PREFIX = "export_"
+
+
+def render_export(scope: str, label: str, fn, *args, container=st.sidebar, file_name: str = "lessons.zip"):
+    """
+    Кнопка экспорта ZIP: архив собирается фоновой задачей и остаётся доступен
+    по ссылке до нового экспорта или истечения EXPORT_MAX_AGE.
+    Возвращает задачу экспорта, пока она отслеживается.
+    """
+    state_key = EXPORT_STATE_PREFIX + scope
+    state = st.session_state.get(state_key) or {}
+    job = job_manager.get(state.get("job_id"))
+    running = bool(job and not job.finished)
+
+    if container.button(label, key=f"{state_key}_start", disabled=running):
+        remove_export(state.get("path"))
+        try:
+            state = {"job_id": job_manager.submit(st.session_state.user_id, "export_zip", fn, *args)}
+            job = job_manager.get(state["job_id"])
+            running = True
+        except JobQueueFull:
+            state = {}
+            container.error("Дождитесь завершения текущих задач.")
+        st.session_state[state_key] = state
+
+    if job and job.finished:
+        job_manager.discard(job.id)
+        if job.error:
+            container.error(f"Не удалось собрать архив: {job.error}")
+            state = {}
+        else:
+            state = job.result
+        st.session_state[state_key] = state
+        job = None
+
+    if running:
+        container.info("Собираем архив…")
+    elif state.get("path"):
+        if time.time() >= state["expires_at"] or not os.path.exists(state["path"]):
+            remove_export(state["path"])
+            st.session_state.pop(state_key, None)
+        else:
+            # Ссылка на файл со статикой Streamlit: браузер скачивает его с диска,
+            # содержимое не проходит через сессию и не пересылается на перезапусках
+            container.markdown(
+                f'<a href="{state["url"]}" download="{html.escape(file_name)}">'
+                f'Скачать ZIP ({state["count"]} уроков)</a>',
+                unsafe_allow_html=True
+            )
+    return job
+
+
+def running_export_jobs() -> list:
+    """Незавершённые задачи экспорта сессии (страницы опрашивают их вместе со своими)."""
+    jobs = []
+    for key, state in st.session_state.items():
+        if key.startswith(EXPORT_STATE_PREFIX) and isinstance(state, dict):
+            job = job_manager.get(state.get("job_id"))
+            if job and not job.finished:
+                jobs.append(job)
+    return jobs
+
+
 def render_sidebar():
     st.sidebar.header("Сохраненные уроки")
 
-    # Получаем все уроки текущего пользователя
-    db = SessionLocal()
-    try:
-        user_id = st.session_state.user_id
-        lessons = list_lessons_by_author_id(db, user_id)
-    finally:
-        db.close()
+    user_id = st.session_state.user_id
+    query = st.sidebar.text_input("Поиск", key="sidebar_search", placeholder="Название, запрос или текст")
+    query = " ".join(query.split())
 
+    # Список уроков (или результаты поиска) кэшируется в сессии и сбрасывается только при создании/удалении
+    cached = st.session_state.get(SIDEBAR_CACHE_KEY)
+    if cached is None or cached["user_id"] != user_id or cached["query"] != query:
+        if query:
+            items, has_more = _load_search_page(user_id, query)
+        else:
+            items, has_more = _load_sidebar_page(user_id)
+        cached = {"user_id": user_id, "query": query, "items": items, "has_more": has_more}
+        st.session_state[SIDEBAR_CACHE_KEY] = cached
+
+    lessons = cached["items"]
     if not lessons:
-        st.sidebar.info("Пока нет сохраненных уроков.")
+        st.sidebar.info("Ничего не найдено." if query else "Пока нет сохраненных уроков.")
         return
 
     # Отображаем каждую запись с кнопками загрузки и удаления
     for lesson in lessons:
-        st.sidebar.markdown(f"**{lesson.title}**")
+        st.sidebar.markdown(f"**{lesson['title']}**")
 
         cols = st.sidebar.columns(2)
         with cols[0]:  # Кнопка загрузки
-            if st.button("Загрузить", key=f"load_{lesson.id}"):
+            if st.button("Загрузить", key=f"load_{lesson['id']}"):
                 try:
-                    raw = s3_client.get_object(lesson.s3_key)
-                    html = raw.decode("utf-8", errors="replace")
-
-                    st.session_state.generated_lesson = html
-                    st.session_state.current_lesson = {
-                        "content": html,
-                        "prompt": lesson.creation_prompt,
-                        "selected_template": lesson.template.title if lesson.template else None,
-                        "db_id": lesson.id
-                    }
-                    st.session_state.nav_option = "Generate Lesson"
-                    st.rerun()
-                    # Сохраняем загруженный урок в сессии
-                    st.session_state.current_lesson = {
-                        "content": html,
-                        "prompt": lesson.creation_prompt,
-                        "selected_template": lesson.template.title if lesson.template else None,
-                        "db_id": lesson.id
-                    }
-                    st.session_state.nav_option = "Generate Lesson"
-                    st.rerun()
+                    _open_lesson(lesson["id"], lesson["template_title"])
                 except Exception as e:
                     st.sidebar.error(f"Ошибка при загрузке: {e}")
 
         with cols[1]:  # Кнопка удаления
-            if st.button("Удалить", key=f"delete_{lesson.id}"):
-                db2 = SessionLocal()
-                try:
-                    delete_lesson_with_s3(db2, lesson.id)
-                finally:
-                    db2.close()
-                st.sidebar.success(f"Урок \"{lesson.title}\" удалён")
+            if st.button("Удалить", key=f"delete_{lesson['id']}"):
+                with session_scope() as db2:
+                    delete_lesson_with_s3(db2, lesson["id"])
+                invalidate_sidebar_lessons()
+                st.sidebar.success(f"Урок \"{lesson['title']}\" удалён")
                 st.rerun()
 
+    if cached["has_more"]:
+        if st.sidebar.button("Показать ещё", key="sidebar_more"):
+            if query:
+                items, has_more = _load_search_page(user_id, query, offset=len(lessons))
+            else:
+                items, has_more = _load_sidebar_page(user_id, before_id=lessons[-1]["id"])
+            cached["items"] = lessons + items
+            cached["has_more"] = has_more
+            st.rerun()
+
+    render_export("all", "Экспорт всех уроков (ZIP)", export_author_lessons, user_id)
+
+
+def render_profiling_panel():
+    """Переключатель профилирования и сводка последнего перезапуска (только для администраторов)."""
+    if not profiling.can_toggle(st.session_state.user_id):
+        return
+    st.sidebar.toggle("Профилирование перезапусков", key=profiling.PROFILE_TOGGLE_KEY,
+                      value=profiling.PROFILE_RERUNS, disabled=profiling.PROFILE_RERUNS)
+    last = st.session_state.get(profiling.PROFILE_LAST_KEY)
+    if last and profiling.enabled():
+        st.sidebar.caption(f"Последний перезапуск: {last['total_ms']} мс")
+        st.sidebar.json(last, expanded=False)
+
 
 def render_navigation():
     st.markdown(
@@ -133,7 +314,7 @@ def render_navigation():
     )
 
     st.markdown('<div class="nav-header">', unsafe_allow_html=True)
-    col1, col2 = st.columns(2)
+    col1, col2, col3 = st.columns(3)
 
     with col1:
         if st.button("Шаблоны", key="nav_sample"):
@@ -145,6 +326,11 @@ def render_navigation():
             st.session_state.nav_option = "Generate Lesson"
             st.rerun()
 
+    with col3:
+        if st.button("Курсы", key="nav_course"):
+            st.session_state.nav_option = "Generate Course"
+            st.rerun()
+
     st.markdown('</div>', unsafe_allow_html=True)
 
 def render_login_page():
@@ -159,17 +345,17 @@ def render_login_page():
         telegram_id = auth_data.get("id")
         telegram_nick = auth_data.get("username") or auth_data.get("first_name")
 
-        db = SessionLocal()
-        user = get_user_by_nick(db, telegram_nick)
+        with session_scope() as db:
+            user = get_user_by_nick(db, telegram_nick)
 
-        if user:
-            update_user(db, user.id, last_online=datetime.datetime.utcnow())
-            st.success(f"Рады снова вас видеть, {user.telegram_nick}!")
-        else:
-            random_password = str(random.randint(100000, 999999))
-            password_hash = hashlib.sha256(random_password.encode()).hexdigest()
-            user = create_user(db, telegram_nick, telegram_id, password_hash)
-            st.success(f"Выполнен вход как {user.telegram_nick}!")
+            if user:
+                update_user(db, user.id, last_online=datetime.datetime.utcnow())
+                st.success(f"Рады снова вас видеть, {user.telegram_nick}!")
+            else:
+                random_password = str(random.randint(100000, 999999))
+                password_hash = hashlib.sha256(random_password.encode()).hexdigest()
+                user = create_user(db, telegram_nick, telegram_id, password_hash)
+                st.success(f"Выполнен вход как {user.telegram_nick}!")
 
         st.session_state.user_id = user.id
         # 🌟 Save token for persistent login
@@ -1,27 +1,58 @@
+import os
+import threading
+
 import streamlit as st
-import hashlib
-from database.database import SessionLocal
-from database.users_crud import get_user_by_telegram_id
+from cachetools import TTLCache
+
+from database.database import session_scope
+from database.users_crud import make_login_token, get_user, get_user_id_by_login_token
 from utils.cookies import set_login_cookie, get_login_cookie
 PERSISTENT_KEY = "tg_user_token"
 
+# Кэш token -> user_id на уровне процесса, общий для всех сессий Streamlit
+_token_cache = TTLCache(
+    maxsize=int(os.getenv("AUTH_TOKEN_CACHE_SIZE", "10000")),
+    ttl=int(os.getenv("AUTH_TOKEN_CACHE_TTL", "900"))
+)
+_token_cache_lock = threading.Lock()
+
+
 def set_persistent_login_token(telegram_id: int):
-    token = hashlib.sha256(str(telegram_id).encode()).hexdigest()
+    token = make_login_token(telegram_id)
     st.session_state[PERSISTENT_KEY] = token
     set_login_cookie(token)
 
-def get_user_from_token():
+
+def _get_token():
     token = st.session_state.get(PERSISTENT_KEY)
     if not token:
         token = get_login_cookie()
+    return token or None
+
 
+def get_user_id_from_token() -> int | None:
+    token = _get_token()
     if not token:
         return None
 
-    db = SessionLocal()
-    users = db.query(get_user_by_telegram_id.__annotations__['return']).all()
-    for user in users:
-        expected_token = hashlib.sha256(str(user.telegram_id).encode()).hexdigest()
-        if token == expected_token:
-            return user
-    return None
\ No newline at end of file
+    with _token_cache_lock:
+        user_id = _token_cache.get(token)
+    if user_id is not None:
+        return user_id
+
+    with session_scope() as db:
+        user_id = get_user_id_by_login_token(db, token)
+
+    if user_id is not None:
+        with _token_cache_lock:
+            _token_cache[token] = user_id
+    return user_id
+
+
+def get_user_from_token():
+    user_id = get_user_id_from_token()
+    if user_id is None:
+        return None
+
+    with session_scope() as db:
+        return get_user(db, user_id)
@@ -0,0 +1,10 @@
+from bs4 import BeautifulSoup
+
+
+def html_to_text(html: str, limit: int = None) -> str:
+    """Visible text of an HTML document with whitespace collapsed (scripts and styles dropped)."""
+    soup = BeautifulSoup(html, "html.parser")
+    for node in soup(["script", "style", "noscript"]):
+        node.decompose()
+    text = " ".join(soup.get_text(" ").split())
+    return text[:limit] if limit else text
@@ -0,0 +1,58 @@
+import json
+
+
+def iter_sse_data(lines):
+    """
+    Yields the data of each server-sent event from an iterable of lines
+    (without line terminators). Multi-line data is joined with "\\n"; one
+    optional space after "data:" is removed, the rest is kept as sent.
+    """
+    data = None
+    for line in lines:
+        if not line:
+            # Пустая строка завершает событие
+            if data is not None:
+                yield "\n".join(data)
+            data = None
+            continue
+        if line.startswith(":"):
+            continue
+        field, _, value = line.partition(":")
+        if field != "data":
+            continue
+        if value.startswith(" "):
+            value = value[1:]
+        if data is None:
+            data = []
+        data.append(value)
+    if data is not None:
+        yield "\n".join(data)
+
+
+class StreamError(Exception):
+    """The stream reported an error event."""
+
+
+def iter_lesson_fragments(lines):
+    """
+    HTML fragments of a generation stream: each event is JSON
+    ({"delta": ...}, {"lesson": ...} or {"error": ...}) or plain text;
+    "[DONE]" ends the stream.
+    """
+    for data in iter_sse_data(lines):
+        if data == "[DONE]":
+            return
+        try:
+            event = json.loads(data)
+        except ValueError:
+            yield data
+            continue
+        if isinstance(event, dict):
+            if event.get("error"):
+                raise StreamError(event["error"])
+            yield event.get("delta") or event.get("lesson") or ""
+        elif isinstance(event, str):
+            yield event
+        else:
+            # Числа и прочие JSON-значения — текст токена как есть
+            yield data
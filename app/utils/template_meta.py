@@ -0,0 +1,79 @@
+import re
+import html
+import hashlib
+from collections import Counter
+
+from bs4 import BeautifulSoup
+
+PALETTE_SIZE = 6
+MAX_FONTS = 4
+
+_HEX_COLOR = re.compile(r"#(?:[0-9a-fA-F]{6}|[0-9a-fA-F]{3})\b")
+_RGB_COLOR = re.compile(r"rgba?\(\s*(\d{1,3})\s*,\s*(\d{1,3})\s*,\s*(\d{1,3})")
+_FONT_FAMILY = re.compile(r"font-family\s*:\s*([^;}\"]+)", re.IGNORECASE)
+_GENERIC_FONTS = {"serif", "sans-serif", "monospace", "cursive", "fantasy", "system-ui", "inherit", "initial"}
+
+
+def _normalize_hex(color: str) -> str:
+    color = color.lower()
+    if len(color) == 4:
+        color = "#" + "".join(c * 2 for c in color[1:])
+    return color
+
+
+def extract_palette(source: str, limit: int = PALETTE_SIZE) -> list[str]:
+    """Most frequent colors used in the template, as #rrggbb."""
+    colors = Counter(_normalize_hex(c) for c in _HEX_COLOR.findall(source))
+    for r, g, b in _RGB_COLOR.findall(source):
+        colors["#{:02x}{:02x}{:02x}".format(*(min(int(v), 255) for v in (r, g, b)))] += 1
+    return [color for color, _ in colors.most_common(limit)]
+
+
+def extract_fonts(source: str, limit: int = MAX_FONTS) -> list[str]:
+    """Font families in order of frequency (generic families skipped)."""
+    fonts = Counter()
+    for declaration in _FONT_FAMILY.findall(source):
+        for name in declaration.split(","):
+            name = name.strip().strip("'\"").strip()
+            if name and name.lower() not in _GENERIC_FONTS:
+                fonts[name] += 1
+    return [name for name, _ in fonts.most_common(limit)]
+
+
+def _heading(soup: BeautifulSoup) -> str:
+    for tag in ("h1", "h2", "title"):
+        node = soup.find(tag)
+        if node and node.get_text(strip=True):
+            return node.get_text(" ", strip=True)[:80]
+    return ""
+
+
+def render_preview_snippet(heading: str, palette: list[str], fonts: list[str]) -> str:
+    """Small self-contained HTML card: heading in the template font plus color swatches."""
+    font = html.escape(fonts[0]) if fonts else "inherit"
+    swatches = "".join(
+        f'<span style="display:inline-block;width:18px;height:18px;border-radius:4px;'
+        f'margin-right:4px;border:1px solid #ddd;background:{color}"></span>'
+        for color in palette
+    )
+    return (
+        f'<div style="font-family:\'{font}\';padding:6px 0">'
+        f'<div style="font-size:15px;margin-bottom:4px">{html.escape(heading or "Aa Бб")}</div>'
+        f'<div>{swatches}</div>'
+        f'</div>'
+    )
+
+
+def template_metadata(source: str) -> dict:
+    """Metadata stored with a template so the picker needs no S3 round-trip."""
+    body = source.encode("utf-8")
+    palette = extract_palette(source)
+    fonts = extract_fonts(source)
+    heading = _heading(BeautifulSoup(source, "html.parser"))
+    return {
+        "size": len(body),
+        "content_hash": hashlib.sha256(body).hexdigest(),
+        "palette": palette,
+        "fonts": fonts,
+        "preview_snippet": render_preview_snippet(heading, palette, fonts),
+    }